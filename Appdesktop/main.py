@@ -6,8 +6,10 @@ import sys
 import os
 import logging
 import subprocess
+import threading
 import atexit
 from datetime import datetime
+from typing import Optional
 
 # Ensure correct path
 if getattr(sys, 'frozen', False):
@@ -16,7 +18,7 @@ else:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 os.chdir(BASE_DIR)
 
-from PySide6.QtWidgets import QApplication, QMainWindow, QInputDialog, QMessageBox
+from PySide6.QtWidgets import QApplication, QMainWindow, QInputDialog, QMessageBox, QFileDialog, QProgressDialog
 from PySide6.QtCore import Slot, QTimer
 
 # ==================== MQTT BROKER ====================
@@ -65,14 +67,17 @@ def stop_mosquitto():
             mosquitto_process.kill()
         mosquitto_process = None
 
-from src.database import init_database
+from src.database import init_database, close_connections, PAYMENT_CASH, PAYMENT_TRANSFER, PAYMENT_FREE
 from src.mqtt_client import MQTTClient
 from src.parking_service import ParkingService
 from src.mdns_service import get_mdns_service
 from ui.dashboard_widget import DashboardWidget
 from ui.card_manager import CardManagerDialog
+from ui.export_worker import SessionExportWorker
 from ui.qr_payment_widget import QRPaymentWidget
 from payment.sepay_helper import create_payment
+from src.timeutil import month_range
+from src.config import ARCHIVE_CONFIG, BACKUP_CONFIG
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -94,12 +99,24 @@ class MainWindow(QMainWindow):
         self.qr_widget = None
         self.pending_exit = None
         self.card_register_mode = False  # Chế độ đăng ký thẻ
+        self.export_worker = None
         
         # ESP32 heartbeat timeout (15 giây không nhận được = offline)
         self.esp32_timeout = QTimer(self)
         self.esp32_timeout.timeout.connect(self._on_esp32_timeout)
         self.esp32_timeout.setInterval(15000)  # 15 giây
         
+        # Job lưu trữ phiên cũ: chạy nền một lần sau khởi động, sau đó theo chu kỳ
+        self.archive_timer = QTimer(self)
+        self.archive_timer.timeout.connect(self._run_archive)
+        self.archive_timer.start(ARCHIVE_CONFIG["interval_hours"] * 3600 * 1000)
+        QTimer.singleShot(60_000, self._run_archive)
+        
+        # Backup online định kỳ (không chặn luồng vào/ra)
+        self.backup_timer = QTimer(self)
+        self.backup_timer.timeout.connect(self._run_backup)
+        self.backup_timer.start(BACKUP_CONFIG["interval_hours"] * 3600 * 1000)
+        
         self.setCentralWidget(self.dashboard)
         
         self._connect_signals()
@@ -110,11 +127,11 @@ class MainWindow(QMainWindow):
         # MQTT
         self.mqtt_client.connected.connect(lambda: self.dashboard.set_mqtt_connected(True))
         self.mqtt_client.disconnected.connect(lambda: self.dashboard.set_mqtt_connected(False))
-        self.mqtt_client.entry_card_detected.connect(self._on_entry_card)
-        self.mqtt_client.exit_card_detected.connect(self._on_exit_card)
+        self.mqtt_client.entry_scan.connect(self._on_entry_card)
+        self.mqtt_client.exit_scan.connect(self._on_exit_card)
         self.mqtt_client.esp32_heartbeat.connect(self._on_esp32_heartbeat)
-        self.mqtt_client.slot_status_updated.connect(self._on_slot_status)
-        self.mqtt_client.slot_changed.connect(self._on_slot_change)
+        self.mqtt_client.slot_state_changed.connect(self._on_slot_state)
+        self.mqtt_client.commands.command_rejected.connect(self._on_command_rejected)
         
         # Parking
         self.parking_service.entry_success.connect(self._on_entry_success)
@@ -122,63 +139,82 @@ class MainWindow(QMainWindow):
         self.parking_service.exit_ready.connect(self._on_exit_ready)
         self.parking_service.exit_success.connect(self._on_exit_success)
         self.parking_service.exit_failed.connect(self._on_exit_failed)
+        self.parking_service.write_failed.connect(self._on_write_failed)
+        # Doanh thu đọc từ SQLite: làm mới khi lượt ra đã commit, không chờ writer trên thread UI
+        self.parking_service.exit_persisted.connect(self._refresh_revenue)
         # Không dùng slot_updated từ database nữa - lấy từ cảm biến ESP32
         
         # Buttons
         self.dashboard.btn_payment.clicked.connect(self._show_payment_dialog)
         self.dashboard.btn_cards.clicked.connect(self._show_card_manager)
+        self.dashboard.btn_export.clicked.connect(self._export_sessions)
         self.dashboard.btn_manual_entry.clicked.connect(self._manual_entry)
         self.dashboard.btn_manual_exit.clicked.connect(self._manual_exit)
         self.dashboard.btn_reset.clicked.connect(self._reset_database)
+        self.dashboard.history_page_requested.connect(self._on_history_page_requested)
+        self.dashboard.history_archive_toggled.connect(self._reload_history)
     
     def _init_data(self):
         init_database()
+        # Lệnh barrier/LCD chưa được ESP32 xác nhận từ lần chạy trước (còn hạn thì gửi tiếp)
+        self.mqtt_client.commands.restore()
         # Chỉ load doanh thu và lịch sử - slot stats lấy từ cảm biến ESP32
+        self.dashboard.set_slot_layout(self.parking_service.get_slot_layout())
         self.dashboard.update_revenue(self.parking_service.get_today_revenue())
-        self.dashboard.load_history(self.parking_service.get_recent_history(20))
+        self.dashboard.load_history(*self.parking_service.get_history_page())
     
-    @Slot(str)
-    def _on_entry_card(self, card_id: str):
+    @Slot()
+    def _refresh_revenue(self):
+        # Query doanh thu chạy lúc áp dụng: nhiều lượt ra trong một frame chỉ query một lần
+        self.dashboard.updates.post(
+            "revenue", lambda: self.dashboard.update_revenue(self.parking_service.get_today_revenue())
+        )
+    
+    @Slot(object)
+    def _on_history_page_requested(self, cursor):
+        self.dashboard.append_history_page(*self.parking_service.get_history_page(
+            cursor, include_archive=self.dashboard.chk_archive.isChecked()))
+    
+    @Slot(bool)
+    def _reload_history(self, include_archive: bool):
+        self.dashboard.load_history(*self.parking_service.get_history_page(include_archive=include_archive))
+    
+    @Slot(str, str)
+    def _on_entry_card(self, card_id: str, scan_id: str):
         # Bỏ qua nếu đang ở chế độ đăng ký thẻ
         if self.card_register_mode:
             return
-        success, msg = self.parking_service.process_entry(card_id)
+        success, msg = self.parking_service.process_entry(card_id, scan_id or None)
         if success:
             self.mqtt_client.open_entry_barrier()
     
-    @Slot(str)
-    def _on_exit_card(self, card_id: str):
+    @Slot(str, str)
+    def _on_exit_card(self, card_id: str, scan_id: str):
         # Bỏ qua nếu đang ở chế độ đăng ký thẻ
         if self.card_register_mode:
             return
-        self.parking_service.process_exit(card_id)
+        self.parking_service.process_exit(card_id, scan_id or None)
     
     @Slot(dict)
     def _on_esp32_heartbeat(self, data: dict):
         """Nhận heartbeat từ ESP32"""
-        logger.info(f"[HEARTBEAT] Received: {data}")
+        logger.debug(f"[HEARTBEAT] Received: {data}")
         data["online"] = True
-        self.dashboard.set_esp32_status(data)
+        self.dashboard.updates.post("esp32", self.dashboard.set_esp32_status, data)
         # Reset timeout timer
         self.esp32_timeout.start()
     
     def _on_esp32_timeout(self):
         """ESP32 không gửi heartbeat trong 15 giây"""
         logger.warning("[HEARTBEAT] Timeout - ESP32 offline")
-        self.dashboard.set_esp32_offline()
+        self.dashboard.updates.post("esp32", self.dashboard.set_esp32_offline)
         self.esp32_timeout.stop()
     
-    @Slot(dict)
-    def _on_slot_status(self, data: dict):
-        """Nhận trạng thái tất cả slot từ ESP32"""
-        logger.info(f"[SLOT STATUS] {data}")
-        self.dashboard.update_all_slots(data)
-    
-    @Slot(int, bool)
-    def _on_slot_change(self, slot: int, occupied: bool):
-        """Nhận thông báo slot thay đổi từ ESP32"""
-        logger.info(f"[SLOT CHANGE] Slot {slot}: {'Occupied' if occupied else 'Available'}")
-        self.dashboard.update_slot(slot, occupied)
+    @Slot()
+    def _on_slot_state(self):
+        """Slot từ ESP32 đã đổi (snapshot/delta đã áp dụng vào mqtt_client.slot_state)"""
+        # Slot đổi được gom trong SlotState: mỗi frame lấy ra và vẽ một lần
+        self.dashboard.updates.post("slots", self.dashboard.apply_slot_state, self.mqtt_client.slot_state)
     
     @Slot(dict)
     def _on_entry_success(self, data: dict):
@@ -206,20 +242,31 @@ class MainWindow(QMainWindow):
         # Gửi thông báo lỗi lên LCD
         self.mqtt_client.send_lcd_error(msg[:20])
     
+    @Slot(str)
+    def _on_write_failed(self, msg: str):
+        logger.error(f"[DB WRITE FAILED] {msg}")
+        QMessageBox.critical(self, "Lỗi database", msg)
+    
+    @Slot(str, str)
+    def _on_command_rejected(self, cmd_id: str, topic: str):
+        logger.error(f"[CMD REJECTED] {topic} {cmd_id}")
+        QMessageBox.warning(self, "ESP32", f"ESP32 từ chối lệnh {topic} ({cmd_id})")
+    
     @Slot(dict)
     def _on_exit_ready(self, data: dict):
         session = data["session"]
         fee_info = data["fee_info"]
         
         self.pending_exit = {
-            "session_id": session["id"],
-            "card_id": session["card_id"],
-            "plate_number": session["plate_number"],
-            "fee": fee_info["fee"]
+            "session_id": session.id,
+            "card_id": session.card_id,
+            "plate_number": session.plate_number,
+            "fee": fee_info["fee"],
+            "idempotency_key": data.get("idempotency_key")
         }
         
         # Hiển thị dialog chọn phương thức thanh toán
-        self._show_payment_choice_dialog(fee_info["fee"], session["plate_number"])
+        self._show_payment_choice_dialog(fee_info["fee"], session.plate_number)
     
     def _show_payment_choice_dialog(self, fee: int, plate_number: str):
         """Hiển thị dialog chọn thanh toán tiền mặt hoặc online"""
@@ -266,21 +313,29 @@ class MainWindow(QMainWindow):
             QPushButton:hover{background:#4b5563;}
         """)
         
+        chosen = False
+        
         def pay_cash():
+            nonlocal chosen
+            chosen = True
             dialog.close()
             self._complete_exit_cash(fee)
         
         def pay_online():
+            nonlocal chosen
+            chosen = True
             dialog.close()
             self._show_payment(fee, plate_number)
         
-        def cancel():
-            dialog.close()
-            self.pending_exit = None
+        def on_finished():
+            # Huy, nút X, Esc: đều đóng dialog mà không chọn cách thanh toán
+            if not chosen:
+                self._cancel_pending_exit()
         
         btn_cash.clicked.connect(pay_cash)
         btn_online.clicked.connect(pay_online)
-        btn_cancel.clicked.connect(cancel)
+        btn_cancel.clicked.connect(dialog.reject)
+        dialog.finished.connect(on_finished)
         
         # Layout buttons
         btn_layout = QHBoxLayout()
@@ -305,7 +360,10 @@ class MainWindow(QMainWindow):
         if self.pending_exit:
             card_id = self.pending_exit.get("card_id", "N/A")
             plate = self.pending_exit.get("plate_number", "N/A")
-            self.parking_service.complete_exit(self.pending_exit["session_id"], fee)
+            self.parking_service.complete_exit(
+                self.pending_exit["session_id"], fee, self.pending_exit["idempotency_key"],
+                payment_method=PAYMENT_CASH
+            )
             self.mqtt_client.open_exit_barrier()
             
             # Gửi thông báo hiển thị lên LCD
@@ -316,7 +374,6 @@ class MainWindow(QMainWindow):
                 datetime.now().strftime("%H:%M:%S"), "RA",
                 card_id, plate, "-", f"{fee:,} (TM)"
             )
-            self.dashboard.update_revenue(self.parking_service.get_today_revenue())
             logger.info(f"[EXIT CASH] Card {card_id} paid {fee} VND cash")
             self.pending_exit = None
     
@@ -324,7 +381,10 @@ class MainWindow(QMainWindow):
         if self.pending_exit:
             card_id = self.pending_exit.get("card_id", "N/A")
             plate = self.pending_exit.get("plate_number", "N/A")
-            self.parking_service.complete_exit(self.pending_exit["session_id"], 0)
+            self.parking_service.complete_exit(
+                self.pending_exit["session_id"], 0, self.pending_exit["idempotency_key"],
+                payment_method=PAYMENT_FREE
+            )
             self.mqtt_client.open_exit_barrier()
             
             # Thêm vào history
@@ -341,6 +401,7 @@ class MainWindow(QMainWindow):
         
         if not payment_data.get("success"):
             QMessageBox.critical(self, "Lỗi", "Không thể tạo QR thanh toán")
+            self._cancel_pending_exit()
             return
         
         payment_data["plate_number"] = plate_number
@@ -358,7 +419,10 @@ class MainWindow(QMainWindow):
             fee = self.pending_exit["fee"]
             card_id = self.pending_exit.get("card_id", "N/A")
             plate = self.pending_exit.get("plate_number", "N/A")
-            self.parking_service.complete_exit(self.pending_exit["session_id"], fee)
+            self.parking_service.complete_exit(
+                self.pending_exit["session_id"], fee, self.pending_exit["idempotency_key"],
+                payment_method=PAYMENT_TRANSFER
+            )
             self.mqtt_client.open_exit_barrier()
             
             # Gửi thông báo hiển thị lên LCD
@@ -368,12 +432,16 @@ class MainWindow(QMainWindow):
                 datetime.now().strftime("%H:%M:%S"), "RA",
                 card_id, plate, "-", f"{fee:,} (CK)"
             )
-            self.dashboard.update_revenue(self.parking_service.get_today_revenue())
             logger.info(f"[EXIT ONLINE] Card {card_id} paid {fee} VND online")
             self.pending_exit = None
     
     @Slot()
     def _on_payment_cancelled(self):
+        self._cancel_pending_exit()
+    
+    def _cancel_pending_exit(self):
+        if self.pending_exit:
+            self.parking_service.cancel_exit(self.pending_exit["session_id"])
         self.pending_exit = None
     
     @Slot(dict)
@@ -386,6 +454,50 @@ class MainWindow(QMainWindow):
         dialog.exec()
         self.card_register_mode = False
     
+    def _run_archive(self):
+        threading.Thread(target=self.parking_service.archive_old_sessions, name="archive", daemon=True).start()
+    
+    def _run_backup(self):
+        threading.Thread(target=self.parking_service.backup_database, name="backup", daemon=True).start()
+    
+    def _export_sessions(self):
+        """Xuất phiên một tháng cho kế toán (chạy nền, dashboard vẫn cập nhật)"""
+        if self.export_worker is not None and self.export_worker.isRunning():
+            QMessageBox.information(self, "Xuất báo cáo", "Đang xuất báo cáo, vui lòng chờ.")
+            return
+        month, ok = QInputDialog.getText(self, "Xuất báo cáo", "Tháng (YYYY-MM):",
+                                         text=datetime.now().strftime("%Y-%m"))
+        if not ok:
+            return
+        try:
+            year, mon = map(int, month.strip().split("-"))
+            start, end = month_range(year, mon)
+        except ValueError:
+            QMessageBox.warning(self, "Lỗi", f"Tháng không hợp lệ: {month}")
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Xuất báo cáo", f"sessions_{year}-{mon:02d}.csv.gz", "CSV nén (*.csv.gz);;CSV (*.csv)"
+        )
+        if not path:
+            return
+        
+        progress = QProgressDialog("Đang xuất báo cáo...", "Hủy", 0, 0, self)
+        progress.setMinimumDuration(300)
+        worker = SessionExportWorker(path, start, end, self)
+        worker.progress.connect(lambda done, total: (progress.setMaximum(total), progress.setValue(done)))
+        progress.canceled.connect(worker.requestInterruption)
+        worker.done.connect(lambda count: QMessageBox.information(
+            self, "Xuất báo cáo", f"Đã xuất {count} phiên ra {path}"))
+        worker.failed.connect(lambda error: QMessageBox.warning(self, "Lỗi", f"Xuất báo cáo thất bại: {error}"))
+        worker.finished.connect(progress.close)
+        worker.finished.connect(self._on_export_finished)
+        self.export_worker = worker
+        worker.start()
+    
+    def _on_export_finished(self):
+        self.export_worker.deleteLater()
+        self.export_worker = None
+    
     def _show_payment_dialog(self):
         """Mở dialog thanh toán online"""
         from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton
@@ -438,20 +550,45 @@ class MainWindow(QMainWindow):
         
         dialog.exec()
     
+    def _pick_match(self, title: str, matches: list, label) -> Optional[object]:
+        """Một kết quả -> dùng luôn; nhiều kết quả -> cho chọn"""
+        if len(matches) == 1:
+            return matches[0]
+        labels = [label(m) for m in matches]
+        choice, ok = QInputDialog.getItem(self, title, "Chọn:", labels, 0, False)
+        return matches[labels.index(choice)] if ok else None
+    
     def _manual_entry(self):
-        card_id, ok = QInputDialog.getText(self, "Xe vào", "Nhập mã thẻ:")
-        if ok and card_id:
-            success, msg = self.parking_service.process_entry(card_id.strip())
-            if success:
-                self.mqtt_client.open_entry_barrier()
-                QMessageBox.information(self, "Thành công", msg)
-            else:
-                QMessageBox.warning(self, "Lỗi", msg)
+        text, ok = QInputDialog.getText(self, "Xe vào", "Nhập mã thẻ / biển số / tên chủ thẻ:")
+        if not ok or not text.strip():
+            return
+        matches = self.parking_service.search_cards(text)
+        if not matches:
+            QMessageBox.warning(self, "Lỗi", f"Không tìm thấy thẻ: {text.strip()}")
+            return
+        card = self._pick_match("Xe vào", matches,
+                                lambda c: f"{c.card_id}  |  {c.plate_number or '-'}  |  {c.owner_name or '-'}")
+        if card is None:
+            return
+        success, msg = self.parking_service.process_entry(card.card_id)
+        if success:
+            self.mqtt_client.open_entry_barrier()
+            QMessageBox.information(self, "Thành công", msg)
+        else:
+            QMessageBox.warning(self, "Lỗi", msg)
     
     def _manual_exit(self):
-        card_id, ok = QInputDialog.getText(self, "Xe ra", "Nhập mã thẻ:")
-        if ok and card_id:
-            self.parking_service.process_exit(card_id.strip())
+        text, ok = QInputDialog.getText(self, "Xe ra", "Nhập mã thẻ / biển số:")
+        if not ok or not text.strip():
+            return
+        matches = self.parking_service.search_parked(text)
+        if not matches:
+            QMessageBox.warning(self, "Lỗi", f"Không có xe nào trong bãi khớp: {text.strip()}")
+            return
+        session = self._pick_match("Xe ra", matches,
+                                   lambda s: f"{s.card_id}  |  {s.plate_number or '-'}  |  Slot {s.slot_number}")
+        if session is not None:
+            self.parking_service.process_exit(session.card_id)
     
     def _reset_database(self):
         """Reset toàn bộ dữ liệu"""
@@ -465,16 +602,19 @@ class MainWindow(QMainWindow):
             from src.config import DATABASE_PATH
             import os
             
-            # Xóa file database
+            # Xóa file database (đóng kết nối trước, kèm file WAL/SHM)
             try:
-                if os.path.exists(DATABASE_PATH):
-                    os.remove(DATABASE_PATH)
+                db.close_connections()
+                archives = [db.archive_path(month) for month in db.archive_months()]
+                for path in (DATABASE_PATH, DATABASE_PATH + "-wal", DATABASE_PATH + "-shm", *archives):
+                    if os.path.exists(path):
+                        os.remove(path)
                 
                 # Khởi tạo lại database
                 db.init_database()
                 
                 # Cập nhật UI
-                self.dashboard.table_history.setRowCount(0)
+                self.dashboard.load_history([])
                 self.dashboard.update_revenue(0)
                 
                 QMessageBox.information(self, "Thành công", "Đã reset toàn bộ dữ liệu!")
@@ -482,7 +622,13 @@ class MainWindow(QMainWindow):
                 QMessageBox.critical(self, "Lỗi", f"Không thể reset: {e}")
     
     def closeEvent(self, event):
+        logger.info(f"[UI] Dashboard updates: {self.dashboard.updates.stats()}")
+        logger.info(f"[MQTT] Commands: {self.mqtt_client.commands.stats()}")
+        if self.export_worker is not None and self.export_worker.isRunning():
+            self.export_worker.requestInterruption()
+            self.export_worker.wait()
         self.mqtt_client.disconnect()
+        close_connections()
         super().closeEvent(event)
 
 
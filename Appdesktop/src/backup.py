@@ -0,0 +1,141 @@
+"""
+Backup - Snapshot online của parking.db (SQLite backup API), xoay vòng, kiểm tra, khôi phục
+
+Snapshot chạy trên kết nối đọc riêng và không bao giờ lấy _write_lock của database.py:
+luồng vào/ra vẫn commit bình thường trong lúc backup.
+"""
+
+import os
+import re
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+from src import database as db
+from src.config import BACKUP_CONFIG, DATABASE_PATH
+from src.timeutil import to_ms
+
+_NAME_RE = re.compile(r"parking_(\d{8}_\d{6})(?:_[\w-]+)?\.db")
+_STAMP_FMT = "%Y%m%d_%H%M%S"
+
+
+def _snapshot_time_ms(name: str) -> Optional[int]:
+    match = _NAME_RE.fullmatch(name)
+    if not match:
+        return None
+    return int(time.mktime(time.strptime(match.group(1), _STAMP_FMT)) * 1000)
+
+
+def list_backups(directory: Optional[str] = None) -> List[Tuple[str, int]]:
+    """Các snapshot (path, thời điểm epoch ms), cũ nhất trước"""
+    directory = directory or BACKUP_CONFIG["dir"]
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    backups = [(os.path.join(directory, n), _snapshot_time_ms(n)) for n in names]
+    return sorted(((p, t) for p, t in backups if t is not None), key=lambda b: b[1])
+
+
+def verify_backup(path: str, full: bool = True) -> List[str]:
+    """PRAGMA integrity_check (hoặc quick_check); [] nếu file hợp lệ"""
+    conn = sqlite3.connect(f"file:{path.replace(os.sep, '/')}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check").fetchall()
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        conn.close()
+    problems = [r[0] for r in rows]
+    return [] if problems == ["ok"] else problems
+
+
+def create_backup(directory: Optional[str] = None, label: Optional[str] = None) -> str:
+    """
+    Chép parking.db sang backups/parking_<thời điểm>.db theo từng bước `pages_per_step` page.
+
+    Kết nối nguồn giữ một read transaction suốt quá trình: trong WAL đó là một snapshot
+    cố định, writer không bị chặn và backup không phải chạy lại từ đầu mỗi khi có commit.
+    File chỉ mang tên cuối cùng sau khi qua integrity_check.
+    """
+    directory = directory or BACKUP_CONFIG["dir"]
+    os.makedirs(directory, exist_ok=True)
+    name = f"parking_{time.strftime(_STAMP_FMT)}" + (f"_{label}" if label else "") + ".db"
+    path = os.path.join(directory, name)
+    partial = path + ".part"
+
+    started = time.perf_counter()
+    source = sqlite3.connect(DATABASE_PATH, isolation_level=None)
+    target = sqlite3.connect(partial)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=BACKUP_CONFIG["pages_per_step"],
+                      sleep=BACKUP_CONFIG["step_sleep_ms"] / 1000)
+        source.execute("COMMIT")
+    except BaseException:
+        target.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    target.close()
+
+    problems = verify_backup(partial)
+    if problems:
+        os.remove(partial)
+        raise sqlite3.DatabaseError(f"Backup failed integrity check: {problems[:5]}")
+    os.replace(partial, path)
+    print(f"[Backup] {path} ({os.path.getsize(path) // 1024} KB, {time.perf_counter() - started:.2f}s)")
+    prune_backups(directory)
+    return path
+
+
+def prune_backups(directory: Optional[str] = None, keep: Optional[int] = None) -> List[str]:
+    """Xóa snapshot cũ, giữ `keep` bản mới nhất; trả về các file đã xóa"""
+    keep = BACKUP_CONFIG["keep"] if keep is None else keep
+    backups = list_backups(directory)
+    removed = [p for p, _ in backups[:max(0, len(backups) - keep)]]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def find_backup_at(when_ms: int, directory: Optional[str] = None) -> Optional[str]:
+    """Snapshot mới nhất chụp trước hoặc đúng thời điểm `when_ms`"""
+    candidates = [p for p, t in list_backups(directory) if t <= when_ms]
+    return candidates[-1] if candidates else None
+
+
+def restore_backup(path: str) -> Optional[str]:
+    """
+    Thay parking.db bằng snapshot `path` (sau khi kiểm tra). Trạng thái hiện tại được
+    chụp lại trước (nhãn pre-restore) để có thể quay lại. Trả về path của bản chụp đó.
+
+    Đóng mọi kết nối của database.py rồi khởi tạo lại (index phiên mở, slot, cache).
+    """
+    problems = verify_backup(path)
+    if problems:
+        raise sqlite3.DatabaseError(f"Snapshot failed integrity check: {problems[:5]}")
+    safety = create_backup(label="pre-restore") if os.path.exists(DATABASE_PATH) else None
+
+    db.close_connections()
+    source = sqlite3.connect(f"file:{path.replace(os.sep, '/')}?mode=ro", uri=True)
+    target = sqlite3.connect(DATABASE_PATH)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    db.init_database()
+    print(f"[Backup] Restored {path}")
+    return safety
+
+
+def restore_at(when) -> Tuple[str, Optional[str]]:
+    """Khôi phục về snapshot gần nhất trước thời điểm `when` (datetime hoặc epoch ms)"""
+    when_ms = when if isinstance(when, int) else to_ms(when)
+    path = find_backup_at(when_ms)
+    if path is None:
+        raise FileNotFoundError("No backup taken before the requested time")
+    return path, restore_backup(path)
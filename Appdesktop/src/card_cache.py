@@ -0,0 +1,104 @@
+"""
+Card Cache - LRU cache cho tra cứu thẻ RFID (kèm negative cache cho thẻ lạ)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from src.models import Card
+
+# Giá trị trả về của CardCache.get() khi key không có trong cache
+MISS = object()
+
+
+class CardCache:
+    """
+    LRU + TTL cho get_card.
+
+    - Thẻ đã đăng ký: tối đa `max_size` mục, hết hạn sau `ttl_seconds`.
+    - Thẻ không tồn tại: lưu riêng (negative cache) với TTL ngắn hơn, để thẻ lạ
+      quét liên tục từ đầu đọc bên cạnh không tốn query mỗi lần.
+    Card là bất biến nên lưu/trả thẳng object, không copy.
+    """
+
+    def __init__(self, max_size: int = 5000, ttl_seconds: float = 300,
+                 negative_max_size: int = 1000, negative_ttl_seconds: float = 30):
+        self._lock = threading.Lock()
+        self._cards: "OrderedDict[str, Tuple[float, Card]]" = OrderedDict()
+        self._unknown: "OrderedDict[str, float]" = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.negative_max_size = negative_max_size
+        self.negative_ttl = negative_ttl_seconds
+        self._version = 0  # Tăng mỗi lần invalidate, chặn put() dữ liệu đọc trước đó
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, card_id: str):
+        """Trả về Card, None (thẻ đã biết là không tồn tại) hoặc MISS"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cards.get(card_id)
+            if entry is not None:
+                expires, card = entry
+                if expires > now:
+                    self._cards.move_to_end(card_id)
+                    self.hits += 1
+                    return card
+                del self._cards[card_id]
+
+            expires = self._unknown.get(card_id)
+            if expires is not None:
+                if expires > now:
+                    self.negative_hits += 1
+                    return None
+                del self._unknown[card_id]
+
+            self.misses += 1
+            return MISS
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def put(self, card_id: str, card: Optional[Card], version: Optional[int] = None):
+        """Lưu kết quả query; bỏ qua nếu đã có invalidate kể từ `version`"""
+        now = time.monotonic()
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if card is None:
+                self._unknown[card_id] = now + self.negative_ttl
+                self._unknown.move_to_end(card_id)
+                while len(self._unknown) > self.negative_max_size:
+                    self._unknown.popitem(last=False)
+            else:
+                self._unknown.pop(card_id, None)
+                self._cards[card_id] = (now + self.ttl, card)
+                self._cards.move_to_end(card_id)
+                while len(self._cards) > self.max_size:
+                    self._cards.popitem(last=False)
+
+    def invalidate(self, card_id: str):
+        with self._lock:
+            self._cards.pop(card_id, None)
+            self._unknown.pop(card_id, None)
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+            self._unknown.clear()
+            self._version += 1
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._cards),
+            "unknown": len(self._unknown),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,101 @@
+"""
+Card I/O - Đọc/ghi danh sách thẻ dạng CSV, JSON, JSON Lines (đọc/ghi dần, không nạp cả file)
+"""
+
+import csv
+import json
+from typing import IO, Iterable, Iterator
+
+from src.database import CARD_FIELDS
+from src.models import Card
+
+_CHUNK = 64 * 1024
+
+
+def detect_format(path: str) -> str:
+    """"csv" | "json" | "jsonl" theo đuôi file"""
+    lower = path.lower()
+    if lower.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if lower.endswith(".json"):
+        return "json"
+    return "csv"
+
+
+# === Đọc ===
+
+def read_records(f: IO[str], fmt: str) -> Iterator[dict]:
+    """Từng bản ghi thẻ (dict) trong file đã mở ở chế độ text"""
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    elif fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == "json":
+        yield from _iter_json_array(f)
+    else:
+        raise ValueError(f"Unknown card file format: {fmt}")
+
+
+def _iter_json_array(f: IO[str]) -> Iterator[dict]:
+    """Phần tử của mảng JSON top-level, giải mã từng phần tử khi đọc từng khối"""
+    decoder = json.JSONDecoder()
+    buffer, pos, started = "", 0, False
+    eof = False
+    while True:
+        # Bỏ khoảng trắng / dấu phân cách giữa các phần tử
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if not started and pos < len(buffer):
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array of cards")
+            started, pos = True, pos + 1
+            continue
+        if started and pos < len(buffer) and buffer[pos] == "]":
+            return
+        if pos < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # Số ở cuối khối có thể bị cắt -> chỉ nhận khi còn ký tự phía sau
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    continue
+        if eof:
+            raise ValueError("Unexpected end of JSON array")
+        chunk = f.read(_CHUNK)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+# === Ghi ===
+
+def write_cards(f: IO[str], cards: Iterable[Card], fmt: str) -> int:
+    """Ghi thẻ vào file đã mở (text, newline="" với CSV); trả về số thẻ đã ghi"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(CARD_FIELDS)
+        for card in cards:
+            writer.writerow([getattr(card, name) for name in CARD_FIELDS])
+            count += 1
+    elif fmt in ("json", "jsonl"):
+        if fmt == "json":
+            f.write("[")
+        for card in cards:
+            record = json.dumps({name: getattr(card, name) for name in CARD_FIELDS}, ensure_ascii=False)
+            if fmt == "json":
+                f.write(("," if count else "") + "\n  " + record)
+            else:
+                f.write(record + "\n")
+            count += 1
+        if fmt == "json":
+            f.write("\n]\n")
+    else:
+        raise ValueError(f"Unknown card file format: {fmt}")
+    return count
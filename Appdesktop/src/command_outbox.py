@@ -0,0 +1,206 @@
+"""
+Command Outbox - Lệnh App -> ESP32 (barrier, LCD) lưu bền, gửi lại tới khi ESP32 ack
+"""
+
+import json
+import logging
+import statistics
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+from src import database as db
+from src.config import COMMAND_CONFIG
+from src.models import Command
+from src.timeutil import now_ms
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    __slots__ = ("command", "payload", "attempts", "first_sent", "next_at", "delay")
+
+    def __init__(self, command: Command, payload: dict):
+        self.command = command
+        self.payload = payload
+        self.attempts = command.attempts
+        self.first_sent: Optional[float] = None   # monotonic, lần gửi đầu trong phiên app này
+        self.next_at = 0.0
+        self.delay = COMMAND_CONFIG["ack_timeout_ms"] / 1000
+
+
+class CommandOutbox(QObject):
+    """
+    Mỗi lệnh mang `cmd_id`; ESP32 thực hiện rồi publish ack {cmd_id}. Lệnh gửi lại
+    (cùng cmd_id) chỉ được ack lại, không thực hiện lần hai.
+
+    - send(): xếp hàng lưu SQLite (DBWriter) rồi gửi QoS 1 ngay, không chờ fsync.
+    - Chưa có ack sau ack_timeout_ms thì gửi lại, giãn gấp đôi tới retry_max_ms;
+      đang offline thì thử lại ở tick kế tiếp, khi transport online.
+    - Hết hạn (ttl theo loại lệnh) mà chưa ack -> expired: bỏ, không mở barrier
+      hay hiện LCD muộn.
+    - ESP32 chưa báo hỗ trợ ack trong heartbeat (firmware cũ): gửi đúng một lần.
+    - RTT (lần gửi đầu -> ack) của các lệnh gần nhất có trong stats().
+
+    send() và timer chạy trên thread chính; ack() đến từ network thread. Trạng thái
+    lần gửi (attempts, first_sent, next_at) chỉ đổi khi giữ _lock.
+    """
+    
+    command_rejected = Signal(str, str)     # cmd_id, topic - ESP32 ack ok=false
+
+    def __init__(self, publish: Callable[[str, dict], bool], parent=None):
+        super().__init__(parent)
+        self._publish = publish     # (topic, payload) -> True nếu đã gửi tới broker
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _Pending] = {}
+        self._rtts = deque(maxlen=COMMAND_CONFIG["rtt_window"])
+        self.acks_supported = False
+        self._timer = QTimer(self)
+        self._timer.setInterval(COMMAND_CONFIG["tick_ms"])
+        self._timer.timeout.connect(self._tick)
+        self.sent = 0
+        self.acked = 0
+        self.rejected = 0
+        self.retries = 0
+        self.expired = 0
+
+    def send(self, topic: str, payload: dict, ttl_ms: int) -> str:
+        """Gửi lệnh; trả về cmd_id"""
+        cmd_id = uuid.uuid4().hex[:12]
+        payload = dict(payload, cmd_id=cmd_id)
+        created_at = now_ms()
+        command = Command(cmd_id, topic, json.dumps(payload), created_at, created_at + ttl_ms)
+        entry = _Pending(command, payload)
+        with self._lock:
+            self._pending[cmd_id] = entry
+        # Xếp hàng INSERT trước lần gửi đầu: cập nhật trạng thái sau đó luôn đứng sau nó
+        db.submit_command(command).add_done_callback(self._on_write_done)
+        self._attempt(entry, time.monotonic())
+        self._ensure_timer()
+        return cmd_id
+
+    def restore(self):
+        """Nạp lệnh còn hạn chưa ack từ lần chạy trước (gọi sau init_database)"""
+        db.prune_commands(COMMAND_CONFIG["keep_days"])
+        commands = db.get_pending_commands()
+        with self._lock:
+            for command in commands:
+                self._pending.setdefault(command.cmd_id, _Pending(command, json.loads(command.payload)))
+        if commands:
+            logger.info(f"[CMD] Restored {len(commands)} pending commands")
+            self._ensure_timer()
+
+    def ack(self, cmd_id: str, ok: bool = True):
+        """
+        ESP32 đã nhận lệnh (network thread). ok=False: nhận nhưng không thực hiện ->
+        rejected, không tính vào RTT, báo command_rejected. Ack trùng/ack lệnh lạ bị bỏ qua
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pending.pop(cmd_id, None)
+            if entry is None:
+                return
+            attempts = entry.attempts
+            rtt_ms = (now - entry.first_sent) * 1000 if entry.first_sent is not None else None
+            if ok:
+                self.acked += 1
+                if rtt_ms is not None:
+                    self._rtts.append(rtt_ms)
+            else:
+                self.rejected += 1
+        if ok:
+            db.submit_command_status(cmd_id, db.COMMAND_ACKED, attempts, rtt_ms).add_done_callback(
+                self._on_write_done)
+            return
+        logger.warning(f"[CMD] {entry.command.topic} {cmd_id} rejected by ESP32")
+        db.submit_command_status(cmd_id, db.COMMAND_REJECTED, attempts, rtt_ms).add_done_callback(
+            self._on_write_done)
+        self.command_rejected.emit(cmd_id, entry.command.topic)
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rtts = sorted(self._rtts)
+        result = {
+            "pending": len(self._pending),
+            "sent": self.sent,
+            "acked": self.acked,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "expired": self.expired,
+        }
+        if rtts:
+            result["rtt_p50_ms"] = round(rtts[len(rtts) // 2], 2)
+            result["rtt_p95_ms"] = round(rtts[min(len(rtts) - 1, int(len(rtts) * 0.95))], 2)
+            result["rtt_mean_ms"] = round(statistics.fmean(rtts), 2)
+        return result
+
+    # === Nội bộ (thread chính) ===
+
+    def _attempt(self, entry: _Pending, now: float):
+        # Ghi nhận trước khi gửi: ack có thể về (network thread) trước khi publish trả về.
+        # Không giữ _lock lúc publish: callback ack của paho cần lock này
+        with self._lock:
+            first = entry.first_sent is None
+            if first:
+                entry.first_sent = now
+            entry.attempts += 1
+            retry = entry.attempts > 1
+        if not self._publish(entry.command.topic, entry.payload):
+            with self._lock:
+                entry.attempts -= 1
+                if first:
+                    entry.first_sent = None
+                entry.next_at = now
+            return
+        self.sent += 1
+        if retry:
+            self.retries += 1
+        if not self.acks_supported:
+            self._finish(entry, db.COMMAND_SENT)
+            return
+        with self._lock:
+            entry.next_at = now + entry.delay
+            entry.delay = min(entry.delay * 2, COMMAND_CONFIG["retry_max_ms"] / 1000)
+
+    def _tick(self):
+        now = time.monotonic()
+        wall = now_ms()
+        with self._lock:
+            entries = list(self._pending.values())
+        for entry in entries:
+            if entry.command.cmd_id not in self._pending:
+                continue    # Vừa được ack
+            if wall >= entry.command.expires_at:
+                logger.warning(f"[CMD] {entry.command.topic} {entry.command.cmd_id} expired "
+                               f"after {entry.attempts} attempts")
+                self.expired += 1
+                self._finish(entry, db.COMMAND_EXPIRED)
+            elif now >= entry.next_at:
+                self._attempt(entry, now)
+        if not self._pending:
+            self._timer.stop()
+
+    def _finish(self, entry: _Pending, status: str):
+        with self._lock:
+            if self._pending.pop(entry.command.cmd_id, None) is None:
+                return
+            attempts = entry.attempts
+        db.submit_command_status(entry.command.cmd_id, status, attempts).add_done_callback(
+            self._on_write_done)
+
+    def _ensure_timer(self):
+        if self._pending and not self._timer.isActive():
+            self._timer.start()
+
+    @staticmethod
+    def _on_write_done(future):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"[CMD] Failed to persist command: {error}")
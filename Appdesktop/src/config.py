@@ -10,6 +10,12 @@ MQTT_CONFIG = {
     "password": "",
     "client_id": "parking_desktop",
     "keepalive": 60,
+    "subscription": "parking/#",    # Một wildcard; topic nào được xử lý do router quyết định
+    "max_payload": 16384,           # Payload lớn hơn bị bỏ trước khi parse
+    "reconnect_min_s": 1,           # paho tự reconnect với backoff trong khoảng này
+    "reconnect_max_s": 30,
+    "outbox_size": 100,             # Lệnh publish lúc mất kết nối: giữ tối đa bấy nhiêu
+    "outbox_max_age_ms": 3000,      # ... và bỏ lệnh quá cũ (không mở barrier muộn)
 }
 
 # MQTT Topics
@@ -20,11 +26,27 @@ MQTT_TOPICS = {
     "exit_open": "parking/exit/open",        # App -> ESP32: mở barrier ra
     "status": "parking/status",              # App -> ESP32: trạng thái
     "esp32_heartbeat": "parking/esp32/heartbeat",  # ESP32 -> App: heartbeat
+    "codec": "parking/esp32/codec",          # App -> ESP32: codec cho lệnh (json | msgpack)
     "slot_status": "parking/slots/status",   # ESP32 -> App: trạng thái tất cả slot
     "slot_change": "parking/slots/change",   # ESP32 -> App: slot thay đổi
+    "slot_snapshot": "parking/slots/snapshot",  # ESP32 -> App: {seq, count, bits} bit-packed (base64)
+    "slot_delta": "parking/slots/delta",     # ESP32 -> App: {seq, on: [slot], off: [slot]}
+    "slot_resync": "parking/slots/resync",   # App -> ESP32: xin snapshot khi lệch seq
     "lcd_entry": "parking/lcd/entry",        # App -> ESP32: hiển thị xe vào
     "lcd_exit": "parking/lcd/exit",          # App -> ESP32: hiển thị xe ra
     "lcd_error": "parking/lcd/error",        # App -> ESP32: hiển thị lỗi
+    "command_ack": "parking/esp32/ack",      # ESP32 -> App: {cmd_id, ok} sau khi thực hiện lệnh
+}
+
+# Lệnh App -> ESP32 (barrier, LCD): lưu SQLite, gửi QoS 1, gửi lại tới khi ESP32 ack theo cmd_id
+COMMAND_CONFIG = {
+    "ack_timeout_ms": 500,          # Chưa có ack sau bấy nhiêu thì gửi lại (giãn gấp đôi mỗi lần)
+    "retry_max_ms": 4000,           # ... tối đa
+    "barrier_ttl_ms": 30000,        # Lệnh mở barrier quá hạn thì bỏ (không mở khi tài xế đã đi)
+    "lcd_ttl_ms": 3000,             # Thông báo LCD cũ: bỏ, không hiển thị muộn
+    "tick_ms": 50,                  # Chu kỳ kiểm tra gửi lại/hết hạn (chỉ chạy khi có lệnh chờ)
+    "rtt_window": 256,              # Số lệnh gần nhất tính RTT
+    "keep_days": 7,                 # Xóa lịch sử lệnh đã xong cũ hơn
 }
 
 # Parking Configuration
@@ -33,9 +55,62 @@ PARKING_CONFIG = {
     "hourly_rate": 5000,      # VND/giờ
     "min_fee": 5000,          # Phí tối thiểu
     "free_minutes": 15,       # Miễn phí 15 phút đầu
+    "slot_strategy": "lowest",  # lowest | nearest | zone_balanced
+    "pending_exit_ttl_s": 600,  # Lượt ra chờ thanh toán bị bỏ quá lâu thì cho quét lại (> thời gian chờ QR)
 }
 
 # Database
 import os
 _BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATABASE_PATH = os.path.join(_BASE_DIR, "parking.db")
+
+# SQLite tuning (connection layer giữ kết nối lâu dài)
+DATABASE_CONFIG = {
+    "journal_mode": "WAL",          # Reader không chặn writer
+    "synchronous": "NORMAL",        # Đủ an toàn với WAL, ít fsync hơn FULL
+    "cache_size_kb": 8192,          # Page cache mỗi kết nối
+    "busy_timeout_ms": 5000,        # Chờ lock thay vì báo lỗi ngay
+    "cached_statements": 256,       # Cache câu lệnh đã compile
+    "writer_synchronous": "FULL",   # Kết nối writer: commit = đã fsync (ack bền vững)
+    "writer_queue_size": 1024,      # Hàng đợi thread ghi (đầy thì caller chờ)
+    "group_commit_max": 64,         # Số thao tác tối đa mỗi lần commit
+    "group_commit_ms": 0,           # Chờ thêm để gom lô (0 = chỉ gom phần đã xếp hàng)
+}
+
+# Lưu trữ: phiên đã đóng lâu ngày chuyển sang file SQLite riêng theo tháng
+ARCHIVE_CONFIG = {
+    "dir": os.path.join(_BASE_DIR, "archive"),   # archive/sessions_YYYY-MM.db
+    "after_days": 180,              # Phiên đã ra quá bấy nhiêu ngày thì lưu trữ
+    "batch_size": 5000,             # Số phiên mỗi transaction (nhả write lock giữa các lô)
+    "interval_hours": 24,           # Chu kỳ chạy job lưu trữ trong app
+}
+
+# Backup online: snapshot định kỳ bằng SQLite backup API, chạy nền theo từng bước nhỏ
+BACKUP_CONFIG = {
+    "dir": os.path.join(_BASE_DIR, "backups"),  # backups/parking_YYYYmmdd_HHMMSS.db
+    "interval_hours": 6,
+    "keep": 28,                     # Số snapshot giữ lại (cũ nhất bị xóa)
+    "pages_per_step": 256,          # Số page chép mỗi bước
+    "step_sleep_ms": 5,             # Nghỉ giữa các bước, nhường I/O cho luồng vào/ra
+}
+
+# Dashboard: cập nhật slot/thống kê/doanh thu/heartbeat gom lại theo frame
+DASHBOARD_CONFIG = {
+    "frame_ms": 16,                 # ~60 FPS: mỗi key áp dụng tối đa một lần mỗi frame
+}
+
+# Lịch sử vào/ra trên dashboard
+HISTORY_CONFIG = {
+    "page_size": 50,                # Số phiên mỗi lần tải thêm
+    "prefetch_rows": 10,            # Cuộn tới cách đáy bấy nhiêu dòng thì tải trang kế
+    "max_rows": 5000,               # Dung lượng ring buffer của bảng lịch sử
+    "insert_batch_ms": 16,          # Gom sự kiện mới thành một lần báo view
+}
+
+# Cache tra cứu thẻ RFID
+CARD_CACHE_CONFIG = {
+    "max_size": 5000,               # Số thẻ đã đăng ký giữ trong RAM
+    "ttl_seconds": 300,
+    "negative_max_size": 1000,      # Số UID lạ ghi nhớ
+    "negative_ttl_seconds": 30,
+}
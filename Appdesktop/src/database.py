@@ -2,21 +2,146 @@
 Database - SQLite operations
 """
 
+import heapq
+import os
+import queue
+import re
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import replace
 from datetime import datetime
-from typing import Optional, List, Dict
-from src.config import DATABASE_PATH, PARKING_CONFIG
+from typing import Callable, Iterable, Iterator, Optional, List, Dict, Tuple
+from src.config import DATABASE_PATH, DATABASE_CONFIG, PARKING_CONFIG, CARD_CACHE_CONFIG, ARCHIVE_CONFIG
+from src.card_cache import CardCache, MISS
+from src.db_writer import DBWriter
+from src.models import Card, CardImportResult, Command, Session, SlotStats
+from src.session_index import ActiveSessionIndex
+from src.slot_allocator import SlotAllocator
+from src.timeutil import now_ms, to_ms, format_ms, day_key, hour_key, month_range
 
 
-def get_connection():
-    return sqlite3.connect(DATABASE_PATH)
+# === Connection Layer ===
+# Một kết nối writer dùng chung (bảo vệ bằng lock) + mỗi thread một kết nối reader.
+# Kết nối được giữ suốt vòng đời app, tránh mở file/parse schema mỗi lần gọi.
+
+_write_lock = threading.RLock()
+_writer_conn: Optional[sqlite3.Connection] = None
+_local = threading.local()
+_registry_lock = threading.Lock()
+_all_conns: List[sqlite3.Connection] = []
+_generation = 0
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=DATABASE_CONFIG["busy_timeout_ms"] / 1000,
+        isolation_level=None,  # Tự quản lý transaction (BEGIN/COMMIT)
+        check_same_thread=False,
+        cached_statements=DATABASE_CONFIG["cached_statements"],
+    )
+    conn.execute(f"PRAGMA journal_mode = {DATABASE_CONFIG['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {DATABASE_CONFIG['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = -{DATABASE_CONFIG['cache_size_kb']}")
+    conn.execute(f"PRAGMA busy_timeout = {DATABASE_CONFIG['busy_timeout_ms']}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    with _registry_lock:
+        _all_conns.append(conn)
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Kết nối reader của thread hiện tại (tạo lần đầu, dùng lại về sau)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "generation", -1) != _generation:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.generation = _generation
+    return conn
+
+
+def close_thread_connection():
+    """Đóng kết nối reader của thread hiện tại - gọi cuối các thread/worker ngắn hạn"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    with _registry_lock:
+        if conn in _all_conns:
+            _all_conns.remove(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+@contextmanager
+def _reader():
+    cursor = get_connection().cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+def _get_writer_conn() -> sqlite3.Connection:
+    """Kết nối writer (tạo lần đầu); chỉ dùng khi đang giữ _write_lock"""
+    global _writer_conn
+    if _writer_conn is None:
+        _writer_conn = _open_connection()
+        # Commit trả về = đã fsync: dữ liệu đã ack không mất khi crash/mất điện
+        _writer_conn.execute(f"PRAGMA synchronous = {DATABASE_CONFIG['writer_synchronous']}")
+    return _writer_conn
+
+
+@contextmanager
+def _writer():
+    """Transaction ghi trên kết nối writer duy nhất: BEGIN IMMEDIATE ... COMMIT/ROLLBACK"""
+    with _write_lock:
+        cursor = _get_writer_conn().cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+        except BaseException:
+            _writer_conn.rollback()
+            raise
+        else:
+            _writer_conn.commit()
+        finally:
+            cursor.close()
+
+
+def close_connections():
+    """Đóng toàn bộ kết nối (trước khi xóa/thay file database hoặc khi thoát app)"""
+    global _writer_conn, _generation
+    _stop_db_writer()
+    with _write_lock, _registry_lock:
+        for conn in _all_conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _all_conns.clear()
+        _writer_conn = None
+        _generation += 1
+    invalidate_card_cache()
 
 
 def init_database():
-    """Khởi tạo database và tables"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+    """Khởi tạo database, tables và áp dụng các migration còn thiếu"""
+    with _writer() as cursor:
+        _create_schema(cursor)
+        _apply_migrations(cursor)
+    _load_active_index()
+    _load_slot_allocator()
+    slow = verify_query_plans()
+    if slow:
+        print(f"[DB] WARNING: full table scan in hot queries: {slow}")
+
+
+def _create_schema(cursor: sqlite3.Cursor):
     # Bảng thẻ RFID
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS cards (
@@ -25,23 +150,23 @@ def init_database():
             owner_name TEXT,
             plate_number TEXT,
             phone TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at INTEGER DEFAULT (CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)),
             is_active INTEGER DEFAULT 1
         )
     """)
     
-    # Bảng phiên gửi xe
+    # Bảng phiên gửi xe (thời gian: epoch milliseconds)
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS sessions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             card_id TEXT NOT NULL,
             plate_number TEXT,
             slot_number INTEGER,
-            entry_time TIMESTAMP NOT NULL,
-            exit_time TIMESTAMP,
+            entry_time INTEGER NOT NULL,
+            exit_time INTEGER,
             fee INTEGER DEFAULT 0,
             payment_status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at INTEGER DEFAULT (CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))
         )
     """)
     
@@ -55,30 +180,425 @@ def init_database():
         )
     """)
     
-    # Khởi tạo slots nếu chưa có
-    cursor.execute("SELECT COUNT(*) FROM slots")
-    if cursor.fetchone()[0] == 0:
-        for i in range(1, PARKING_CONFIG["total_slots"] + 1):
-            cursor.execute("INSERT INTO slots (slot_number) VALUES (?)", (i,))
-    
-    conn.commit()
-    conn.close()
+    # Khởi tạo slots còn thiếu (tăng total_slots thì tự thêm slot mới)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO slots (slot_number) VALUES (?)",
+        ((i,) for i in range(1, PARKING_CONFIG["total_slots"] + 1))
+    )
+
+
+# === Schema Migrations ===
+# PRAGMA user_version lưu version schema đã áp dụng; mỗi migration chạy đúng một lần.
+
+def _migrate_v1_indexes(cursor: sqlite3.Cursor):
+    """Index cho các truy vấn nóng (xem _HOT_QUERIES)"""
+    # Partial index: chỉ chứa session đang mở -> luôn nhỏ dù lịch sử lớn
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_active
+        ON sessions(card_id, entry_time) WHERE exit_time IS NULL
+    """)
+    # Covering index cho lịch sử: đọc thẳng từ index, không cần quay lại bảng
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_history
+        ON sessions(created_at, id, card_id, plate_number, slot_number,
+                    entry_time, exit_time, fee, payment_status)
+    """)
+    # Doanh thu: range scan trên exit_time của các phiên đã thanh toán
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_paid_exit
+        ON sessions(exit_time, fee, payment_status) WHERE payment_status = 'paid'
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cards_active_created
+        ON cards(created_at) WHERE is_active = 1
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_slots_free
+        ON slots(slot_number) WHERE is_occupied = 0
+    """)
+
+
+def _migrate_v2_slot_layout(cursor: sqlite3.Cursor):
+    """Khu/tầng và khoảng cách tới lối vào cho SlotAllocator"""
+    cursor.execute("ALTER TABLE slots ADD COLUMN zone TEXT DEFAULT 'A'")
+    cursor.execute("ALTER TABLE slots ADD COLUMN distance INTEGER")
+    cursor.execute("UPDATE slots SET distance = slot_number WHERE distance IS NULL")
+
+
+def _migrate_v3_idempotency(cursor: sqlite3.Cursor):
+    """Idempotency key cho xe vào/ra + chặn 2 phiên mở cùng thẻ/slot ở mức SQLite"""
+    cursor.execute("ALTER TABLE sessions ADD COLUMN entry_key TEXT")
+    cursor.execute("ALTER TABLE sessions ADD COLUMN exit_key TEXT")
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_sessions_entry_key
+        ON sessions(entry_key) WHERE entry_key IS NOT NULL
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_sessions_exit_key
+        ON sessions(exit_key) WHERE exit_key IS NOT NULL
+    """)
+    for name, column in (("ux_sessions_open_card", "card_id"), ("ux_sessions_open_slot", "slot_number")):
+        try:
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON sessions({column}) WHERE exit_time IS NULL")
+        except sqlite3.IntegrityError:
+            # Dữ liệu cũ đã có phiên mở trùng -> bỏ qua, vẫn được chặn ở tầng submit_entry
+            print(f"[DB] WARNING: duplicate open sessions by {column}, {name} not created")
+
+
+def _migrate_v4_revenue_rollups(cursor: sqlite3.Cursor):
+    """Phương thức thanh toán + bảng tổng hợp doanh thu theo ngày/giờ"""
+    cursor.execute("ALTER TABLE sessions ADD COLUMN payment_method TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_revenue (
+            day TEXT NOT NULL,                  -- YYYY-MM-DD
+            payment_method TEXT NOT NULL,
+            total_fee INTEGER NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, payment_method)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS hourly_revenue (
+            hour TEXT NOT NULL,                 -- YYYY-MM-DD HH
+            payment_method TEXT NOT NULL,
+            total_fee INTEGER NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, payment_method)
+        ) WITHOUT ROWID
+    """)
+    _rebuild_revenue_rollups(cursor)
+
+
+def _migrate_v5_epoch_ms(cursor: sqlite3.Cursor):
+    """Chuyển cột thời gian từ text sang epoch ms (INTEGER), index tự cập nhật theo"""
+    # entry_time/exit_time ghi bằng datetime.now() -> giờ local; created_at là CURRENT_TIMESTAMP -> UTC
+    for table, column, modifier in (
+        ("sessions", "entry_time", ", 'utc'"),
+        ("sessions", "exit_time", ", 'utc'"),
+        ("sessions", "created_at", ""),
+        ("cards", "created_at", ""),
+    ):
+        cursor.execute(f"""
+            UPDATE {table}
+            SET {column} = CAST(ROUND((julianday({column}{modifier}) - 2440587.5) * 86400000) AS INTEGER)
+            WHERE typeof({column}) = 'text' AND julianday({column}) IS NOT NULL
+        """)
+        if cursor.rowcount:
+            print(f"[DB] {table}.{column}: {cursor.rowcount} rows converted to epoch ms")
+    _rebuild_revenue_rollups(cursor)
+
+
+def _migrate_v6_history_filters(cursor: sqlite3.Cursor):
+    """Index cho lịch sử lọc theo thẻ / biển số, cùng thứ tự keyset (created_at, id)"""
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_card_history
+        ON sessions(card_id, created_at, id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_plate_history
+        ON sessions(plate_number, created_at, id)
+    """)
+
+
+# Biển số chuẩn hóa: chữ hoa, bỏ '-', '.', khoảng trắng ("29a-123.45" -> "29A12345").
+# Phải khớp với normalize_plate() bên dưới.
+_PLATE_KEY_SQL = "REPLACE(REPLACE(REPLACE(UPPER(plate_number), '-', ''), '.', ''), ' ', '')"
+
+
+def _migrate_v7_search(cursor: sqlite3.Cursor):
+    """Cột plate_key (generated) có index + FTS5 trên thẻ và biển số phiên, đồng bộ bằng trigger"""
+    for table in ("cards", "sessions"):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN plate_key TEXT GENERATED ALWAYS AS ({_PLATE_KEY_SQL}) VIRTUAL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_plate_key ON cards(plate_key) WHERE is_active = 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_plate_key ON sessions(plate_key, created_at, id)")
+
+    # External-content FTS5: chỉ lưu index, nội dung đọc từ bảng gốc
+    fts = {
+        "cards": ("cards_fts", ("owner_name", "plate_number", "phone")),
+        "sessions": ("sessions_fts", ("plate_number",)),
+    }
+    for table, (name, columns) in fts.items():
+        cols = ", ".join(columns)
+        new = ", ".join(f"new.{c}" for c in columns)
+        old = ", ".join(f"old.{c}" for c in columns)
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(
+                {cols}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {name}(rowid, {cols}) VALUES (new.id, {new});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {name}({name}, rowid, {cols}) VALUES ('delete', old.id, {old});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {name}({name}, rowid, {cols}) VALUES ('delete', old.id, {old});
+                INSERT INTO {name}(rowid, {cols}) VALUES (new.id, {new});
+            END
+        """)
+        cursor.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+
+
+def _migrate_v8_command_outbox(cursor: sqlite3.Cursor):
+    """Lệnh App -> ESP32 chờ ack (barrier, LCD); index một phần chỉ chứa lệnh đang chờ"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mqtt_commands (
+            cmd_id TEXT PRIMARY KEY,
+            topic TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            acked_at INTEGER,
+            rtt_ms REAL
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mqtt_commands_pending
+        ON mqtt_commands(created_at) WHERE status = 'pending'
+    """)
+
+
+_MIGRATIONS = [
+    (1, _migrate_v1_indexes),
+    (2, _migrate_v2_slot_layout),
+    (3, _migrate_v3_idempotency),
+    (4, _migrate_v4_revenue_rollups),
+    (5, _migrate_v5_epoch_ms),
+    (6, _migrate_v6_history_filters),
+    (7, _migrate_v7_search),
+    (8, _migrate_v8_command_outbox),
+]
+
+
+def _apply_migrations(cursor: sqlite3.Cursor):
+    cursor.execute("PRAGMA user_version")
+    current = cursor.fetchone()[0]
+    for version, migrate in _MIGRATIONS:
+        if version > current:
+            print(f"[DB] Applying migration v{version}: {migrate.__name__}")
+            migrate(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+
+
+# === Hot Queries ===
+# Dùng chung cho các hàm bên dưới và verify_query_plans().
+
+_SQL_OPEN_SESSIONS = (
+    "SELECT id, card_id, plate_number, slot_number, entry_time, exit_time, fee, payment_status, entry_key "
+    "FROM sessions WHERE exit_time IS NULL"
+)
+_SQL_HISTORY = (
+    "SELECT id, card_id, plate_number, slot_number, entry_time, exit_time, fee, payment_status, created_at "
+    "FROM sessions"
+)
+_SQL_EXPORT_SESSIONS = (
+    "SELECT id, card_id, plate_number, slot_number, entry_time, exit_time, fee, payment_status, "
+    "entry_key, exit_key, payment_method, created_at FROM sessions "
+    "WHERE created_at >= ? AND created_at < ? ORDER BY created_at, id"
+)
+_SQL_PENDING_COMMANDS = (
+    "SELECT cmd_id, topic, payload, created_at, expires_at, attempts, status "
+    "FROM mqtt_commands WHERE status = 'pending' AND expires_at > ? ORDER BY created_at"
+)
+_SQL_DAY_REVENUE = "SELECT COALESCE(SUM(total_fee), 0) FROM daily_revenue WHERE day = ?"
+_SQL_GET_CARD = (
+    "SELECT id, card_id, owner_name, plate_number, phone "
+    "FROM cards WHERE card_id = ? AND is_active = 1"
+)
+_SQL_ALL_CARDS = (
+    "SELECT id, card_id, owner_name, plate_number, phone "
+    "FROM cards WHERE is_active = 1 ORDER BY created_at DESC"
+)
+
+
+
+def _history_query(after: Optional[Tuple[int, int]] = None, limit: int = 50,
+                   start: Optional[int] = None, end: Optional[int] = None,
+                   card_id: Optional[str] = None, plate: Optional[str] = None):
+    """SQL + params cho một trang lịch sử, mới nhất trước, keyset trên (created_at, id)"""
+    where, params = [], []
+    if card_id:
+        where.append("card_id = ?")
+        params.append(card_id.strip().upper())
+    if plate:
+        where.append("plate_key = ?")
+        params.append(normalize_plate(plate))
+    if start is not None:
+        where.append("created_at >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("created_at < ?")
+        params.append(end)
+    if after is not None:
+        where.append("(created_at, id) < (?, ?)")
+        params.extend(after)
+    sql = _SQL_HISTORY
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit)
+
+
+# Row factory: tạo model thẳng từ tuple row (thứ tự cột SELECT = thứ tự field)
+def _card_row(cursor: sqlite3.Cursor, row: tuple) -> Card:
+    return Card(*row)
+
+
+def _session_row(cursor: sqlite3.Cursor, row: tuple) -> Session:
+    return Session(*row)
+
+
+_SQL_CARDS_PAGE = (
+    "SELECT id, card_id, owner_name, plate_number, phone, created_at "
+    "FROM cards WHERE is_active = 1"
+)
+
+# Tìm kiếm: mỗi nguồn khớp là một truy vấn đi theo thứ tự index (không sort tạm),
+# ghép kết quả theo độ ưu tiên: mã thẻ -> biển số chuẩn hóa -> từ khóa FTS.
+_CARD_COLS = "c.id, c.card_id, c.owner_name, c.plate_number, c.phone"
+_SQL_SEARCH_CARDS = (
+    f"SELECT {_CARD_COLS} FROM cards c WHERE c.card_id GLOB ? AND c.is_active = 1 ORDER BY c.card_id LIMIT ?",
+    f"SELECT {_CARD_COLS} FROM cards c WHERE c.plate_key GLOB ? AND c.is_active = 1 ORDER BY c.plate_key LIMIT ?",
+    f"SELECT {_CARD_COLS} FROM cards_fts f JOIN cards c ON c.id = f.rowid "
+    "WHERE cards_fts MATCH ? AND c.is_active = 1 ORDER BY f.rowid DESC LIMIT ?",
+)
+_SESSION_COLS = "s.id, s.card_id, s.plate_number, s.slot_number, s.entry_time, s.exit_time, s.fee, s.payment_status"
+_SQL_SEARCH_SESSIONS = (
+    f"SELECT {_SESSION_COLS} FROM sessions s WHERE s.card_id GLOB ? "
+    "ORDER BY s.card_id DESC, s.created_at DESC, s.id DESC LIMIT ?",
+    f"SELECT {_SESSION_COLS} FROM sessions s WHERE s.plate_key GLOB ? "
+    "ORDER BY s.plate_key DESC, s.created_at DESC, s.id DESC LIMIT ?",
+    f"SELECT {_SESSION_COLS} FROM sessions_fts f JOIN sessions s ON s.id = f.rowid "
+    "WHERE sessions_fts MATCH ? ORDER BY f.rowid DESC LIMIT ?",
+)
+
+
+def normalize_plate(plate: str) -> str:
+    """Biển số dạng khóa tìm kiếm - cùng quy tắc với cột plate_key"""
+    return plate.upper().replace("-", "").replace(".", "").replace(" ", "")
+
+
+def _fts_query(text: str) -> Optional[str]:
+    """Chuỗi người dùng -> truy vấn FTS5: mọi từ đều phải khớp, khớp theo tiền tố"""
+    terms = re.findall(r"\w+", text)
+    return " ".join(f'"{t}"*' for t in terms) if terms else None
+
+
+def _glob_prefix(text: str) -> str:
+    """Tiền tố cho GLOB (dùng được index), escape ký tự đặc biệt của GLOB"""
+    return re.sub(r"([*?\[])", r"[\1]", text) + "*"
+
+
+def _cards_query(after: Optional[Tuple[int, int]] = None, limit: int = 200):
+    """
+    SQL + params cho một trang thẻ, mới nhất trước, keyset trên (created_at, id).
+    Không lọc ở đây: OR giữa các điều kiện tìm kiếm làm SQLite quét cả index
+    created_at - tìm kiếm đi qua search_cards (mỗi nguồn khớp một index).
+    """
+    sql, params = _SQL_CARDS_PAGE, []
+    if after is not None:
+        sql += " AND (created_at, id) < (?, ?)"
+        params.extend(after)
+    return sql + " ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit)
+
+
+def _search_params(text: str) -> Tuple[str, str, Optional[str]]:
+    """Tham số cho 3 truy vấn tìm kiếm: (GLOB mã thẻ, GLOB biển số, MATCH FTS)"""
+    text = text.strip()
+    plate = normalize_plate(text)
+    return _glob_prefix(text.upper()), _glob_prefix(plate) if plate else None, _fts_query(text)
+
+
+def _run_search(cursor: sqlite3.Cursor, queries: Tuple[str, ...], text: str, limit: int, key) -> list:
+    """Chạy lần lượt các truy vấn tìm kiếm, bỏ trùng, dừng khi đủ `limit`"""
+    results, seen = [], set()
+    for sql, param in zip(queries, _search_params(text)):
+        if param is None:
+            continue
+        for row in cursor.execute(sql, (param, limit)).fetchall():
+            if row[0] not in seen:
+                seen.add(row[0])
+                results.append(key(row))
+        if len(results) >= limit:
+            break
+    return results[:limit]
+
+
+_HOT_QUERIES = {
+    "get_card": (_SQL_GET_CARD, ("X",)),
+    "get_all_cards": (_SQL_ALL_CARDS, ()),
+    "cards_page": _cards_query((0, 0)),
+    **{f"cards_search_{i}": (sql, ("X*", 20)) for i, sql in enumerate(_SQL_SEARCH_CARDS)},
+    **{f"sessions_search_{i}": (sql, ("X*", 20)) for i, sql in enumerate(_SQL_SEARCH_SESSIONS)},
+    "load_active_index": (_SQL_OPEN_SESSIONS, ()),
+    "history_page": _history_query((0, 0)),
+    "history_by_card": _history_query((0, 0), card_id="X", start=0, end=1),
+    "history_by_plate": _history_query((0, 0), plate="X"),
+    "get_today_revenue": (_SQL_DAY_REVENUE, ("2000-01-01",)),
+    "export_sessions": (_SQL_EXPORT_SESSIONS, (0, 1)),
+    "pending_commands": (_SQL_PENDING_COMMANDS, (0,)),
+}
+
+
+def explain_query_plans() -> Dict[str, List[str]]:
+    """EXPLAIN QUERY PLAN cho từng truy vấn nóng: {tên: [detail, ...]}"""
+    plans = {}
+    with _reader() as cursor:
+        for name, (sql, params) in _HOT_QUERIES.items():
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plans[name] = [row[3] for row in cursor.fetchall()]
+    return plans
+
+
+def verify_query_plans() -> List[str]:
+    """Trả về tên các truy vấn nóng đang full scan bảng hoặc phải sort tạm"""
+    slow = []
+    for name, details in explain_query_plans().items():
+        for detail in details:
+            # "SCAN ... VIRTUAL TABLE" là tra index FTS5, không phải quét bảng
+            full_scan = (detail.startswith("SCAN") and "USING" not in detail
+                         and "VIRTUAL TABLE" not in detail)
+            if full_scan or "TEMP B-TREE" in detail:
+                slow.append(name)
+                break
+    return slow
 
 
 # === Card Operations ===
 
+_card_cache = CardCache(**CARD_CACHE_CONFIG)
+
+
+def invalidate_card_cache(card_id: Optional[str] = None):
+    """Xóa cache thẻ: một thẻ, hoặc toàn bộ khi card_id=None (thay đổi hàng loạt)"""
+    if card_id is None:
+        _card_cache.clear()
+    else:
+        _card_cache.invalidate(card_id.strip().upper())
+
+
+def get_card_cache_stats() -> Dict:
+    return _card_cache.stats()
+
+
 def add_card(card_id: str, owner_name: str = "", plate_number: str = "", phone: str = "") -> bool:
     # Normalize card_id: uppercase, strip whitespace
     card_id = card_id.strip().upper()
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO cards (card_id, owner_name, plate_number, phone) VALUES (?, ?, ?, ?)",
-            (card_id, owner_name, plate_number, phone)
-        )
-        conn.commit()
-        conn.close()
+        with _writer() as cursor:
+            cursor.execute(
+                "INSERT INTO cards (card_id, owner_name, plate_number, phone, created_at) VALUES (?, ?, ?, ?, ?)",
+                (card_id, owner_name, plate_number, phone, now_ms())
+            )
+        _card_cache.invalidate(card_id)
         print(f"[DB] Card added successfully: {card_id}")
         return True
     except sqlite3.IntegrityError as e:
@@ -89,152 +609,994 @@ def add_card(card_id: str, owner_name: str = "", plate_number: str = "", phone:
         return False
 
 
-def get_card(card_id: str) -> Optional[Dict]:
+def get_card(card_id: str) -> Optional[Card]:
     # Normalize card_id: uppercase, strip whitespace
     card_id = card_id.strip().upper()
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM cards WHERE card_id = ? AND is_active = 1", (card_id,))
-    row = cursor.fetchone()
-    conn.close()
-    print(f"[DB] get_card({card_id}): {row}")
-    if row:
-        return {"id": row[0], "card_id": row[1], "owner_name": row[2], "plate_number": row[3], "phone": row[4]}
-    return None
+    cached = _card_cache.get(card_id)
+    if cached is not MISS:
+        return cached
+    version = _card_cache.version
+    with _reader() as cursor:
+        cursor.row_factory = _card_row
+        cursor.execute(_SQL_GET_CARD, (card_id,))
+        card = cursor.fetchone()
+    print(f"[DB] get_card({card_id}): {card}")
+    _card_cache.put(card_id, card, version)
+    return card
 
 
-def get_all_cards() -> List[Dict]:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM cards WHERE is_active = 1 ORDER BY created_at DESC")
-    rows = cursor.fetchall()
-    conn.close()
-    print(f"[DB] get_all_cards: found {len(rows)} cards")
-    return [{"id": r[0], "card_id": r[1], "owner_name": r[2], "plate_number": r[3], "phone": r[4]} for r in rows]
+def get_all_cards() -> List[Card]:
+    with _reader() as cursor:
+        cursor.row_factory = _card_row
+        cursor.execute(_SQL_ALL_CARDS)
+        cards = cursor.fetchall()
+    print(f"[DB] get_all_cards: found {len(cards)} cards")
+    return cards
+
+
+def get_cards_page(after: Optional[Tuple[int, int]] = None, limit: int = 200):
+    """
+    Một trang thẻ đang hoạt động (mới nhất trước).
+    Returns: (cards, next_cursor hoặc None nếu đã hết)
+    """
+    sql, params = _cards_query(after, limit + 1)
+    with _reader() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][5], rows[-1][0])
+    return [Card(*r[:5]) for r in rows], next_cursor
+
+
+def count_cards() -> int:
+    with _reader() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM cards WHERE is_active = 1")
+        return cursor.fetchone()[0]
+
+
+def search_cards(text: str, limit: int = 20) -> List[Card]:
+    """
+    Tìm thẻ theo tiền tố mã thẻ, biển số (bỏ qua hoa/thường, '-', '.', khoảng trắng)
+    hoặc từ đầu của tên chủ thẻ / SĐT (không dấu cũng khớp).
+    """
+    if not text or not text.strip():
+        return []
+    with _reader() as cursor:
+        return _run_search(cursor, _SQL_SEARCH_CARDS, text, limit, lambda row: Card(*row))
 
 
 def delete_card(card_id: str) -> bool:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE cards SET is_active = 0 WHERE card_id = ?", (card_id,))
-    conn.commit()
-    affected = cursor.rowcount
-    conn.close()
+    card_id = card_id.strip().upper()
+    with _writer() as cursor:
+        cursor.execute("UPDATE cards SET is_active = 0 WHERE card_id = ?", (card_id,))
+        affected = cursor.rowcount
+    _card_cache.invalidate(card_id)
     return affected > 0
 
 
+# === Bulk Import / Export ===
+# Nhập cả file trong một transaction: executemany theo lô, lỗi -> rollback toàn bộ.
+
+IMPORT_SKIP = "skip"        # Thẻ đã có: giữ nguyên
+IMPORT_UPDATE = "update"    # Thẻ đã có: ghi đè chủ thẻ / biển số / SĐT (cột có trong file)
+IMPORT_FAIL = "fail"        # Thẻ đã có hoặc dòng lỗi: hủy toàn bộ lần nhập
+
+CARD_FIELDS = ("card_id", "owner_name", "plate_number", "phone")
+
+_CARD_ID_RE = re.compile(r"[0-9A-Z:_-]{1,32}")
+_PHONE_RE = re.compile(r"\+?[0-9 .-]{0,20}")
+_FIELD_MAX_LEN = {"owner_name": 100, "plate_number": 20, "phone": 20}
+
+# Thẻ mới hoặc thẻ đã xóa mềm (is_active = 0) -> đăng ký (lại)
+_SQL_IMPORT_INSERT = (
+    "INSERT INTO cards (card_id, owner_name, plate_number, phone, created_at, is_active) "
+    "VALUES (?, ?, ?, ?, ?, 1) "
+    "ON CONFLICT(card_id) DO UPDATE SET owner_name = excluded.owner_name, "
+    "plate_number = excluded.plate_number, phone = excluded.phone, "
+    "created_at = excluded.created_at, is_active = 1"
+)
+# NULL = file không có cột đó -> giữ giá trị cũ
+_SQL_IMPORT_UPDATE = (
+    "UPDATE cards SET owner_name = COALESCE(?, owner_name), plate_number = COALESCE(?, plate_number), "
+    "phone = COALESCE(?, phone) WHERE card_id = ?"
+)
+
+
+class CardImportError(ValueError):
+    """Lần nhập bị hủy (chính sách IMPORT_FAIL); không dòng nào được ghi"""
+
+    def __init__(self, record: int, reason: str):
+        super().__init__(f"Record {record}: {reason}")
+        self.record = record
+        self.reason = reason
+
+
+def _validate_card_record(record: dict) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    """
+    dict một dòng -> (card_id, owner_name, plate_number, phone) đã chuẩn hóa; ValueError nếu sai.
+    Trường không có trong record (hoặc None) -> None, khác với ô trống "".
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    card_id = str(record.get("card_id") or "").strip().upper()
+    if not _CARD_ID_RE.fullmatch(card_id):
+        raise ValueError(f"invalid card_id {card_id!r}")
+    values = {}
+    for name in ("owner_name", "plate_number", "phone"):
+        value = record.get(name)
+        values[name] = None if value is None else str(value).strip()
+        if values[name] is not None and len(values[name]) > _FIELD_MAX_LEN[name]:
+            raise ValueError(f"{name} too long")
+    if values["phone"] is not None and not _PHONE_RE.fullmatch(values["phone"]):
+        raise ValueError(f"invalid phone {values['phone']!r}")
+    return card_id, values["owner_name"], values["plate_number"], values["phone"]
+
+
+def _import_batch(cursor: sqlite3.Cursor, batch: List[Tuple[int, tuple]], on_conflict: str,
+                  result: CardImportResult):
+    marks = ",".join("?" * len(batch))
+    cursor.execute(f"SELECT card_id FROM cards WHERE is_active = 1 AND card_id IN ({marks})",
+                   [row[0] for _, row in batch])
+    existing = {r[0] for r in cursor.fetchall()}
+
+    created_at = now_ms()
+    inserts, updates = [], []
+    for record, row in batch:
+        if row[0] not in existing:
+            inserts.append((row[0], *("" if v is None else v for v in row[1:]), created_at))
+        elif on_conflict == IMPORT_UPDATE:
+            updates.append((*row[1:], row[0]))
+        elif on_conflict == IMPORT_FAIL:
+            raise CardImportError(record, f"card {row[0]} already exists")
+        else:
+            result.skipped += 1
+    if inserts:
+        cursor.executemany(_SQL_IMPORT_INSERT, inserts)
+    if updates:
+        cursor.executemany(_SQL_IMPORT_UPDATE, updates)
+    result.inserted += len(inserts)
+    result.updated += len(updates)
+
+
+def import_cards(records: Iterable[dict], on_conflict: str = IMPORT_SKIP, batch_size: int = 500,
+                 progress: Optional[Callable[[CardImportResult], None]] = None) -> CardImportResult:
+    """
+    Nhập thẻ hàng loạt từ một luồng dict (card_id, owner_name, plate_number, phone).
+
+    records được đọc dần (không nạp hết vào RAM); dòng sai định dạng hoặc trùng
+    card_id trong cùng file được ghi vào result.errors và bỏ qua - trừ IMPORT_FAIL,
+    khi đó CardImportError được raise và transaction rollback.
+    progress(result) được gọi sau mỗi lô.
+    """
+    if on_conflict not in (IMPORT_SKIP, IMPORT_UPDATE, IMPORT_FAIL):
+        raise ValueError(f"Unknown conflict policy: {on_conflict}")
+    result = CardImportResult()
+    seen = set()
+    batch: List[Tuple[int, tuple]] = []
+    try:
+        with _writer() as cursor:
+            for number, record in enumerate(records, start=1):
+                try:
+                    row = _validate_card_record(record)
+                    if row[0] in seen:
+                        raise ValueError(f"duplicate card_id {row[0]} in import")
+                except ValueError as e:
+                    if on_conflict == IMPORT_FAIL:
+                        raise CardImportError(number, str(e))
+                    result.errors.append((number, str(e)))
+                    continue
+                seen.add(row[0])
+                batch.append((number, row))
+                if len(batch) >= batch_size:
+                    _import_batch(cursor, batch, on_conflict, result)
+                    batch = []
+                    if progress:
+                        progress(result)
+            if batch:
+                _import_batch(cursor, batch, on_conflict, result)
+    finally:
+        # Thẻ mới có thể đang nằm trong negative cache
+        _card_cache.clear()
+    if progress:
+        progress(result)
+    print(f"[DB] import_cards: {result.inserted} inserted, {result.updated} updated, "
+          f"{result.skipped} skipped, {len(result.errors)} errors")
+    return result
+
+
+def iter_cards(batch_size: int = 1000) -> Iterator[Card]:
+    """Toàn bộ thẻ đang hoạt động, đọc theo trang keyset - bộ nhớ cố định dù bao nhiêu thẻ"""
+    cursor = None
+    while True:
+        cards, cursor = get_cards_page(cursor, batch_size)
+        yield from cards
+        if cursor is None:
+            return
+
+
 # === Session Operations ===
+# Quyết định vào/ra chạy trên RAM (index + allocator) dưới _decision_lock; phần ghi
+# SQLite đi qua DBWriter (group commit), Future báo khi dữ liệu đã commit bền vững.
+# Thao tác được submit ngay trong _decision_lock nên thứ tự ghi = thứ tự quyết định.
+# Submit trong lock không bao giờ chặn: undo (thread writer) cũng cần lock này, nên
+# hàng đợi đầy -> chưa đổi gì trên RAM, nhả lock, chờ có chỗ rồi quyết định lại.
 
-def create_session(card_id: str, plate_number: str, slot_number: int) -> int:
-    # Normalize card_id
-    card_id = card_id.strip().upper()
-    conn = get_connection()
-    cursor = conn.cursor()
+_active_index = ActiveSessionIndex()
+_decision_lock = threading.Lock()
+_next_session_id = 1
+_recent_exits: "OrderedDict[str, Session]" = OrderedDict()   # exit_key -> phiên đã đóng
+_RECENT_EXITS_MAX = 1000
+_recent_entries: "OrderedDict[str, Session]" = OrderedDict()  # entry_key -> phiên đã tạo (kể cả chưa commit)
+_conflicted_sessions: Dict[int, Session] = {}   # Đóng phiên ghi lỗi nhưng slot/thẻ đã bị dùng lại
+_db_writer: Optional[DBWriter] = None
+_db_writer_lock = threading.Lock()
+
+# Kết quả submit_entry / submit_close
+ENTRY_CREATED = "created"            # Tạo phiên mới
+ENTRY_REPLAYED = "replayed"          # Trùng idempotency key -> trả lại phiên đã tạo
+ENTRY_UNKNOWN_CARD = "unknown_card"
+ENTRY_ALREADY_INSIDE = "already_inside"
+ENTRY_FULL = "full"
+
+PAYMENT_CASH = "cash"
+PAYMENT_TRANSFER = "transfer"
+PAYMENT_FREE = "free"
+
+EXIT_CLOSED = "closed"
+EXIT_REPLAYED = "replayed"           # Trùng idempotency key -> đã đóng trước đó
+EXIT_ALREADY_CLOSED = "already_closed"
+EXIT_NOT_FOUND = "not_found"
+
+
+class _SlotConflict(Exception):
+    """Slot allocator chọn slot mà SQLite đã ghi là occupied"""
+
+
+class _AlreadyClosed(Exception):
+    """Phiên đã có exit_time trong SQLite"""
+
+
+def _load_active_index():
+    global _next_session_id
+    with _reader() as cursor:
+        cursor.row_factory = _session_row
+        cursor.execute(_SQL_OPEN_SESSIONS)
+        sessions = cursor.fetchall()
+        cursor.row_factory = None
+        # id kế tiếp: lớn hơn mọi id từng cấp (kể cả phiên đã xóa)
+        cursor.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(id) FROM sessions), 0), "
+            "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'sessions'), 0))"
+        )
+        last_id = cursor.fetchone()[0]
+    with _decision_lock:
+        _active_index.load(sessions)
+        _next_session_id = last_id + 1
+        _recent_exits.clear()
+        _recent_entries.clear()
+        _conflicted_sessions.clear()
+    print(f"[DB] Active session index loaded: {len(_active_index)} open sessions")
+
+
+def _get_db_writer() -> DBWriter:
+    global _db_writer
+    with _db_writer_lock:
+        if _db_writer is None or not _db_writer.is_alive():
+            _db_writer = DBWriter(
+                _writer,
+                queue_size=DATABASE_CONFIG["writer_queue_size"],
+                max_batch=DATABASE_CONFIG["group_commit_max"],
+                linger_ms=DATABASE_CONFIG["group_commit_ms"],
+            )
+            _db_writer.start()
+        return _db_writer
+
+
+def _stop_db_writer():
+    global _db_writer
+    with _db_writer_lock:
+        if _db_writer is not None:
+            _db_writer.stop()
+            _db_writer = None
+
+
+def flush_writes(timeout: Optional[float] = None) -> bool:
+    """
+    Chờ mọi thao tác ghi đang xếp hàng được commit (read-your-writes).
+    Chỉ dùng cho xuất/lưu trữ/báo cáo; truy vấn của GUI không gọi để không chặn thread UI
+    (lịch sử/doanh thu có thể trễ vài ms so với RAM).
+    """
+    writer = _db_writer
+    return writer.flush(timeout) if writer is not None else True
+
+
+def get_writer_stats() -> Dict:
+    writer = _db_writer
+    return writer.stats() if writer is not None else {"pending": 0, "batches": 0, "ops": 0, "avg_batch": 0}
+
+
+def _write_entry(cursor: sqlite3.Cursor, session: Session) -> int:
     cursor.execute(
-        "INSERT INTO sessions (card_id, plate_number, slot_number, entry_time) VALUES (?, ?, ?, ?)",
-        (card_id, plate_number, slot_number, datetime.now())
+        "INSERT INTO sessions (id, card_id, plate_number, slot_number, entry_time, entry_key, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (session.id, session.card_id, session.plate_number, session.slot_number,
+         session.entry_time, session.entry_key, session.entry_time)
     )
-    session_id = cursor.lastrowid
-    # Đánh dấu slot đã occupied
+    # Optimistic check: chỉ chiếm được slot đang trống
     cursor.execute(
-        "UPDATE slots SET is_occupied = 1, current_session_id = ? WHERE slot_number = ?",
-        (session_id, slot_number)
+        "UPDATE slots SET is_occupied = 1, current_session_id = ? WHERE slot_number = ? AND is_occupied = 0",
+        (session.id, session.slot_number)
     )
-    conn.commit()
-    conn.close()
-    print(f"[DB] Created session {session_id} for card {card_id}, slot {slot_number}")
-    return session_id
+    if cursor.rowcount == 0:
+        raise _SlotConflict(session.slot_number)
+    return session.id
 
 
-def get_active_session(card_id: str) -> Optional[Dict]:
-    # Normalize card_id
-    card_id = card_id.strip().upper()
-    conn = get_connection()
-    cursor = conn.cursor()
+def _write_exit(cursor: sqlite3.Cursor, session: Session) -> int:
     cursor.execute(
-        "SELECT * FROM sessions WHERE card_id = ? AND exit_time IS NULL ORDER BY entry_time DESC LIMIT 1",
-        (card_id,)
+        "UPDATE sessions SET exit_time = ?, fee = ?, payment_status = 'paid', payment_method = ?, exit_key = ? "
+        "WHERE id = ? AND exit_time IS NULL",
+        (session.exit_time, session.fee, session.payment_method, session.exit_key, session.id)
     )
-    row = cursor.fetchone()
-    conn.close()
-    print(f"[DB] get_active_session({card_id}): {row}")
-    if row:
-        return {
-            "id": row[0], "card_id": row[1], "plate_number": row[2], "slot_number": row[3],
-            "entry_time": row[4], "exit_time": row[5], "fee": row[6], "payment_status": row[7]
-        }
-    return None
-
-
-def complete_session(session_id: int, fee: int) -> bool:
-    conn = get_connection()
-    cursor = conn.cursor()
-    # Lấy slot number
-    cursor.execute("SELECT slot_number FROM sessions WHERE id = ?", (session_id,))
-    row = cursor.fetchone()
-    if row:
-        slot_number = row[0]
-        # Update session
-        cursor.execute(
-            "UPDATE sessions SET exit_time = ?, fee = ?, payment_status = 'paid' WHERE id = ?",
-            (datetime.now(), fee, session_id)
-        )
-        # Free slot
+    if cursor.rowcount == 0:
+        raise _AlreadyClosed(session.id)
+    # Free slot
+    cursor.execute(
+        "UPDATE slots SET is_occupied = 0, current_session_id = NULL WHERE slot_number = ? AND current_session_id = ?",
+        (session.slot_number, session.id)
+    )
+    # Cộng dồn doanh thu trong cùng transaction với việc đóng phiên
+    exit_time = session.exit_time
+    for table, column, key in (("daily_revenue", "day", day_key(exit_time)), ("hourly_revenue", "hour", hour_key(exit_time))):
         cursor.execute(
-            "UPDATE slots SET is_occupied = 0, current_session_id = NULL WHERE slot_number = ?",
-            (slot_number,)
+            f"INSERT INTO {table} ({column}, payment_method, total_fee, session_count) VALUES (?, ?, ?, 1) "
+            f"ON CONFLICT({column}, payment_method) DO UPDATE SET "
+            "total_fee = total_fee + excluded.total_fee, session_count = session_count + 1",
+            (key, session.payment_method, session.fee)
         )
-        conn.commit()
-        conn.close()
-        return True
-    conn.close()
-    return False
+    return session.id
+
+
+def _undo_entry(session: Session, error: Exception):
+    # Chạy trên thread writer khi ghi thất bại: trả RAM về đúng trạng thái SQLite.
+    # Giữ _decision_lock như submit_entry/submit_close (hai hàm đó không chờ hàng đợi
+    # khi đang giữ lock, nên thread writer luôn lấy được lock)
+    print(f"[DB] Entry write failed for session {session.id}: {error!r}")
+    with _decision_lock:
+        _active_index.remove(session.id)
+        if session.entry_key and _recent_entries.get(session.entry_key) is session:
+            del _recent_entries[session.entry_key]
+        if not isinstance(error, _SlotConflict):
+            _slot_allocator.release(session.slot_number)
+
 
+def _undo_exit(session: Session, error: Exception):
+    print(f"[DB] Exit write failed for session {session.id}: {error!r}")
+    with _decision_lock:
+        _recent_exits.pop(session.exit_key, None)
+        if isinstance(error, _AlreadyClosed):
+            return
+        reopened = replace(session, exit_time=None, fee=0, payment_status="pending",
+                           payment_method=None, exit_key=None)
+        # Slot đã giải phóng lúc submit_close; xe khác (hoặc chính thẻ này) có thể đã vào lại
+        if (not _slot_allocator.is_free(session.slot_number)
+                or _active_index.get_by_slot(session.slot_number)
+                or _active_index.get_by_card(session.card_id)):
+            _conflicted_sessions[session.id] = reopened
+            print(f"[DB] CONFLICT: session {session.id} still open in DB but slot {session.slot_number} "
+                  f"or card {session.card_id} was reused - needs manual close")
+            return
+        _active_index.add(reopened)
+        _slot_allocator.acquire(session.slot_number)
+
+
+def get_conflicted_sessions() -> List[Session]:
+    """Phiên ghi ra lỗi mà không mở lại được (slot/thẻ đã có phiên khác) - cần xử lý tay"""
+    with _decision_lock:
+        return list(_conflicted_sessions.values())
+
+
+def _try_submit(op: Callable, session: Session, undo: Callable):
+    """Xếp hàng ghi khi đang giữ _decision_lock; None nếu hàng đợi đầy"""
+    try:
+        return _get_db_writer().submit(op, session, undo=undo, block=False)
+    except queue.Full:
+        return None
 
-def get_recent_sessions(limit: int = 20) -> List[Dict]:
-    conn = get_connection()
-    cursor = conn.cursor()
+
+def _reserve_entry(card_id: str, plate_number: str, slot_number: int, entry_key: Optional[str]):
+    """
+    Xếp hàng INSERT rồi ghi nhận phiên vào RAM (caller giữ _decision_lock).
+    Future None: hàng đợi đầy, RAM chưa đổi. Undo cần lock nên luôn chạy sau phần RAM này.
+    """
+    global _next_session_id
+    session = Session(_next_session_id, card_id, plate_number, slot_number, now_ms(), entry_key=entry_key)
+    future = _try_submit(_write_entry, session, lambda e: _undo_entry(session, e))
+    if future is None:
+        return session, None
+    _next_session_id += 1
+    _slot_allocator.acquire(slot_number)
+    _active_index.add(session)
+    if entry_key:
+        _recent_entries[entry_key] = session
+        while len(_recent_entries) > _RECENT_EXITS_MAX:
+            _recent_entries.popitem(last=False)
+    return session, future
+
+
+def submit_entry(card_id: str, idempotency_key: Optional[str] = None):
+    """
+    Quyết định xe vào hoàn toàn trên RAM rồi xếp hàng ghi SQLite.
+    Gọi lại với cùng idempotency_key (quét trùng, retry) trả về phiên đã tạo.
+
+    Returns: (status, session hoặc None, Future ack bền vững hoặc None nếu không ghi gì)
+    """
+    card_id = card_id.strip().upper()
+    card = get_card(card_id)
+    if not card:
+        return ENTRY_UNKNOWN_CARD, None, None
+    if not _active_index.loaded:
+        _load_active_index()
+    if idempotency_key and idempotency_key not in _recent_entries:
+        # Key của phiên cũ hơn (có thể đã đóng): tra SQLite trước khi quyết định,
+        # không để INSERT trùng entry_key lỗi sau khi barrier đã mở
+        with _reader() as cursor:
+            existing = _find_session(cursor, "entry_key", idempotency_key)
+        if existing:
+            return ENTRY_REPLAYED, existing, None
+
+    while True:
+        with _decision_lock:
+            recent = _recent_entries.get(idempotency_key) if idempotency_key else None
+            if recent is not None:
+                return ENTRY_REPLAYED, _active_index.get_by_id(recent.id) or recent, None
+            active = _active_index.get_by_card(card_id)
+            if active:
+                return ENTRY_ALREADY_INSIDE, active, None
+            slot_number = _slot_allocator.peek()
+            if slot_number is None:
+                return ENTRY_FULL, None, None
+            session, future = _reserve_entry(card_id, card.plate_number or "", slot_number, idempotency_key)
+        if future is not None:
+            break
+        _get_db_writer().wait_for_space()
+    print(f"[DB] Created session {session.id} for card {card_id}, slot {slot_number}")
+    return ENTRY_CREATED, session, future
+
+
+def _find_session(cursor: sqlite3.Cursor, column: str, value) -> Optional[Session]:
     cursor.execute(
-        "SELECT * FROM sessions ORDER BY created_at DESC LIMIT ?", (limit,)
+        "SELECT id, card_id, plate_number, slot_number, entry_time, exit_time, fee, payment_status "
+        f"FROM sessions WHERE {column} = ?", (value,)
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [{
-        "id": r[0], "card_id": r[1], "plate_number": r[2], "slot_number": r[3],
-        "entry_time": r[4], "exit_time": r[5], "fee": r[6], "payment_status": r[7]
-    } for r in rows]
+    row = cursor.fetchone()
+    return Session(*row) if row else None
+
+
+def get_active_session(card_id: str) -> Optional[Session]:
+    """Phiên đang mở của thẻ - tra từ index in-memory, không đọc SQLite"""
+    # Normalize card_id
+    card_id = card_id.strip().upper()
+    if not _active_index.loaded:
+        _load_active_index()
+    return _active_index.get_by_card(card_id)
+
+
+def get_session_by_slot(slot_number: int) -> Optional[Session]:
+    """Phiên đang chiếm slot (nếu có)"""
+    if not _active_index.loaded:
+        _load_active_index()
+    return _active_index.get_by_slot(slot_number)
+
+
+def submit_close(session_id: int, fee: int, idempotency_key: Optional[str] = None,
+                 payment_method: str = PAYMENT_CASH):
+    """
+    Đóng phiên trên RAM (giải phóng slot ngay) rồi xếp hàng UPDATE.
+    Gọi lại với cùng idempotency_key là an toàn.
+
+    Returns: (status, session hoặc None, Future ack hoặc None)
+    """
+    while True:
+        with _decision_lock:
+            if idempotency_key and idempotency_key in _recent_exits:
+                return EXIT_REPLAYED, _recent_exits[idempotency_key], None
+            active = _active_index.get_by_id(session_id)
+            if active is None:
+                break
+            session = replace(active, exit_time=now_ms(), fee=fee, payment_status="paid",
+                              payment_method=payment_method, exit_key=idempotency_key)
+            future = _try_submit(_write_exit, session, lambda e, s=session: _undo_exit(s, e))
+            if future is not None:
+                _active_index.remove(session_id)
+                _slot_allocator.release(session.slot_number)
+                if session.entry_key in _recent_entries:
+                    _recent_entries[session.entry_key] = session
+                if idempotency_key:
+                    _recent_exits[idempotency_key] = session
+                    while len(_recent_exits) > _RECENT_EXITS_MAX:
+                        _recent_exits.popitem(last=False)
+                return EXIT_CLOSED, session, future
+        _get_db_writer().wait_for_space()
+
+    # Không còn trong RAM -> phiên không tồn tại hoặc đã đóng từ trước
+    with _reader() as cursor:
+        cursor.execute("SELECT exit_key FROM sessions WHERE id = ?", (session_id,))
+        row = cursor.fetchone()
+        session = _find_session(cursor, "id", session_id) if row else None
+    if not row:
+        return EXIT_NOT_FOUND, None, None
+    if idempotency_key and row[0] == idempotency_key:
+        return EXIT_REPLAYED, session, None
+    return EXIT_ALREADY_CLOSED, session, None
+
+
+def get_sessions_page(after: Optional[Tuple[int, int]] = None, limit: int = 50,
+                      start: Optional[int] = None, end: Optional[int] = None,
+                      card_id: Optional[str] = None, plate: Optional[str] = None,
+                      include_archive: bool = False):
+    """
+    Một trang lịch sử (mới nhất trước). Trang kế tiếp: truyền lại next_cursor vào `after`.
+    start/end: khoảng thời gian vào [start, end) theo epoch ms
+    include_archive: đọc cả các file lưu trữ theo tháng (chậm hơn, cho tra cứu/báo cáo)
+
+    Returns: (sessions, next_cursor hoặc None nếu đã hết)
+    """
+    if include_archive:
+        rows = _history_span(after, limit + 1, start, end, card_id, plate)
+    else:
+        sql, params = _history_query(after, limit + 1, start, end, card_id, plate)
+        with _reader() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][8], rows[-1][0])
+    return [Session(*r[:8]) for r in rows], next_cursor
+
+
+def get_recent_sessions(limit: int = 20) -> List[Session]:
+    return get_sessions_page(limit=limit)[0]
+
+
+def search_sessions(text: str, limit: int = 20, open_only: bool = False) -> List[Session]:
+    """
+    Tìm phiên theo tiền tố mã thẻ / biển số hoặc từ trong biển số.
+    open_only: chỉ xe còn trong bãi - lọc thẳng trên index RAM (vài trăm phiên), không query.
+    """
+    if not text or not text.strip():
+        return []
+    if open_only:
+        card_prefix, plate_prefix = text.strip().upper(), normalize_plate(text)
+        matches = [s for s in _active_index.all()
+                   if s.card_id.startswith(card_prefix)
+                   or (plate_prefix and normalize_plate(s.plate_number or "").startswith(plate_prefix))]
+        matches.sort(key=lambda s: s.entry_time, reverse=True)
+        return matches[:limit]
+    with _reader() as cursor:
+        return _run_search(cursor, _SQL_SEARCH_SESSIONS, text, limit, lambda row: Session(*row))
+
+
+def count_sessions(start: int, end: int, include_archive: bool = False) -> int:
+    """Số phiên vào trong [start, end) epoch ms"""
+    sql = "SELECT COUNT(*) FROM sessions WHERE created_at >= ? AND created_at < ?"
+    flush_writes()
+    with _reader() as cursor:
+        cursor.execute(sql, (start, end))
+        count = cursor.fetchone()[0]
+    if include_archive:
+        for month in _archive_months_between(start, end):
+            count += _archive_rows(month, sql, (start, end))[0][0]
+    return count
+
+
+def iter_sessions(start: int, end: int, batch_size: int = 1000,
+                  include_archive: bool = False) -> Iterator[Session]:
+    """
+    Các phiên vào trong [start, end), cũ nhất trước, đọc dần bằng fetchmany.
+    Một câu SELECT = một snapshot WAL: số liệu nhất quán, không chặn ghi.
+    Dùng trên thread của caller - mỗi thread có kết nối reader riêng.
+    include_archive: ghép (merge theo thứ tự) với các file lưu trữ, từng tháng một.
+    """
+    flush_writes()
+    segments = _archive_segments(start, end) if include_archive else [(start, end, None)]
+    for lo, hi, month in segments:
+        with _reader() as cursor:
+            cursor.execute(_SQL_EXPORT_SESSIONS, (lo, hi))
+            rows = _fetch_iter(cursor, batch_size)
+            if month is not None:
+                rows = _merge_rows(rows, _archive_iter(month, _SQL_EXPORT_SESSIONS, (lo, hi), batch_size),
+                                   key=lambda r: (r[11], r[0]))
+            for row in rows:
+                yield Session(*row[:11])
 
 
 # === Slot Operations ===
+# Bảng slots là nguồn lưu trữ; SlotAllocator giữ trạng thái trong RAM để chọn slot O(log n)
+
+_slot_allocator = SlotAllocator(PARKING_CONFIG.get("slot_strategy", "lowest"))
+
+
+def _load_slot_allocator(keep_occupancy: bool = False):
+    """
+    Dựng lại allocator từ bảng slots.
+    keep_occupancy: giữ trạng thái chiếm trong RAM (gồm slot đã cấp mà lệnh ghi còn xếp hàng),
+    dùng khi chỉ đổi zone/distance lúc app đang chạy
+    """
+    with _reader() as cursor:
+        cursor.execute("SELECT slot_number, zone, distance, is_occupied FROM slots")
+        rows = cursor.fetchall()
+    with _decision_lock:
+        # List (không phải generator): load() xóa trạng thái cũ trước khi đọc
+        slots = [{"slot_number": r[0], "zone": r[1], "distance": r[2],
+                  "is_occupied": not _slot_allocator.is_free(r[0]) if keep_occupancy else r[3]}
+                 for r in rows]
+        _slot_allocator.load(slots)
+
 
 def get_available_slot() -> Optional[int]:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT slot_number FROM slots WHERE is_occupied = 0 ORDER BY slot_number LIMIT 1")
-    row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else None
+    return _slot_allocator.peek()
+
+
+def configure_slot(slot_number: int, zone: Optional[str] = None, distance: Optional[int] = None) -> bool:
+    """Gán khu/tầng và khoảng cách tới lối vào cho một slot"""
+    with _writer() as cursor:
+        cursor.execute(
+            "UPDATE slots SET zone = COALESCE(?, zone), distance = COALESCE(?, distance) WHERE slot_number = ?",
+            (zone, distance, slot_number)
+        )
+        affected = cursor.rowcount
+    if affected:
+        _load_slot_allocator(keep_occupancy=True)
+    return affected > 0
+
+
+def get_slot_stats() -> SlotStats:
+    return SlotStats(**_slot_allocator.stats())
+
+
+def get_slot_layout() -> List[Tuple[int, str]]:
+    """Sơ đồ slot cho dashboard: [(slot_number, zone), ...]"""
+    return _slot_allocator.layout()
+
+
+def get_zone_stats() -> Dict[str, int]:
+    """Số slot trống theo khu/tầng"""
+    return _slot_allocator.zone_stats()
+
 
+# === Revenue ===
+# daily_revenue / hourly_revenue được cộng dồn trong _write_exit, nên đọc doanh thu
+# chỉ chạm vài dòng dù lịch sử sessions lớn tới đâu.
 
-def get_slot_stats() -> Dict:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM slots")
-    total = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM slots WHERE is_occupied = 1")
-    occupied = cursor.fetchone()[0]
-    conn.close()
-    return {"total": total, "occupied": occupied, "available": total - occupied}
+def _rollup_selects():
+    """(bảng, cột khóa, SELECT tổng hợp từ sessions) cho daily_revenue / hourly_revenue"""
+    for table, column, fmt in (("daily_revenue", "day", "%Y-%m-%d"), ("hourly_revenue", "hour", "%Y-%m-%d %H")):
+        yield table, column, f"""
+            SELECT strftime('{fmt}', exit_time / 1000, 'unixepoch', 'localtime'), COALESCE(payment_method, 'unknown'),
+                   COALESCE(SUM(fee), 0), COUNT(*)
+            FROM sessions
+            WHERE payment_status = 'paid' AND exit_time IS NOT NULL
+            GROUP BY 1, 2
+        """
+
+
+def _rebuild_revenue_rollups(cursor: sqlite3.Cursor):
+    """Tính lại từ bảng sessions của DB chính (migration; rebuild_revenue_rollups cộng thêm lưu trữ)"""
+    cursor.execute("DELETE FROM daily_revenue")
+    cursor.execute("DELETE FROM hourly_revenue")
+    for table, column, sql in _rollup_selects():
+        cursor.execute(f"INSERT INTO {table} ({column}, payment_method, total_fee, session_count) {sql}")
+
+
+def rebuild_revenue_rollups():
+    """Tính lại toàn bộ bảng tổng hợp doanh thu từ sessions (kể cả các file lưu trữ)"""
+    flush_writes()
+    archived = {
+        table: [row for month in archive_months() for row in _archive_rows(month, sql)]
+        for table, _, sql in _rollup_selects()
+    }
+    with _writer() as cursor:
+        _rebuild_revenue_rollups(cursor)
+        for table, column, _ in _rollup_selects():
+            cursor.executemany(
+                f"INSERT INTO {table} ({column}, payment_method, total_fee, session_count) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT({column}, payment_method) DO UPDATE SET "
+                "total_fee = total_fee + excluded.total_fee, session_count = session_count + excluded.session_count",
+                archived[table]
+            )
+        cursor.execute("SELECT COUNT(*) FROM daily_revenue")
+        days = cursor.fetchone()[0]
+    print(f"[DB] Revenue rollups rebuilt: {days} day/method rows")
 
 
 def get_today_revenue() -> int:
-    conn = get_connection()
-    cursor = conn.cursor()
-    today = datetime.now().strftime("%Y-%m-%d")
+    with _reader() as cursor:
+        cursor.execute(_SQL_DAY_REVENUE, (day_key(now_ms()),))
+        revenue = cursor.fetchone()[0]
+    return revenue
+
+
+def get_revenue_by_method(day: Optional[str] = None) -> Dict[str, Dict]:
+    """Doanh thu một ngày (mặc định hôm nay) theo phương thức: {method: {fee, count}}"""
+    day = day or day_key(now_ms())
+    with _reader() as cursor:
+        cursor.execute(
+            "SELECT payment_method, total_fee, session_count FROM daily_revenue WHERE day = ?", (day,)
+        )
+        rows = cursor.fetchall()
+    return {r[0]: {"fee": r[1], "count": r[2]} for r in rows}
+
+
+def get_hourly_revenue(start: datetime, end: datetime) -> List[Dict]:
+    """Doanh thu theo giờ trong [start, end) - dùng cho báo cáo ca"""
+    flush_writes()
+    with _reader() as cursor:
+        cursor.execute(
+            "SELECT hour, payment_method, total_fee, session_count FROM hourly_revenue "
+            "WHERE hour >= ? AND hour < ? ORDER BY hour",
+            (start.strftime("%Y-%m-%d %H"), end.strftime("%Y-%m-%d %H"))
+        )
+        rows = cursor.fetchall()
+    return [{"hour": r[0], "payment_method": r[1], "fee": r[2], "count": r[3]} for r in rows]
+
+
+# === MQTT Command Outbox ===
+# Lệnh barrier/LCD được ghi qua DBWriter (group commit) song song với lúc gửi, nên
+# không chờ fsync trên đường mở barrier; app khởi động lại thì gửi tiếp lệnh còn hạn.
+
+COMMAND_PENDING = "pending"     # Chờ ack (hoặc chờ kết nối để gửi)
+COMMAND_ACKED = "acked"
+COMMAND_SENT = "sent"           # Đã tới broker; thiết bị không hỗ trợ ack
+COMMAND_EXPIRED = "expired"     # Quá hạn khi chưa có ack -> bỏ, không gửi muộn
+COMMAND_REJECTED = "rejected"   # ESP32 ack với ok=false (nhận được nhưng không thực hiện)
+
+
+def _write_command(cursor: sqlite3.Cursor, command: Command):
     cursor.execute(
-        "SELECT COALESCE(SUM(fee), 0) FROM sessions WHERE DATE(exit_time) = ? AND payment_status = 'paid'",
-        (today,)
+        "INSERT OR IGNORE INTO mqtt_commands (cmd_id, topic, payload, created_at, expires_at, attempts, status) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (command.cmd_id, command.topic, command.payload, command.created_at, command.expires_at,
+         command.attempts, command.status)
     )
-    revenue = cursor.fetchone()[0]
-    conn.close()
-    return revenue
+
+
+def _write_command_status(cursor: sqlite3.Cursor, cmd_id: str, status: str, attempts: int,
+                          acked_at: Optional[int], rtt_ms: Optional[float]):
+    cursor.execute(
+        "UPDATE mqtt_commands SET status = ?, attempts = ?, acked_at = ?, rtt_ms = ? WHERE cmd_id = ?",
+        (status, attempts, acked_at, rtt_ms, cmd_id)
+    )
+
+
+def submit_command(command: Command):
+    """Xếp hàng lưu lệnh mới; trả về Future hoàn tất khi đã commit"""
+    return _get_db_writer().submit(_write_command, command)
+
+
+def submit_command_status(cmd_id: str, status: str, attempts: int, rtt_ms: Optional[float] = None):
+    acked_at = now_ms() if status == COMMAND_ACKED else None
+    return _get_db_writer().submit(_write_command_status, cmd_id, status, attempts, acked_at, rtt_ms)
+
+
+def get_pending_commands(now: Optional[int] = None) -> List[Command]:
+    """Lệnh chưa ack và còn hạn, cũ nhất trước"""
+    with _reader() as cursor:
+        cursor.execute(_SQL_PENDING_COMMANDS, (now_ms() if now is None else now,))
+        return [Command(*row) for row in cursor.fetchall()]
+
+
+def prune_commands(keep_days: int) -> Dict[str, int]:
+    """Lệnh chờ đã quá hạn -> expired; xóa lệnh đã xong cũ hơn keep_days"""
+    now = now_ms()
+    with _writer() as cursor:
+        cursor.execute("UPDATE mqtt_commands SET status = ? WHERE status = ? AND expires_at <= ?",
+                       (COMMAND_EXPIRED, COMMAND_PENDING, now))
+        expired = cursor.rowcount
+        cursor.execute("DELETE FROM mqtt_commands WHERE status != ? AND created_at < ?",
+                       (COMMAND_PENDING, now - keep_days * 86_400_000))
+        deleted = cursor.rowcount
+    if expired or deleted:
+        print(f"[DB] Commands: {expired} expired, {deleted} pruned")
+    return {"expired": expired, "deleted": deleted}
+
+
+# === Archive ===
+# Phiên đã đóng quá ARCHIVE_CONFIG["after_days"] được chuyển sang archive/sessions_YYYY-MM.db
+# (theo tháng của created_at). DB chính chỉ giữ dữ liệu nóng; truy vấn cần lịch sử cũ
+# truyền include_archive=True và đọc thêm từng file tháng bằng kết nối chỉ-đọc riêng.
+
+_ARCHIVE_FILE_RE = re.compile(r"sessions_(\d{4}-\d{2})\.db")
+_ARCHIVE_COLUMNS = (
+    "id, card_id, plate_number, slot_number, entry_time, exit_time, fee, payment_status, "
+    "created_at, entry_key, exit_key, payment_method"
+)
+_MAX_MS = 1 << 62
+
+
+def _create_archive_schema(cursor: sqlite3.Cursor, schema: str):
+    """Bảng sessions trong file lưu trữ: cùng cột + index như DB chính để dùng chung câu query"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.sessions (
+            id INTEGER PRIMARY KEY,
+            card_id TEXT NOT NULL,
+            plate_number TEXT,
+            slot_number INTEGER,
+            entry_time INTEGER NOT NULL,
+            exit_time INTEGER,
+            fee INTEGER DEFAULT 0,
+            payment_status TEXT,
+            created_at INTEGER,
+            entry_key TEXT,
+            exit_key TEXT,
+            payment_method TEXT,
+            plate_key TEXT GENERATED ALWAYS AS ({_PLATE_KEY_SQL}) VIRTUAL
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_archive_created ON sessions(created_at, id)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_archive_card ON sessions(card_id, created_at, id)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_archive_plate ON sessions(plate_key, created_at, id)")
+
+
+def archive_path(month: str) -> str:
+    return os.path.join(ARCHIVE_CONFIG["dir"], f"sessions_{month}.db")
+
+
+def archive_months() -> List[str]:
+    """Các tháng (YYYY-MM) đã có file lưu trữ, cũ nhất trước"""
+    try:
+        names = os.listdir(ARCHIVE_CONFIG["dir"])
+    except FileNotFoundError:
+        return []
+    return sorted(m.group(1) for m in map(_ARCHIVE_FILE_RE.fullmatch, names) if m)
+
+
+def _month_bounds(month: str) -> Tuple[int, int]:
+    year, mon = month.split("-")
+    return month_range(int(year), int(mon))
+
+
+def _archive_months_between(start: int, end: int) -> List[str]:
+    return [m for m in archive_months() if _month_bounds(m)[0] < end and _month_bounds(m)[1] > start]
+
+
+def _archive_segments(start: Optional[int], end: Optional[int]) -> List[Tuple[int, int, Optional[str]]]:
+    """
+    Chia [start, end) thành các đoạn liên tiếp (cũ -> mới): đoạn trùng một tháng có file
+    lưu trữ mang tên tháng đó (đọc DB chính + file tháng), còn lại chỉ đọc DB chính.
+    """
+    start = 0 if start is None else start
+    end = _MAX_MS if end is None else end
+    segments, cursor = [], start
+    for month in _archive_months_between(start, end):
+        lo, hi = _month_bounds(month)
+        lo, hi = max(lo, start), min(hi, end)
+        if cursor < lo:
+            segments.append((cursor, lo, None))
+        segments.append((lo, hi, month))
+        cursor = hi
+    if cursor < end:
+        segments.append((cursor, end, None))
+    return segments
+
+
+def _open_archive(month: str) -> sqlite3.Connection:
+    path = archive_path(month).replace("\\", "/")
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=DATABASE_CONFIG["busy_timeout_ms"] / 1000)
+
+
+def _archive_rows(month: str, sql: str, params: tuple = ()) -> list:
+    conn = _open_archive(month)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def _archive_iter(month: str, sql: str, params: tuple, batch_size: int) -> Iterator[tuple]:
+    conn = _open_archive(month)
+    try:
+        yield from _fetch_iter(conn.execute(sql, params), batch_size)
+    finally:
+        conn.close()
+
+
+def _fetch_iter(cursor: sqlite3.Cursor, batch_size: int) -> Iterator[tuple]:
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _merge_rows(hot: Iterable[tuple], archived: Iterable[tuple], key, reverse: bool = False) -> Iterator[tuple]:
+    """Ghép hai luồng đã sắp xếp; bỏ dòng trùng id (lần lưu trữ bị ngắt giữa chừng)"""
+    last_id = None
+    for row in heapq.merge(hot, archived, key=key, reverse=reverse):
+        if row[0] != last_id:
+            last_id = row[0]
+            yield row
+
+
+def _history_span(after: Optional[Tuple[int, int]], limit: int, start: Optional[int], end: Optional[int],
+                  card_id: Optional[str], plate: Optional[str]) -> list:
+    """Một trang lịch sử trải qua DB chính + file lưu trữ, duyệt từng đoạn thời gian từ mới về cũ"""
+    rows = []
+    for lo, hi, month in reversed(_archive_segments(start, end)):
+        if after is not None and lo > after[0]:
+            continue
+        sql, params = _history_query(after, limit - len(rows), lo, hi, card_id, plate)
+        with _reader() as cursor:
+            part = cursor.execute(sql, params).fetchall()
+        if month is not None:
+            part = list(_merge_rows(part, _archive_rows(month, sql, params),
+                                    key=lambda r: (r[8], r[0]), reverse=True))
+        rows.extend(part[:limit - len(rows)])
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def archive_sessions(older_than_days: Optional[int] = None) -> Dict[str, int]:
+    """
+    Chuyển phiên đã đóng từ trước `older_than_days` ngày sang file lưu trữ theo tháng.
+    Mỗi lô: chép vào file tháng (INSERT OR IGNORE, commit) rồi mới xóa khỏi DB chính đúng
+    các id đã có trong file - bị ngắt giữa chừng thì chạy lại là đủ, không mất phiên nào.
+
+    Returns: {tháng: số phiên đã chuyển}
+    """
+    days = ARCHIVE_CONFIG["after_days"] if older_than_days is None else older_than_days
+    cutoff = now_ms() - days * 86_400_000
+    batch_size = ARCHIVE_CONFIG["batch_size"]
+    flush_writes()
+    with _reader() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT strftime('%Y-%m', created_at / 1000, 'unixepoch', 'localtime') "
+            "FROM sessions WHERE exit_time IS NOT NULL AND exit_time < ?", (cutoff,)
+        )
+        months = sorted(r[0] for r in cursor.fetchall())
+    if not months:
+        return {}
+
+    os.makedirs(ARCHIVE_CONFIG["dir"], exist_ok=True)
+    moved: Dict[str, int] = {}
+    for month in months:
+        lo, hi = _month_bounds(month)
+        where = "created_at >= ? AND created_at < ? AND exit_time IS NOT NULL AND exit_time < ?"
+        while True:
+            # Mỗi lô một lần giữ write lock: luồng vào/ra chỉ phải chờ một lô
+            with _write_lock:
+                conn = _get_writer_conn()
+                conn.execute("ATTACH DATABASE ? AS archive", (archive_path(month),))
+                try:
+                    with _writer() as cursor:
+                        _create_archive_schema(cursor, "archive")
+                        cursor.execute(
+                            f"SELECT id FROM main.sessions WHERE {where} LIMIT ?", (lo, hi, cutoff, batch_size)
+                        )
+                        ids = [r[0] for r in cursor.fetchall()]
+                        marks = ",".join("?" * len(ids))
+                        if ids:
+                            cursor.execute(
+                                f"INSERT OR IGNORE INTO archive.sessions ({_ARCHIVE_COLUMNS}) "
+                                f"SELECT {_ARCHIVE_COLUMNS} FROM main.sessions WHERE id IN ({marks})", ids
+                            )
+                    # Transaction riêng: commit nhiều file trong WAL không nguyên tử với nhau,
+                    # nên file lưu trữ phải commit xong trước khi xóa khỏi DB chính
+                    if ids:
+                        with _writer() as cursor:
+                            cursor.execute(
+                                f"DELETE FROM main.sessions WHERE id IN ({marks}) "
+                                "AND id IN (SELECT id FROM archive.sessions)", ids
+                            )
+                finally:
+                    conn.execute("DETACH DATABASE archive")
+            moved[month] = moved.get(month, 0) + len(ids)
+            if len(ids) < batch_size:
+                break
+    print(f"[DB] Archived sessions: {moved}")
+    return moved
+
@@ -0,0 +1,174 @@
+"""
+DB Tools - Lệnh bảo trì database chạy từ dòng lệnh
+
+    python -m src.db_tools rebuild-revenue
+    python -m src.db_tools configure-slots 1-10 --zone B1 --distance 40
+    python -m src.db_tools import-cards residents.csv --on-conflict update
+    python -m src.db_tools export-cards cards.json
+    python -m src.db_tools export-sessions 2026-09 sessions_2026-09.csv.gz
+    python -m src.db_tools archive-sessions --days 180
+    python -m src.db_tools backup
+    python -m src.db_tools restore --at "2026-09-30 23:00"     (tắt app trước khi restore)
+"""
+
+import argparse
+import sys
+
+from datetime import datetime
+
+from src import backup
+from src import card_io
+from src import database as db
+from src import session_export
+from src.timeutil import month_range
+
+
+def _cmd_rebuild_revenue(args):
+    db.rebuild_revenue_rollups()
+    print(f"Today: {db.get_today_revenue():,} VND {db.get_revenue_by_method()}")
+
+
+def _parse_slots(spec: str):
+    """"1-10,12" -> [1..10, 12]"""
+    numbers = []
+    for part in spec.split(","):
+        lo, _, hi = part.partition("-")
+        numbers.extend(range(int(lo), int(hi or lo) + 1))
+    return numbers
+
+
+def _cmd_configure_slots(args):
+    if args.zone is None and args.distance is None:
+        sys.exit("configure-slots: cần --zone và/hoặc --distance")
+    missing = [n for n in _parse_slots(args.slots) if not db.configure_slot(n, args.zone, args.distance)]
+    if missing:
+        print(f"Unknown slots: {missing}")
+    print(f"Zones (free slots): {db.get_zone_stats()}")
+
+
+def _cmd_import_cards(args):
+    fmt = args.format or card_io.detect_format(args.file)
+    with open(args.file, encoding="utf-8-sig", newline="") as f:
+        result = db.import_cards(
+            card_io.read_records(f, fmt), args.on_conflict, args.batch_size,
+            progress=lambda r: print(f"  {r.processed} records...", end="\r"),
+        )
+    print(f"Inserted {result.inserted}, updated {result.updated}, skipped {result.skipped}, "
+          f"errors {len(result.errors)}")
+    for record, reason in result.errors[:20]:
+        print(f"  record {record}: {reason}")
+
+
+def _cmd_export_cards(args):
+    fmt = args.format or card_io.detect_format(args.file)
+    with open(args.file, "w", encoding="utf-8", newline="") as f:
+        count = card_io.write_cards(f, db.iter_cards(), fmt)
+    print(f"Exported {count} cards to {args.file}")
+
+
+def _cmd_export_sessions(args):
+    year, month = map(int, args.month.split("-"))
+    start, end = month_range(year, month)
+    total = db.count_sessions(start, end, include_archive=True)
+    count = session_export.export_sessions(
+        args.file, start, end, progress=lambda n: print(f"  {n}/{total} sessions...", end="\r"),
+    )
+    print(f"\nExported {count} sessions to {args.file}")
+
+
+def _cmd_archive_sessions(args):
+    moved = db.archive_sessions(args.days)
+    print(f"Archived {sum(moved.values())} sessions")
+    for month, count in moved.items():
+        print(f"  {month}: {count} -> {db.archive_path(month)}")
+
+
+def _cmd_backup(args):
+    print(f"Backup: {backup.create_backup()}")
+
+
+def _cmd_list_backups(args):
+    for path, taken in backup.list_backups():
+        print(f"  {datetime.fromtimestamp(taken / 1000):%Y-%m-%d %H:%M:%S}  {path}")
+
+
+def _cmd_verify_backup(args):
+    paths = [args.file] if args.file else [p for p, _ in backup.list_backups()]
+    for path in paths:
+        problems = backup.verify_backup(path)
+        print(f"  {'OK ' if not problems else 'BAD'}  {path}  {'; '.join(problems[:3])}")
+
+
+def _cmd_restore(args):
+    if args.file:
+        path, safety = args.file, backup.restore_backup(args.file)
+    else:
+        path, safety = backup.restore_at(datetime.strptime(args.at, "%Y-%m-%d %H:%M"))
+    print(f"Restored {path}")
+    if safety:
+        print(f"Previous state saved as {safety}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.db_tools", description="Parking DB maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-revenue", help="Tính lại daily_revenue/hourly_revenue từ sessions")
+    p.set_defaults(func=_cmd_rebuild_revenue)
+
+    p = sub.add_parser("configure-slots", help="Gán khu/tầng và khoảng cách tới lối vào cho slot (app đang chạy cần khởi động lại)")
+    p.add_argument("slots", help="Danh sách slot, vd 1-10,12")
+    p.add_argument("--zone")
+    p.add_argument("--distance", type=int, help="Khoảng cách tới lối vào (strategy nearest/zone_balanced)")
+    p.set_defaults(func=_cmd_configure_slots)
+
+    formats = ("csv", "json", "jsonl")
+    p = sub.add_parser("import-cards", help="Nhập thẻ từ CSV/JSON/JSON Lines (một transaction)")
+    p.add_argument("file")
+    p.add_argument("--format", choices=formats, help="Mặc định theo đuôi file")
+    p.add_argument("--on-conflict", choices=(db.IMPORT_SKIP, db.IMPORT_UPDATE, db.IMPORT_FAIL),
+                   default=db.IMPORT_SKIP)
+    p.add_argument("--batch-size", type=int, default=500)
+    p.set_defaults(func=_cmd_import_cards)
+
+    p = sub.add_parser("export-cards", help="Xuất thẻ đang hoạt động ra CSV/JSON/JSON Lines")
+    p.add_argument("file")
+    p.add_argument("--format", choices=formats, help="Mặc định theo đuôi file")
+    p.set_defaults(func=_cmd_export_cards)
+
+    p = sub.add_parser("export-sessions", help="Xuất phiên của một tháng ra CSV (.csv.gz để nén)")
+    p.add_argument("month", help="YYYY-MM")
+    p.add_argument("file")
+    p.set_defaults(func=_cmd_export_sessions)
+
+    p = sub.add_parser("archive-sessions", help="Chuyển phiên đã đóng lâu ngày sang file lưu trữ theo tháng")
+    p.add_argument("--days", type=int, help="Mặc định ARCHIVE_CONFIG['after_days']")
+    p.set_defaults(func=_cmd_archive_sessions)
+
+    p = sub.add_parser("backup", help="Snapshot online parking.db vào thư mục backups")
+    p.set_defaults(func=_cmd_backup)
+
+    p = sub.add_parser("list-backups", help="Liệt kê snapshot")
+    p.set_defaults(func=_cmd_list_backups)
+
+    p = sub.add_parser("verify-backup", help="integrity_check một snapshot (mặc định: tất cả)")
+    p.add_argument("file", nargs="?")
+    p.set_defaults(func=_cmd_verify_backup)
+
+    p = sub.add_parser("restore", help="Khôi phục từ snapshot (app phải đang tắt)")
+    target = p.add_mutually_exclusive_group(required=True)
+    target.add_argument("file", nargs="?")
+    target.add_argument("--at", help="YYYY-MM-DD HH:MM - snapshot gần nhất trước thời điểm này")
+    p.set_defaults(func=_cmd_restore)
+
+    args = parser.parse_args(argv)
+    db.init_database()
+    try:
+        args.func(args)
+    finally:
+        db.close_connections()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
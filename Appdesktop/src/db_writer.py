@@ -0,0 +1,135 @@
+"""
+DB Writer - Thread ghi SQLite riêng với group commit
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+_STOP = object()
+
+
+class DBWriter(threading.Thread):
+    """
+    Nhận các thao tác ghi qua hàng đợi có giới hạn và commit theo lô.
+
+    Mỗi thao tác là op(cursor, *args), chạy trong SAVEPOINT riêng nên một thao tác
+    lỗi không kéo cả lô rollback. Future của thao tác chỉ hoàn tất SAU khi lô đã
+    COMMIT (WAL + synchronous=FULL trên kết nối writer) - tức là khi future báo
+    thành công thì dữ liệu đã bền vững, app crash hay mất điện cũng không mất.
+    Nếu thao tác thất bại, undo(error) được gọi TRƯỚC khi future báo lỗi.
+
+    transaction: context manager factory trả về cursor trong BEGIN ... COMMIT
+    """
+
+    def __init__(self, transaction: Callable, queue_size: int = 1024,
+                 max_batch: int = 64, linger_ms: float = 0):
+        super().__init__(name="db-writer", daemon=True)
+        self._transaction = transaction
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._max_batch = max_batch
+        self._linger = linger_ms / 1000
+        self._closed = False
+        self.batches = 0
+        self.ops = 0
+
+    def submit(self, op: Callable, *args, undo: Optional[Callable] = None, block: bool = True) -> Future:
+        """
+        Đưa thao tác ghi vào hàng đợi. Hàng đợi đầy: chặn tới khi có chỗ, hoặc
+        queue.Full nếu block=False (caller đang giữ lock mà undo cũng cần)
+        """
+        if self._closed:
+            raise RuntimeError("DBWriter is stopped")
+        future: Future = Future()
+        self._queue.put((future, op, args, undo), block=block)
+        return future
+
+    def wait_for_space(self, timeout: Optional[float] = None) -> bool:
+        """Chờ hàng đợi còn chỗ (dùng sau queue.Full, khi đã nhả lock)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.full() and self.is_alive():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Chờ mọi thao tác đã submit trước đó được commit"""
+        if self._closed or not self.is_alive():
+            return True
+        try:
+            self.submit(lambda cursor: None).result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def stop(self, timeout: float = 5):
+        """Commit nốt hàng đợi rồi dừng thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        if self.is_alive():
+            self.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "ops": self.ops,
+            "avg_batch": round(self.ops / self.batches, 2) if self.batches else 0,
+        }
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # Gom các thao tác đã xếp hàng trong lúc lô trước đang fsync
+            while len(batch) < self._max_batch:
+                try:
+                    item = self._queue.get(timeout=self._linger) if self._linger else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        batch = [b for b in batch if b[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = []
+        try:
+            with self._transaction() as cursor:
+                for future, op, args, undo in batch:
+                    cursor.execute("SAVEPOINT op")
+                    try:
+                        results.append((True, op(cursor, *args)))
+                        cursor.execute("RELEASE op")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO op")
+                        cursor.execute("RELEASE op")
+                        results.append((False, e))
+        except Exception as e:
+            print(f"[DBWriter] Batch of {len(batch)} failed: {e}")
+            results = [(False, e)] * len(batch)
+
+        self.batches += 1
+        self.ops += len(batch)
+        for (future, _, _, undo), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+                continue
+            if undo is not None:
+                try:
+                    undo(value)
+                except Exception as e:
+                    print(f"[DBWriter] Undo failed: {e}")
+            future.set_exception(value)
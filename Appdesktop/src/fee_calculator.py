@@ -4,26 +4,28 @@ Fee Calculator - Tính tiền gửi xe
 
 import math
 from datetime import datetime
+from typing import Optional, Union
 from src.config import PARKING_CONFIG
+from src.timeutil import now_ms, to_ms
 
 
-def calculate_fee(entry_time: datetime, exit_time: datetime = None) -> dict:
+def calculate_fee(entry_time: Union[int, datetime], exit_time: Optional[Union[int, datetime]] = None) -> dict:
     """
     Tính phí gửi xe
     Phí mặc định: 3000 VND khi vào
+    entry_time/exit_time: epoch ms (như lưu trong DB) hoặc datetime
     
     Returns:
         dict: {fee, duration_minutes, hours_charged, breakdown}
     """
     if exit_time is None:
-        exit_time = datetime.now()
+        exit_time = now_ms()
+    elif isinstance(exit_time, datetime):
+        exit_time = to_ms(exit_time)
+    if isinstance(entry_time, datetime):
+        entry_time = to_ms(entry_time)
     
-    # Parse entry_time nếu là string
-    if isinstance(entry_time, str):
-        entry_time = datetime.fromisoformat(entry_time)
-    
-    duration = exit_time - entry_time
-    duration_minutes = int(duration.total_seconds() / 60)
+    duration_minutes = (exit_time - entry_time) // 60000
     
     # Phí mặc định 3000 VND
     base_fee = 3000
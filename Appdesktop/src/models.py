@@ -1,14 +1,21 @@
 """
 Data Models
+
+Dataclass slots=True: không có __dict__ mỗi object, nhẹ hơn dict khi liệt kê
+hàng chục nghìn thẻ/phiên. Thứ tự field khớp thứ tự cột SELECT trong database.py
+nên tạo thẳng từ row: Card(*row), Session(*row).
+
+Object trả ra từ database được coi là bất biến (cache/index dùng chung, không copy);
+cần đổi trạng thái thì tạo object mới bằng dataclasses.replace().
 """
 
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 
 
-@dataclass
+@dataclass(slots=True)
 class Card:
+    id: int
     card_id: str
     owner_name: str = ""
     plate_number: str = ""
@@ -16,24 +23,50 @@ class Card:
     is_active: bool = True
 
 
-@dataclass
+@dataclass(slots=True)
 class Session:
     id: int
     card_id: str
     plate_number: str
     slot_number: int
-    entry_time: datetime
-    exit_time: Optional[datetime] = None
+    entry_time: int                     # epoch ms
+    exit_time: Optional[int] = None
     fee: int = 0
     payment_status: str = "pending"
-    
+    entry_key: Optional[str] = None
+    exit_key: Optional[str] = None
+    payment_method: Optional[str] = None
+
     @property
     def is_active(self) -> bool:
         return self.exit_time is None
 
 
-@dataclass
+@dataclass(slots=True)
 class SlotStats:
     total: int
     occupied: int
     available: int
+
+
+@dataclass(slots=True)
+class CardImportResult:
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)   # (dòng, lý do)
+
+    @property
+    def processed(self) -> int:
+        return self.inserted + self.updated + self.skipped + len(self.errors)
+
+
+@dataclass(slots=True)
+class Command:
+    cmd_id: str
+    topic: str
+    payload: str                        # JSON; mã hóa lại theo codec lúc gửi
+    created_at: int                     # epoch ms
+    expires_at: int                     # epoch ms
+    attempts: int = 0
+    status: str = "pending"
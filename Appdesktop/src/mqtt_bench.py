@@ -0,0 +1,135 @@
+"""
+MQTT Bench - Đo độ trễ quét thẻ -> lệnh mở barrier qua broker thật
+
+    python -m src.mqtt_bench --count 500
+
+Một client giả lập ESP32 publish lượt quét lên entry_card rồi chờ entry_open; phía app
+là MQTTClient thật (transport + signal Qt về thread chính) trả lệnh mở barrier ngay,
+không qua quyết định vào bãi - chỉ đo phần truyền nhận. Mỗi lượt gửi sau khi lượt
+trước đã nhận lệnh (closed loop), nên số đo là độ trễ từng lượt, không phải thông lượng.
+
+Client giả lập báo hỗ trợ ack và ack mọi lệnh như firmware; outbox lệnh ghi vào một
+database tạm, không đụng parking.db.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from PySide6.QtCore import QCoreApplication
+
+from src import database as db
+from src.config import MQTT_CONFIG, MQTT_TOPICS
+from src.mqtt_client import MQTTClient
+
+
+class _Esp32Simulator:
+    def __init__(self):
+        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                                  client_id="parking_bench_esp32")
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.ready = threading.Event()
+        self.opened = threading.Event()
+
+    def _on_connect(self, client, *args):
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)   # ack rồi quét liền sau
+        client.subscribe(MQTT_TOPICS["entry_open"])
+        self.ready.set()
+
+    def announce(self):
+        """Heartbeat báo hỗ trợ ack (như firmware)"""
+        self.client.publish(MQTT_TOPICS["esp32_heartbeat"], json.dumps({"mac": "bench", "ack": True}))
+
+    def _on_message(self, client, userdata, msg):
+        cmd_id = json.loads(msg.payload).get("cmd_id")
+        if cmd_id:
+            client.publish(MQTT_TOPICS["command_ack"], json.dumps({"cmd_id": cmd_id, "ok": True}))
+        self.opened.set()
+
+    def run(self, count: int, warmup: int, timeout: float) -> list:
+        samples = []
+        for i in range(warmup + count):
+            self.opened.clear()
+            payload = json.dumps({"card_id": "BENCH", "mac": "bench", "time": i})
+            started = time.perf_counter()
+            self.client.publish(MQTT_TOPICS["entry_card"], payload)
+            if not self.opened.wait(timeout):
+                raise TimeoutError(f"No barrier command for scan {i}")
+            if i >= warmup:
+                samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+
+def _report(samples: list):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    print(f"scan -> barrier latency over {len(samples)} scans (ms):")
+    print(f"  min {samples[0]:.3f}  p50 {pick(0.50):.3f}  p95 {pick(0.95):.3f}  "
+          f"p99 {pick(0.99):.3f}  max {samples[-1]:.3f}  mean {statistics.fmean(samples):.3f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.mqtt_bench", description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=2.0, help="Giây chờ mỗi lượt")
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    db.DATABASE_PATH = os.path.join(tmp_dir.name, "bench.db")
+    db.init_database()
+
+    app = QCoreApplication(sys.argv[:1])
+    client = MQTTClient()
+    client.entry_scan.connect(lambda card_id, scan_id: client.open_entry_barrier())
+
+    esp32 = _Esp32Simulator()
+    esp32.client.connect(MQTT_CONFIG["broker"], MQTT_CONFIG["port"])
+    esp32.client.loop_start()
+    result = {}
+
+    def drive():
+        try:
+            if not esp32.ready.wait(5):
+                raise TimeoutError("Simulator could not connect to broker")
+            deadline = time.monotonic() + 5
+            while not client.commands.acks_supported:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("App did not receive simulator heartbeat")
+                esp32.announce()
+                time.sleep(0.1)
+            result["samples"] = esp32.run(args.count, args.warmup, args.timeout)
+        except Exception as e:
+            result["error"] = e
+        finally:
+            app.quit()   # thread-safe
+
+    driver = threading.Thread(target=drive, daemon=True)
+    client.connected.connect(lambda: driver.is_alive() or result or driver.start())
+    client.connect()
+    app.exec()
+
+    esp32.client.loop_stop()
+    client.disconnect()
+    app.shutdown()
+    if "error" in result:
+        print(f"Benchmark failed: {result['error']}")
+        return 1
+    _report(result["samples"])
+    print(f"commands: {client.commands.stats()}")
+    db.flush_writes()
+    db.close_connections()
+    tmp_dir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,99 +2,315 @@
 MQTT Client - Kết nối ESP32 (Compatible với paho-mqtt v2.x)
 """
 
+import base64
 import json
 import logging
-from typing import Optional
+import re
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
 
-from PySide6.QtCore import QObject, Signal, QTimer, QThread
+from PySide6.QtCore import QObject, Signal
 import paho.mqtt.client as mqtt
 
-from src.config import MQTT_CONFIG, MQTT_TOPICS
+from src.command_outbox import CommandOutbox
+from src.config import COMMAND_CONFIG, MQTT_CONFIG, MQTT_TOPICS
+from src.mqtt_router import NETWORK, TopicRouter
+from src.slot_state import SlotState
+
+try:
+    import orjson
+except ImportError:     # Không có thì dùng json chuẩn
+    orjson = None
+try:
+    import msgpack
+except ImportError:     # Không có thì chỉ thương lượng được JSON
+    msgpack = None
 
 logger = logging.getLogger(__name__)
 
 
-class MQTTWorker(QThread):
-    """Worker thread cho MQTT để tránh blocking main thread"""
-    
+# === Codec ===
+
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"   # ArduinoJson có sẵn serializeMsgPack/deserializeMsgPack
+
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps(payload) -> bytes:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+# Byte đầu của một map MessagePack: fixmap, map16, map32
+_MSGPACK_MAP = frozenset(range(0x80, 0x90)) | {0xDE, 0xDF}
+
+
+def available_codecs() -> Tuple[str, ...]:
+    """Codec app dùng được, theo thứ tự ưu tiên"""
+    return (CODEC_MSGPACK, CODEC_JSON) if msgpack is not None else (CODEC_JSON,)
+
+
+def decode_payload(raw: bytes) -> Any:
+    """
+    Nhận diện codec theo byte đầu ('{' là JSON, map MessagePack là msgpack) nên
+    hai bên đổi codec lúc nào cũng không lệch. Payload quá lớn hoặc không phải
+    object bị từ chối trước khi parse.
+    """
+    if not raw:
+        raise ValueError("empty payload")
+    if len(raw) > MQTT_CONFIG["max_payload"]:
+        raise ValueError(f"payload too large ({len(raw)} bytes)")
+    first = raw[0]
+    if first == 0x7B:
+        return _json_loads(raw)
+    if first in _MSGPACK_MAP and msgpack is not None:
+        try:
+            return msgpack.unpackb(raw)
+        except Exception as e:
+            raise ValueError(f"bad msgpack: {e}") from None
+    raise ValueError(f"unsupported payload (first byte 0x{first:02x})")
+
+
+def encode_payload(payload: dict, codec: str = CODEC_JSON) -> bytes:
+    if codec == CODEC_MSGPACK:
+        return msgpack.packb(payload)
+    return _json_dumps(payload)
+
+
+def compile_schema(fields: Dict[str, Any], required: Iterable[str] = (),
+                   check: Optional[Callable[[dict], bool]] = None) -> Callable[[Any], dict]:
+    """
+    fields: tên -> kiểu (hoặc tuple kiểu). Trả về validator(payload) -> payload,
+    ValueError nếu thiếu field bắt buộc, sai kiểu hoặc không qua `check`.
+    Field int không nhận true/false.
+    """
+    specs = []
+    for name, types in fields.items():
+        types = types if isinstance(types, tuple) else (types,)
+        specs.append((name, types, bool not in types))
+    specs = tuple(specs)
+    required = tuple(required)
+
+    def validate(payload: Any) -> dict:
+        if type(payload) is not dict:
+            raise ValueError("payload is not an object")
+        for name in required:
+            if payload.get(name) is None:
+                raise ValueError(f"missing {name}")
+        for name, types, no_bool in specs:
+            value = payload.get(name)
+            if value is None:
+                continue
+            if not isinstance(value, types) or (no_bool and value.__class__ is bool):
+                raise ValueError(f"{name} has type {type(value).__name__}")
+        if check is not None and not check(payload):
+            raise ValueError("payload rejected by check")
+        return payload
+
+    return validate
+
+
+_CARD_ID_RE = re.compile(r"[0-9A-Za-z:_-]{1,32}")
+
+
+def _int_list(values) -> bool:
+    return all(v.__class__ is int for v in values)
+
+
+def _snapshot_bits(payload: dict) -> bool:
+    """Giải base64 ngay khi validate (thay bits bằng bytes) và khớp độ dài với count"""
+    bits = payload["bits"]
+    if isinstance(bits, str):
+        try:
+            bits = payload["bits"] = base64.b64decode(bits, validate=True)
+        except ValueError:
+            return False
+    return payload["count"] >= 0 and len(bits) == (payload["count"] + 7) // 8
+
+
+_CARD_SCAN = compile_schema({"card_id": str, "mac": str, "time": int}, required=("card_id",),
+                            check=lambda p: _CARD_ID_RE.fullmatch(p["card_id"]) is not None)
+
+# Validator theo key trong MQTT_TOPICS (payload ESP32 -> App)
+SCHEMAS: Dict[str, Callable[[Any], dict]] = {
+    "entry_card": _CARD_SCAN,
+    "exit_card": _CARD_SCAN,
+    "esp32_heartbeat": compile_schema(
+        {"ip": str, "rssi": int, "uptime": int, "version": str, "mac": str,
+         "codec": str, "codecs": list, "ack": bool}),
+    "command_ack": compile_schema({"cmd_id": str, "ok": bool}, required=("cmd_id",)),
+    "slot_status": compile_schema(
+        {"slots": list, "occupied": int, "available": int, "total": int}, required=("slots",),
+        check=lambda p: all(v.__class__ is bool for v in p["slots"])),
+    "slot_change": compile_schema(
+        {"slot": int, "occupied": bool, "time": int}, required=("slot", "occupied")),
+    "slot_snapshot": compile_schema(
+        {"seq": int, "count": int, "bits": (str, bytes)}, required=("seq", "count", "bits"),
+        check=_snapshot_bits),
+    "slot_delta": compile_schema(
+        {"seq": int, "on": list, "off": list}, required=("seq",),
+        check=lambda p: _int_list(p.get("on") or ()) and _int_list(p.get("off") or ())),
+}
+
+
+def topic_decoder(key: str) -> Callable[[bytes], dict]:
+    """Decoder cho router: giải mã rồi kiểm tra theo schema của topic"""
+    validate = SCHEMAS[key]
+    return lambda raw: validate(decode_payload(raw))
+
+
+class CodecNegotiator:
+    """
+    Mỗi ESP32 báo trong heartbeat các codec nó hiểu (`codecs`) và codec đang gửi
+    (`codec`). Lệnh App -> ESP32 đi chung topic nên dùng codec ưu tiên nhất mà mọi
+    thiết bị đã thấy đều hiểu; firmware cũ không báo `codecs` -> chỉ JSON.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices: Dict[str, Tuple[str, ...]] = {}   # mac -> codecs
+        self.outbound = CODEC_JSON
+
+    def update(self, heartbeat: dict) -> Optional[str]:
+        """Ghi nhận heartbeat; trả về codec cần báo cho thiết bị, None nếu đã khớp"""
+        offered = heartbeat.get("codecs") or (CODEC_JSON,)
+        mac = heartbeat.get("mac") or ""
+        with self._lock:
+            self._devices[mac] = tuple(c for c in offered if isinstance(c, str))
+            common = [c for c in available_codecs()
+                      if all(c in codecs for codecs in self._devices.values())]
+            self.outbound = common[0] if common else CODEC_JSON
+            current = heartbeat.get("codec", CODEC_JSON)
+        return None if current == self.outbound else self.outbound
+
+    def encode(self, payload: dict) -> bytes:
+        return encode_payload(payload, self.outbound)
+
+
+class MQTTTransport(QObject):
+    """
+    Một paho client cho cả vòng đời app; network thread chạy loop_forever của paho:
+
+    - Gói đến được xử lý ngay khi select() trả về - không polling theo chu kỳ.
+    - publish() ghi thẳng ra socket từ thread gọi (paho chỉ làm vậy khi không dùng
+      loop_start), nên lệnh mở barrier không phải chờ đánh thức network thread.
+    - Mất kết nối thì loop_forever tự reconnect trên cùng client (backoff reconnect_min_s..max_s).
+    - publish() gọi được từ mọi thread. Khi đang offline, lệnh được giữ trong outbox
+      (giới hạn số lượng và tuổi) và gửi theo thứ tự ngay khi kết nối lại.
+
+    Message đến đi thẳng vào `router` (trên network thread); signal trạng thái phát
+    từ network thread, Qt tự chuyển sang thread của receiver.
+    """
+
     connected = Signal()
     disconnected = Signal()
-    message_received = Signal(str, dict)  # topic, payload
     error = Signal(str)
-    
-    def __init__(self, parent=None):
+
+    def __init__(self, router: TopicRouter, parent=None):
         super().__init__(parent)
-        self.client: Optional[mqtt.Client] = None
-        self._running = False
-    
-    def run(self):
-        self._running = True
+        self._router = router
+        self._client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=MQTT_CONFIG["client_id"]
+        )
+        self._client.on_connect = self._on_connect
+        self._client.on_connect_fail = self._on_connect_fail
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_message = self._on_message
+        self._client.reconnect_delay_set(MQTT_CONFIG["reconnect_min_s"], MQTT_CONFIG["reconnect_max_s"])
+        if MQTT_CONFIG["username"]:
+            self._client.username_pw_set(MQTT_CONFIG["username"], MQTT_CONFIG["password"])
+
+        self._lock = threading.Lock()
+        self._online = False
+        self._outbox = deque(maxlen=MQTT_CONFIG["outbox_size"])   # (monotonic, topic, data)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._client.connect_async(MQTT_CONFIG["broker"], MQTT_CONFIG["port"], MQTT_CONFIG["keepalive"])
+        self._thread = threading.Thread(target=self._run, name="mqtt-network", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._lock:
+            self._online = False
+        # disconnect() cũng cắt ngang lúc đang chờ reconnect (paho kiểm tra mỗi giây)
+        self._client.disconnect()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
         try:
-            # Tạo client với callback_api_version cho paho-mqtt v2.x
-            self.client = mqtt.Client(
-                callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
-                client_id=MQTT_CONFIG["client_id"]
-            )
-            
-            self.client.on_connect = self._on_connect
-            self.client.on_disconnect = self._on_disconnect
-            self.client.on_message = self._on_message
-            
-            if MQTT_CONFIG["username"]:
-                self.client.username_pw_set(MQTT_CONFIG["username"], MQTT_CONFIG["password"])
-            
-            self.client.connect(
-                MQTT_CONFIG["broker"],
-                MQTT_CONFIG["port"],
-                MQTT_CONFIG["keepalive"]
-            )
-            
-            while self._running:
-                self.client.loop(timeout=1.0)
-                
+            self._client.loop_forever(retry_first_connection=True)
         except Exception as e:
-            logger.error(f"MQTT error: {e}")
+            logger.error(f"MQTT network thread stopped: {e}")
             self.error.emit(str(e))
-    
-    def stop(self):
-        self._running = False
-        if self.client:
-            self.client.disconnect()
-        self.wait()
-    
+
+    def publish(self, topic: str, data: bytes, qos: int = 0, queue: bool = True) -> bool:
+        """
+        False nếu đang offline: lệnh nằm trong outbox chờ kết nối lại, hoặc bị bỏ
+        nếu queue=False (caller tự gửi lại, vd. CommandOutbox)
+        """
+        with self._lock:
+            if self._online:
+                info = self._client.publish(topic, data, qos)
+                if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    return True
+            if queue:
+                self._outbox.append((time.monotonic(), topic, data))
+        return False
+
+    @property
+    def is_online(self) -> bool:
+        return self._online
+
+    # === Callback trên network thread ===
+
     def _on_connect(self, client, userdata, flags, reason_code, properties=None):
-        if reason_code == 0:
-            logger.info("MQTT connected successfully")
-            logger.info(f"Subscribing to: {MQTT_TOPICS['entry_card']}")
-            client.subscribe(MQTT_TOPICS["entry_card"])
-            logger.info(f"Subscribing to: {MQTT_TOPICS['exit_card']}")
-            client.subscribe(MQTT_TOPICS["exit_card"])
-            logger.info(f"Subscribing to: {MQTT_TOPICS['esp32_heartbeat']}")
-            client.subscribe(MQTT_TOPICS["esp32_heartbeat"])
-            client.subscribe(MQTT_TOPICS["slot_status"])
-            client.subscribe(MQTT_TOPICS["slot_change"])
-            self.connected.emit()
-        else:
+        if reason_code.is_failure:
             logger.error(f"MQTT connect failed: {reason_code}")
             self.error.emit(f"Connect failed: {reason_code}")
-    
+            return
+        # Lệnh nhỏ gửi liền nhau (barrier rồi LCD): tắt Nagle, không chờ ACK TCP của gói trước
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        logger.info(f"MQTT connected, subscribing to {MQTT_CONFIG['subscription']}")
+        client.subscribe(MQTT_CONFIG["subscription"])
+        self._flush_outbox()
+        self.connected.emit()
+
+    def _flush_outbox(self):
+        max_age = MQTT_CONFIG["outbox_max_age_ms"] / 1000
+        now = time.monotonic()
+        with self._lock:
+            while self._outbox:
+                queued_at, topic, data = self._outbox.popleft()
+                if now - queued_at > max_age:
+                    logger.warning(f"MQTT drop stale publish: {topic} {data}")
+                    continue
+                self._client.publish(topic, data)
+            self._online = True
+
+    def _on_connect_fail(self, client, userdata):
+        logger.warning(f"MQTT broker {MQTT_CONFIG['broker']}:{MQTT_CONFIG['port']} unreachable, retrying")
+        self.error.emit("Broker unreachable")
+
     def _on_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        with self._lock:
+            self._online = False
         logger.warning(f"MQTT disconnected: {reason_code}")
         self.disconnected.emit()
-    
+
     def _on_message(self, client, userdata, msg):
-        try:
-            topic = msg.topic
-            payload_str = msg.payload.decode()
-            logger.info(f"[MQTT RAW] Topic: {topic}, Payload: {payload_str}")
-            payload = json.loads(payload_str)
-            self.message_received.emit(topic, payload)
-        except Exception as e:
-            logger.error(f"MQTT message error: {e}")
-    
-    def publish(self, topic: str, payload: dict):
-        if self.client and self._running:
-            self.client.publish(topic, json.dumps(payload))
+        self._router.dispatch(msg.topic, msg.payload)
 
 
 class MQTTClient(QObject):
@@ -103,105 +319,156 @@ class MQTTClient(QObject):
     connected = Signal()
     disconnected = Signal()
     error = Signal(str)
-    entry_card_detected = Signal(str)
-    exit_card_detected = Signal(str)
+    entry_scan = Signal(str, str)     # card_id, scan_id (idempotency key)
+    exit_scan = Signal(str, str)      # card_id, scan_id
     esp32_heartbeat = Signal(dict)  # ESP32 heartbeat signal
-    slot_status_updated = Signal(dict)  # Trạng thái tất cả slot
-    slot_changed = Signal(int, bool)  # slot number, occupied
+    slot_state_changed = Signal()   # slot_state có slot đổi; lấy bằng slot_state.take_changes()
+    
+    _RESYNC_INTERVAL_S = 1.0        # Lệch seq liên tục thì cũng chỉ xin snapshot mỗi giây một lần
     
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.worker: Optional[MQTTWorker] = None
         self._is_connected = False
-        self.reconnect_timer = QTimer(self)
-        self.reconnect_timer.timeout.connect(self.connect)
+        self.slot_state = SlotState()
+        self._resync_at = 0.0
+        self.commands = CommandOutbox(self._publish_command, self)
+        # Handler ở đây chỉ lọc rồi emit signal (Qt tự chuyển sang thread chính),
+        # nên chạy luôn trên network thread. Handler đụng tới widget thì đăng ký GUI.
+        # Payload sai schema bị router bỏ ngay trên network thread, không tới ParkingService.
+        self.codec = CodecNegotiator()
+        self.router = TopicRouter(self)
+        for key, handler in (("entry_card", self._on_entry_card),
+                             ("exit_card", self._on_exit_card),
+                             ("esp32_heartbeat", self._on_heartbeat),
+                             ("slot_snapshot", self._on_slot_snapshot),
+                             ("slot_delta", self._on_slot_delta),
+                             ("command_ack", self._on_command_ack),
+                             ("slot_status", self._on_slot_status),
+                             ("slot_change", self._on_slot_change)):
+            self.router.add(MQTT_TOPICS[key], handler, decoder=topic_decoder(key), thread=NETWORK)
+        self.transport = MQTTTransport(self.router, self)
+        self.transport.connected.connect(self._on_connected)
+        self.transport.disconnected.connect(self._on_disconnected)
+        self.transport.error.connect(self.error)
     
     def connect(self):
-        if self.worker and self.worker.isRunning():
-            return
-        
-        self.reconnect_timer.stop()
-        
-        self.worker = MQTTWorker()
-        self.worker.connected.connect(self._on_connected)
-        self.worker.disconnected.connect(self._on_disconnected)
-        self.worker.message_received.connect(self._on_message)
-        self.worker.error.connect(self._on_error)
-        self.worker.start()
-        
+        """Bắt đầu kết nối (gọi lại nhiều lần không sao); reconnect do transport tự lo"""
         logger.info(f"Connecting to MQTT broker {MQTT_CONFIG['broker']}:{MQTT_CONFIG['port']}")
+        self.transport.start()
     
     def disconnect(self):
-        self.reconnect_timer.stop()
-        if self.worker:
-            self.worker.stop()
-            self.worker = None
+        self.transport.stop()
         self._is_connected = False
     
     def _on_connected(self):
         self._is_connected = True
         self.connected.emit()
+        self._request_resync()
     
     def _on_disconnected(self):
         self._is_connected = False
         self.disconnected.emit()
-        # Auto reconnect sau 5s
-        if not self.reconnect_timer.isActive():
-            self.reconnect_timer.start(5000)
-    
-    def _on_message(self, topic: str, payload: dict):
-        logger.info(f"[MQTTClient] Received: {topic} -> {payload}")
-        
-        if topic == MQTT_TOPICS["entry_card"]:
-            card_id = payload.get("card_id", "")
-            if card_id:
-                self.entry_card_detected.emit(card_id)
-        elif topic == MQTT_TOPICS["exit_card"]:
-            card_id = payload.get("card_id", "")
-            if card_id:
-                self.exit_card_detected.emit(card_id)
-        elif topic == MQTT_TOPICS["esp32_heartbeat"]:
-            logger.info(f"[ESP32 HEARTBEAT] Received: {payload}")
-            self.esp32_heartbeat.emit(payload)
-        elif topic == MQTT_TOPICS["slot_status"]:
-            logger.info(f"[SLOT STATUS] Received: {payload}")
-            self.slot_status_updated.emit(payload)
-        elif topic == MQTT_TOPICS["slot_change"]:
-            slot = payload.get("slot", 0)
-            occupied = payload.get("occupied", False)
-            logger.info(f"[SLOT CHANGE] Slot {slot}: {'Occupied' if occupied else 'Available'}")
-            self.slot_changed.emit(slot, occupied)
-    
-    def _on_error(self, msg: str):
-        self.error.emit(msg)
-        if not self.reconnect_timer.isActive():
-            self.reconnect_timer.start(5000)
+    
+    # === Handler trên network thread ===
+    
+    def _on_entry_card(self, payload: dict):
+        card_id = payload.get("card_id", "")
+        if card_id:
+            self.entry_scan.emit(card_id, self._scan_id(payload))
+    
+    def _on_exit_card(self, payload: dict):
+        card_id = payload.get("card_id", "")
+        if card_id:
+            self.exit_scan.emit(card_id, self._scan_id(payload))
+    
+    def _on_heartbeat(self, payload: dict):
+        logger.debug(f"[ESP32 HEARTBEAT] Received: {payload}")
+        # Firmware báo "ack": true thì lệnh được gửi lại tới khi có ack; firmware cũ: gửi một lần
+        self.commands.acks_supported = bool(payload.get("ack"))
+        codec = self.codec.update(payload)
+        if codec is not None:
+            # Luôn gửi bằng JSON: thiết bị chưa đổi codec vẫn đọc được
+            logger.info(f"[MQTT] Codec for {payload.get('mac', '?')}: {codec}")
+            self.transport.publish(MQTT_TOPICS["codec"], encode_payload({"codec": codec}))
+        self.esp32_heartbeat.emit(payload)
+    
+    def _on_command_ack(self, payload: dict):
+        self.commands.ack(payload["cmd_id"], payload.get("ok", True))
+    
+    def _on_slot_snapshot(self, payload: dict):
+        # bits đã được schema giải base64 và kiểm tra độ dài
+        if self.slot_state.apply_snapshot(payload["seq"], payload["count"], payload["bits"]):
+            self.slot_state_changed.emit()
+    
+    def _on_slot_delta(self, payload: dict):
+        applied = self.slot_state.apply_delta(payload["seq"], payload.get("on") or (), payload.get("off") or ())
+        if applied is None:
+            logger.warning(f"[SLOT] Delta seq {payload['seq']} out of order, requesting snapshot")
+            self._request_resync()
+        elif applied:
+            self.slot_state_changed.emit()
+    
+    def _on_slot_status(self, payload: dict):
+        """Firmware cũ: mảng bool đầy đủ"""
+        if self.slot_state.set_all(payload["slots"]):
+            self.slot_state_changed.emit()
+    
+    def _on_slot_change(self, payload: dict):
+        """Firmware cũ: một slot"""
+        if self.slot_state.set(payload["slot"], payload["occupied"]):
+            self.slot_state_changed.emit()
+    
+    def _request_resync(self):
+        now = time.monotonic()
+        if now - self._resync_at < self._RESYNC_INTERVAL_S:
+            return
+        self._resync_at = now
+        self.publish(MQTT_TOPICS["slot_resync"], {"seq": self.slot_state.seq})
+    
+    @staticmethod
+    def _scan_id(payload: dict) -> str:
+        """Mã lượt quét từ ESP32 (mac + millis lúc quét); gửi lại cùng lượt -> cùng mã"""
+        mac = payload.get("mac")
+        scan_time = payload.get("time")
+        if not mac or scan_time is None:
+            return ""
+        return f"{mac}:{scan_time}:{payload.get('card_id', '')}"
     
     def publish(self, topic: str, payload: dict):
-        if self.worker:
-            self.worker.publish(topic, payload)
+        if self.transport.publish(topic, self.codec.encode(payload)):
             logger.info(f"MQTT publish: {topic} -> {payload}")
+        else:
+            logger.warning(f"MQTT offline, queued: {topic} -> {payload}")
+    
+    def _publish_command(self, topic: str, payload: dict) -> bool:
+        return self.transport.publish(topic, self.codec.encode(payload), qos=1, queue=False)
+    
+    def send_command(self, topic: str, payload: dict, ttl_ms: int) -> str:
+        """Lệnh cần ESP32 xác nhận (lưu bền, gửi lại tới khi ack hoặc hết hạn)"""
+        cmd_id = self.commands.send(topic, payload, ttl_ms)
+        logger.info(f"MQTT command {cmd_id}: {topic} -> {payload}")
+        return cmd_id
     
     def open_entry_barrier(self):
-        self.publish(MQTT_TOPICS["entry_open"], {"action": "open"})
+        self.send_command(MQTT_TOPICS["entry_open"], {"action": "open"}, COMMAND_CONFIG["barrier_ttl_ms"])
     
     def open_exit_barrier(self):
-        self.publish(MQTT_TOPICS["exit_open"], {"action": "open"})
+        self.send_command(MQTT_TOPICS["exit_open"], {"action": "open"}, COMMAND_CONFIG["barrier_ttl_ms"])
     
     def send_status(self, slots_available: int):
         self.publish(MQTT_TOPICS["status"], {"slots_available": slots_available})
     
     def send_lcd_entry(self, card_id: str, slot: int):
         """Gửi thông báo xe vào hiển thị trên LCD"""
-        self.publish(MQTT_TOPICS["lcd_entry"], {"card_id": card_id, "slot": slot})
+        self.send_command(MQTT_TOPICS["lcd_entry"], {"card_id": card_id, "slot": slot}, COMMAND_CONFIG["lcd_ttl_ms"])
     
     def send_lcd_exit(self, card_id: str, fee: int):
         """Gửi thông báo xe ra hiển thị trên LCD"""
-        self.publish(MQTT_TOPICS["lcd_exit"], {"card_id": card_id, "fee": fee})
+        self.send_command(MQTT_TOPICS["lcd_exit"], {"card_id": card_id, "fee": fee}, COMMAND_CONFIG["lcd_ttl_ms"])
     
     def send_lcd_error(self, message: str):
         """Gửi thông báo lỗi hiển thị trên LCD"""
-        self.publish(MQTT_TOPICS["lcd_error"], {"message": message})
+        self.send_command(MQTT_TOPICS["lcd_error"], {"message": message}, COMMAND_CONFIG["lcd_ttl_ms"])
     
     @property
     def is_connected(self) -> bool:
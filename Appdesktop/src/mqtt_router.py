@@ -0,0 +1,96 @@
+"""
+MQTT Router - Bảng topic -> handler cho một subscription wildcard
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from PySide6.QtCore import QObject, Qt, Signal
+
+logger = logging.getLogger(__name__)
+
+# Handler chạy ở đâu
+NETWORK = "network"   # Ngay trên network thread (chỉ giải mã/lọc/emit signal)
+GUI = "gui"           # Chuyển sang thread của router (thread chính) một lần
+
+Decoder = Callable[[bytes], Any]
+
+
+def decode_json_object(raw: bytes) -> dict:
+    payload = json.loads(raw)
+    if not isinstance(payload, dict):
+        raise ValueError("payload is not a JSON object")
+    return payload
+
+
+class Route(NamedTuple):
+    handler: Callable[[Any], None]
+    decoder: Decoder
+    thread: str
+
+
+class TopicRouter(QObject):
+    """
+    dispatch(topic, raw) được gọi trên network thread cho mọi message của wildcard:
+    tra route O(1) theo topic, giải mã bằng decoder riêng của topic, rồi gọi handler
+    tại chỗ (NETWORK) hoặc qua đúng một lần chuyển thread (GUI).
+
+    Topic không có route (vd. lệnh app tự publish cũng khớp `parking/#`) bị bỏ ngay,
+    trước khi giải mã. Payload hỏng bị bỏ và tính vào `rejected`.
+    """
+
+    _deliver = Signal(object, object)   # handler, value
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._routes: Dict[str, Route] = {}
+        self._deliver.connect(self._run, Qt.QueuedConnection)
+        self.dispatched = 0
+        self.unrouted = 0
+        self.rejected = 0
+
+    def add(self, topic: str, handler: Callable[[Any], None],
+            decoder: Decoder = decode_json_object, thread: str = GUI):
+        if thread not in (NETWORK, GUI):
+            raise ValueError(f"Unknown handler thread: {thread}")
+        if topic in self._routes:
+            raise ValueError(f"Topic already routed: {topic}")
+        self._routes[topic] = Route(handler, decoder, thread)
+
+    def remove(self, topic: str):
+        self._routes.pop(topic, None)
+
+    def route(self, topic: str) -> Optional[Route]:
+        return self._routes.get(topic)
+
+    def dispatch(self, topic: str, raw: bytes):
+        route = self._routes.get(topic)
+        if route is None:
+            self.unrouted += 1
+            return
+        try:
+            value = route.decoder(raw)
+        except (ValueError, TypeError, KeyError) as e:
+            self.rejected += 1
+            logger.warning(f"MQTT bad payload on {topic}: {e}")
+            return
+        self.dispatched += 1
+        if route.thread == NETWORK:
+            self._run(route.handler, value)
+        else:
+            self._deliver.emit(route.handler, value)
+
+    def _run(self, handler, value):
+        try:
+            handler(value)
+        except Exception as e:
+            logger.error(f"MQTT handler {getattr(handler, '__name__', handler)} failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "routes": len(self._routes),
+            "dispatched": self.dispatched,
+            "unrouted": self.unrouted,
+            "rejected": self.rejected,
+        }
@@ -3,13 +3,17 @@ Parking Service - Xử lý nghiệp vụ vào/ra
 """
 
 import logging
+import time
 from typing import Optional, Tuple
-from datetime import datetime
 
 from PySide6.QtCore import QObject, Signal
 
+from src import backup
 from src import database as db
+from src.config import HISTORY_CONFIG, PARKING_CONFIG
 from src.fee_calculator import calculate_fee
+from src.models import Session, SlotStats
+from src.timeutil import format_ms
 
 logger = logging.getLogger(__name__)
 
@@ -23,68 +27,67 @@ class ParkingService(QObject):
     exit_ready = Signal(dict)         # {session, fee_info} - cần thanh toán
     exit_success = Signal(dict)       # {session, fee}
     exit_failed = Signal(str)         # error message
-    slot_updated = Signal(dict)       # SlotStats
+    slot_updated = Signal(object)     # SlotStats
+    write_failed = Signal(str)        # Ghi SQLite thất bại sau khi đã mở barrier
+    exit_persisted = Signal(int)      # session_id - lượt ra đã commit (doanh thu đã cộng)
     
     def __init__(self, parent=None):
         super().__init__(parent)
+        self._pending_exits = {}  # session_id -> (hạn monotonic, exit_info) đang chờ thanh toán
         db.init_database()
     
-    def process_entry(self, card_id: str) -> Tuple[bool, str]:
+    def process_entry(self, card_id: str, idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
         """
-        Xử lý xe vào
+        Xử lý xe vào: quyết định trên RAM, ghi SQLite ở thread writer (group commit)
+        nên barrier mở được ngay, không chờ fsync.
+        idempotency_key: mã lượt quét - quét trùng/retry không tạo phiên mới
         Returns: (success, message)
         """
         logger.info(f"[ENTRY] ========== Processing entry for card: {card_id} ==========")
         
-        # Check thẻ hợp lệ
-        card = db.get_card(card_id)
-        logger.info(f"[ENTRY] get_card result: {card}")
-        if not card:
-            msg = f"Thẻ {card_id} chưa đăng ký"
-            logger.warning(f"[ENTRY] FAILED: {msg}")
-            self.entry_failed.emit(msg)
-            return False, msg
+        status, session, ack = db.submit_entry(card_id, idempotency_key)
+        logger.info(f"[ENTRY] submit_entry result: {status} {session}")
         
-        # Check xe đã trong bãi chưa
-        active_session = db.get_active_session(card_id)
-        logger.info(f"[ENTRY] get_active_session result: {active_session}")
-        if active_session:
-            msg = f"Thẻ {card_id} đang có xe trong bãi (session #{active_session['id']})"
-            logger.warning(f"[ENTRY] BLOCKED: {msg}")
-            self.entry_failed.emit(msg)
-            return False, msg
-        
-        logger.info(f"[ENTRY] No active session found, proceeding...")
-        
-        # Check slot trống
-        slot = db.get_available_slot()
-        logger.info(f"[ENTRY] get_available_slot result: {slot}")
-        if slot is None:
+        if status == db.ENTRY_UNKNOWN_CARD:
+            msg = f"Thẻ {card_id} chưa đăng ký"
+        elif status == db.ENTRY_ALREADY_INSIDE:
+            msg = f"Thẻ {card_id} đang có xe trong bãi (session #{session.id})"
+        elif status == db.ENTRY_FULL:
             msg = "Bãi xe đã đầy"
+        else:
+            msg = None
+        
+        if msg:
             logger.warning(f"[ENTRY] FAILED: {msg}")
             self.entry_failed.emit(msg)
             return False, msg
         
-        # Tạo session
-        plate_number = card.get("plate_number", "")
-        logger.info(f"[ENTRY] Creating session: card={card_id}, plate={plate_number}, slot={slot}")
-        session_id = db.create_session(card_id, plate_number, slot)
+        slot = session.slot_number
+        if status == db.ENTRY_REPLAYED and session.exit_time is not None:
+            # Lượt quét cũ gửi lại sau khi xe đã ra: không mở barrier lần nữa
+            logger.info(f"[ENTRY] Stale scan {idempotency_key}, session #{session.id} already closed")
+            return False, f"Lượt quét đã xử lý (session #{session.id} đã ra)"
+        if status == db.ENTRY_REPLAYED:
+            # Quét trùng: phiên đã tạo trước đó, không báo lại lên UI
+            logger.info(f"[ENTRY] Duplicate scan {idempotency_key}, session #{session.id}")
+            return True, f"Xe vào slot {slot}"
         
         result = {
-            "session_id": session_id,
-            "card_id": card_id,
-            "plate_number": plate_number,
+            "session_id": session.id,
+            "card_id": session.card_id,
+            "plate_number": session.plate_number,
             "slot_number": slot,
-            "entry_time": datetime.now().strftime("%H:%M:%S")
+            "entry_time": format_ms(session.entry_time, "%H:%M:%S")
         }
         
+        ack.add_done_callback(lambda f: self._on_write_done(f, "entry", session))
         logger.info(f"[ENTRY] SUCCESS: {result}")
         self.entry_success.emit(result)
         self._emit_slot_update()
         
         return True, f"Xe vào slot {slot}"
     
-    def process_exit(self, card_id: str) -> Tuple[bool, Optional[dict]]:
+    def process_exit(self, card_id: str, idempotency_key: Optional[str] = None) -> Tuple[bool, Optional[dict]]:
         """
         Xử lý xe ra - trả về thông tin để thanh toán
         Returns: (success, exit_info or None)
@@ -99,39 +102,118 @@ class ParkingService(QObject):
             self.exit_failed.emit(msg)
             return False, None
         
+        # Quét trùng khi đang chờ thanh toán -> không mở thêm dialog.
+        # Quá hạn: UI đã đóng mà không báo hủy -> coi như hủy, mở lại dialog
+        pending = self._pending_exits.get(session.id)
+        if pending:
+            deadline, pending_result = pending
+            if time.monotonic() < deadline:
+                logger.info(f"Exit already pending for session #{session.id}")
+                return True, pending_result
+            logger.warning(f"Pending exit for session #{session.id} expired, reopening")
+        
         # Tính tiền
-        entry_time = session["entry_time"]
+        entry_time = session.entry_time
         fee_info = calculate_fee(entry_time)
         
         result = {
             "session": session,
-            "fee_info": fee_info
+            "fee_info": fee_info,
+            "idempotency_key": idempotency_key or f"exit-{session.id}"
         }
+        self._pending_exits[session.id] = (time.monotonic() + PARKING_CONFIG["pending_exit_ttl_s"], result)
         
         logger.info(f"Exit ready: {result}")
         self.exit_ready.emit(result)
         
         return True, result
     
-    def complete_exit(self, session_id: int, fee: int) -> bool:
-        """Hoàn tất xe ra sau khi thanh toán"""
-        success = db.complete_session(session_id, fee)
-        if success:
-            session = {"id": session_id, "fee": fee}
-            self.exit_success.emit(session)
+    def cancel_exit(self, session_id: int):
+        """Hủy lượt ra đang chờ thanh toán (cho phép quét lại)"""
+        self._pending_exits.pop(session_id, None)
+    
+    def complete_exit(self, session_id: int, fee: int, idempotency_key: Optional[str] = None,
+                      payment_method: str = db.PAYMENT_CASH) -> bool:
+        """Hoàn tất xe ra sau khi thanh toán (gọi lại với cùng key là an toàn)"""
+        pending = self._pending_exits.pop(session_id, None)
+        if idempotency_key is None and pending:
+            idempotency_key = pending[1]["idempotency_key"]
+        status, closed, ack = db.submit_close(session_id, fee, idempotency_key, payment_method)
+        if status == db.EXIT_CLOSED:
+            ack.add_done_callback(lambda f: self._on_write_done(f, "exit", closed))
+            self.exit_success.emit({"id": session_id, "fee": fee})
             self._emit_slot_update()
             logger.info(f"Exit completed: session {session_id}, fee {fee}")
-        return success
+        elif status == db.EXIT_REPLAYED:
+            logger.info(f"Exit already completed: session {session_id}")
+        else:
+            logger.warning(f"Exit not completed: session {session_id} ({status})")
+        return status in (db.EXIT_CLOSED, db.EXIT_REPLAYED)
+    
+    def _on_write_done(self, future, kind: str, session: Session):
+        # Chạy trên thread writer khi SQLite đã commit (hoặc thất bại).
+        # Undo đã chạy trước khi future báo lỗi nên danh sách xung đột đã cập nhật
+        what = f"{kind} session #{session.id}"
+        error = future.exception()
+        if error is None:
+            logger.info(f"[DB ACK] {what} persisted")
+            if kind == "exit":
+                self.exit_persisted.emit(session.id)
+            return
+        logger.error(f"[DB ACK] {what} NOT persisted: {error!r}")
+        msg = f"Lỗi lưu dữ liệu ({what}, thẻ {session.card_id}, slot {session.slot_number})"
+        if any(s.id == session.id for s in db.get_conflicted_sessions()):
+            msg += "\nPhiên vẫn mở trong database nhưng slot/thẻ đã được dùng lại - cần đóng phiên thủ công"
+        self.write_failed.emit(msg)
     
     def _emit_slot_update(self):
         stats = db.get_slot_stats()
         self.slot_updated.emit(stats)
     
-    def get_slot_stats(self) -> dict:
+    def get_slot_stats(self) -> SlotStats:
         return db.get_slot_stats()
     
-    def get_recent_history(self, limit: int = 20) -> list:
-        return db.get_recent_sessions(limit)
+    def get_slot_layout(self) -> list:
+        return db.get_slot_layout()
+    
+    def search_cards(self, text: str, limit: int = 20) -> list:
+        return db.search_cards(text, limit)
+
+    def search_parked(self, text: str, limit: int = 20) -> list:
+        """Xe đang trong bãi khớp mã thẻ / biển số"""
+        return db.search_sessions(text, limit, open_only=True)
+
+    def get_history_page(self, after=None, include_archive: bool = False, **filters):
+        """
+        Một trang lịch sử: (sessions, next_cursor). filters: start, end, card_id, plate
+        include_archive: cuộn hết dữ liệu nóng thì đọc tiếp sang các file lưu trữ
+        (chỉ bật theo lựa chọn của người dùng hoặc cho báo cáo)
+        """
+        return db.get_sessions_page(after, HISTORY_CONFIG["page_size"],
+                                    include_archive=include_archive, **filters)
+    
+    def backup_database(self):
+        """Snapshot định kỳ (chạy trên thread nền)"""
+        try:
+            backup.create_backup()
+        except Exception as e:
+            logger.error(f"[BACKUP] Failed: {e}")
+        finally:
+            db.close_thread_connection()
+    
+    def archive_old_sessions(self):
+        """Job lưu trữ (chạy trên thread nền): lỗi chỉ ghi log, lần sau chạy lại"""
+        try:
+            moved = db.archive_sessions()
+            if moved:
+                logger.info(f"[ARCHIVE] Moved {sum(moved.values())} sessions: {moved}")
+        except Exception as e:
+            logger.error(f"[ARCHIVE] Failed: {e}")
+        finally:
+            db.close_thread_connection()
     
     def get_today_revenue(self) -> int:
         return db.get_today_revenue()
+    
+    def get_revenue_by_method(self, day: Optional[str] = None) -> dict:
+        return db.get_revenue_by_method(day)
@@ -0,0 +1,68 @@
+"""
+Ring Buffer - Bộ đệm vòng dung lượng cố định (phần tử mới nhất ở vị trí 0)
+"""
+
+from typing import Any, Iterable, List
+
+
+class RingBuffer:
+    """
+    Thêm vào đầu (mới nhất) hoặc cuối (cũ hơn) đều O(1), không dịch phần tử.
+    Khi đầy, push_front ghi đè phần tử cũ nhất ở cuối; push_back từ chối.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self._items: List[Any] = [None] * capacity
+        self._head = 0
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._items)
+
+    def is_full(self) -> bool:
+        return self._count == len(self._items)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._items[(self._head + index) % len(self._items)]
+
+    def push_front(self, item):
+        self._head = (self._head - 1) % len(self._items)
+        self._items[self._head] = item
+        if self._count < len(self._items):
+            self._count += 1
+
+    def push_back(self, item) -> bool:
+        if self.is_full():
+            return False
+        self._items[(self._head + self._count) % len(self._items)] = item
+        self._count += 1
+        return True
+
+    def extend_back(self, items: Iterable) -> int:
+        """Nối vào cuối tới khi đầy; trả về số phần tử đã nhận"""
+        added = 0
+        for item in items:
+            if not self.push_back(item):
+                break
+            added += 1
+        return added
+
+    def truncate(self, size: int):
+        """Bỏ các phần tử cũ nhất, chỉ giữ `size` phần tử đầu"""
+        cap = len(self._items)
+        for i in range(size, self._count):
+            self._items[(self._head + i) % cap] = None
+        self._count = min(self._count, size)
+
+    def clear(self):
+        self._items = [None] * len(self._items)
+        self._head = 0
+        self._count = 0
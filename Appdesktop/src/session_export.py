@@ -0,0 +1,58 @@
+"""
+Session Export - Xuất phiên gửi xe cho kế toán (CSV, tùy chọn nén gzip), ghi dần từng dòng
+"""
+
+import csv
+import gzip
+from typing import Callable, IO, Iterable, Optional
+
+from src import database as db
+from src.models import Session
+from src.timeutil import format_ms
+
+COLUMNS = (
+    "id", "card_id", "plate_number", "slot_number", "entry_time", "exit_time",
+    "duration_min", "fee", "payment_status", "payment_method",
+)
+_TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+# Gọi progress mỗi bấy nhiêu dòng
+PROGRESS_EVERY = 1000
+
+
+def session_row(session: Session) -> list:
+    duration = "" if session.exit_time is None else (session.exit_time - session.entry_time) // 60000
+    return [
+        session.id, session.card_id, session.plate_number or "", session.slot_number,
+        format_ms(session.entry_time, _TIME_FMT), format_ms(session.exit_time, _TIME_FMT),
+        duration, session.fee, session.payment_status, session.payment_method or "",
+    ]
+
+
+def write_sessions(f: IO[str], sessions: Iterable[Session],
+                   progress: Optional[Callable[[int], None]] = None) -> int:
+    """Ghi CSV (có header) vào file text đã mở; trả về số dòng"""
+    writer = csv.writer(f)
+    writer.writerow(COLUMNS)
+    count = 0
+    for count, session in enumerate(sessions, start=1):
+        writer.writerow(session_row(session))
+        if progress and count % PROGRESS_EVERY == 0:
+            progress(count)
+    if progress:
+        progress(count)
+    return count
+
+
+def open_export(path: str) -> IO[str]:
+    """File text để ghi: nén gzip nếu đuôi .gz; BOM UTF-8 để Excel đọc đúng tiếng Việt"""
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, "wt", compresslevel=6, encoding="utf-8-sig", newline="")
+    return open(path, "w", encoding="utf-8-sig", newline="")
+
+
+def export_sessions(path: str, start: int, end: int,
+                    progress: Optional[Callable[[int], None]] = None) -> int:
+    """Xuất các phiên vào trong [start, end) epoch ms ra `path` (kể cả đã lưu trữ); bộ nhớ cố định"""
+    with open_export(path) as f:
+        return write_sessions(f, db.iter_sessions(start, end, include_archive=True), progress)
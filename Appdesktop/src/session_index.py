@@ -0,0 +1,80 @@
+"""
+Active Session Index - Chỉ mục in-memory các phiên gửi xe đang mở
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from src.models import Session
+
+
+class ActiveSessionIndex:
+    """
+    Phiên đang mở theo card_id, theo session id và theo slot.
+
+    Được nạp một lần từ bảng sessions lúc khởi động, sau đó database.py
+    cập nhật write-through ngay sau khi transaction ghi commit thành công.
+    Session là bất biến nên trả thẳng object trong index, không copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_card: Dict[str, Session] = {}
+        self._by_id: Dict[int, Session] = {}
+        self._slot_to_session: Dict[int, int] = {}
+        self.loaded = False
+
+    def load(self, sessions: Iterable[Session]):
+        with self._lock:
+            self._by_card.clear()
+            self._by_id.clear()
+            self._slot_to_session.clear()
+            for session in sessions:
+                self._put(session)
+            self.loaded = True
+
+    def add(self, session: Session):
+        with self._lock:
+            self._put(session)
+
+    def remove(self, session_id: int) -> Optional[Session]:
+        with self._lock:
+            session = self._by_id.pop(session_id, None)
+            if session is None:
+                return None
+            if self._by_card.get(session.card_id) is session:
+                del self._by_card[session.card_id]
+                # Hiếm: thẻ còn phiên mở khác -> đưa phiên đó lên thay
+                for other in self._by_id.values():
+                    if other.card_id == session.card_id:
+                        self._put(other)
+            slot = session.slot_number
+            if self._slot_to_session.get(slot) == session_id:
+                del self._slot_to_session[slot]
+            return session
+
+    def get_by_card(self, card_id: str) -> Optional[Session]:
+        return self._by_card.get(card_id)
+
+    def get_by_id(self, session_id: int) -> Optional[Session]:
+        return self._by_id.get(session_id)
+
+    def get_by_slot(self, slot_number: int) -> Optional[Session]:
+        session_id = self._slot_to_session.get(slot_number)
+        return self._by_id.get(session_id) if session_id is not None else None
+
+    def all(self) -> List[Session]:
+        with self._lock:
+            return list(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _put(self, session: Session):
+        # Nếu một thẻ có nhiều phiên mở (dữ liệu cũ), giữ phiên vào sau cùng
+        current = self._by_card.get(session.card_id)
+        if current is None or current.entry_time <= session.entry_time:
+            self._by_card[session.card_id] = session
+        self._by_id[session.id] = session
+        if session.slot_number is not None:
+            self._slot_to_session[session.slot_number] = session.id
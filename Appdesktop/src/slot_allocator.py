@@ -0,0 +1,133 @@
+"""
+Slot Allocator - Cấp phát slot trống O(log n) bằng heap, thay cho SELECT mỗi lượt xe vào
+"""
+
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+STRATEGY_LOWEST = "lowest"                # Slot có số nhỏ nhất
+STRATEGY_NEAREST = "nearest"              # Slot gần lối vào nhất (cột distance)
+STRATEGY_ZONE_BALANCED = "zone_balanced"  # Khu/tầng còn nhiều chỗ nhất, rồi gần nhất trong khu
+
+STRATEGIES = (STRATEGY_LOWEST, STRATEGY_NEAREST, STRATEGY_ZONE_BALANCED)
+
+
+class SlotAllocator:
+    """
+    Trạng thái slot trong RAM, dựng lại từ bảng slots lúc khởi động.
+
+    Mỗi khu (zone) có một min-heap các slot trống, xóa lười (lazy deletion):
+    phần tử trong heap chỉ hợp lệ nếu slot còn nằm trong tập `_free`.
+    Số khu nhỏ (vài tầng/khu) nên chọn khu là O(số khu), chọn slot là O(log n).
+    """
+
+    def __init__(self, strategy: str = STRATEGY_LOWEST):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown slot strategy: {strategy}")
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._slots: Dict[int, Tuple[str, int]] = {}   # slot_number -> (zone, distance)
+        self._free: set = set()
+        self._free_per_zone: Dict[str, int] = {}
+        self._heaps: Dict[str, List[Tuple]] = {}
+
+    def load(self, slots: Iterable[Dict]):
+        """slots: [{slot_number, zone, distance, is_occupied}, ...]"""
+        with self._lock:
+            self._slots.clear()
+            self._free.clear()
+            self._free_per_zone.clear()
+            self._heaps.clear()
+            for s in slots:
+                number = s["slot_number"]
+                zone = s.get("zone") or "A"
+                distance = s.get("distance")
+                self._slots[number] = (zone, number if distance is None else distance)
+                self._heaps.setdefault(zone, [])
+                self._free_per_zone.setdefault(zone, 0)
+                if not s.get("is_occupied"):
+                    self._free.add(number)
+                    self._free_per_zone[zone] += 1
+                    self._heaps[zone].append(self._key(number))
+            for heap in self._heaps.values():
+                heapq.heapify(heap)
+
+    def peek(self) -> Optional[int]:
+        """Slot sẽ được cấp tiếp theo theo strategy (không đánh dấu chiếm)"""
+        with self._lock:
+            return self._pick()
+
+    def acquire(self, slot_number: Optional[int] = None) -> Optional[int]:
+        """Đánh dấu slot bị chiếm; slot_number=None -> tự chọn theo strategy"""
+        with self._lock:
+            if slot_number is None:
+                slot_number = self._pick()
+                if slot_number is None:
+                    return None
+            if slot_number in self._free:
+                self._free.discard(slot_number)
+                self._free_per_zone[self._slots[slot_number][0]] -= 1
+            return slot_number
+
+    def release(self, slot_number: int):
+        with self._lock:
+            if slot_number not in self._slots or slot_number in self._free:
+                return
+            zone = self._slots[slot_number][0]
+            self._free.add(slot_number)
+            self._free_per_zone[zone] += 1
+            heap = self._heaps[zone]
+            heapq.heappush(heap, self._key(slot_number))
+            # Dọn phần tử cũ khi heap phình quá nhiều so với số slot trống.
+            # Dựng lại từ _free: slot lấy/trả nhiều lần để lại bản trùng vẫn "hợp lệ"
+            if len(heap) > 2 * self._free_per_zone[zone] + 16:
+                self._heaps[zone] = [self._key(n) for n in self._free if self._slots[n][0] == zone]
+                heapq.heapify(self._heaps[zone])
+
+    def is_free(self, slot_number: int) -> bool:
+        return slot_number in self._free
+
+    def stats(self) -> Dict:
+        total = len(self._slots)
+        available = len(self._free)
+        return {"total": total, "occupied": total - available, "available": available}
+
+    def layout(self) -> List[Tuple[int, str]]:
+        """[(slot_number, zone), ...] theo số slot"""
+        with self._lock:
+            return sorted((number, zone) for number, (zone, _) in self._slots.items())
+
+    def zone_stats(self) -> Dict[str, int]:
+        """Số slot trống theo khu"""
+        return dict(self._free_per_zone)
+
+    def _key(self, slot_number: int) -> Tuple:
+        # Phần tử cuối luôn là số slot (heap[0][-1]); bằng distance thì slot nhỏ trước
+        zone, distance = self._slots[slot_number]
+        if self.strategy == STRATEGY_LOWEST:
+            return (slot_number,)
+        return (distance, slot_number)
+
+    def _top(self, zone: str) -> Optional[Tuple]:
+        heap = self._heaps[zone]
+        while heap and heap[0][-1] not in self._free:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _pick(self) -> Optional[int]:
+        if self.strategy == STRATEGY_ZONE_BALANCED:
+            zones = [z for z, n in self._free_per_zone.items() if n > 0]
+            if not zones:
+                return None
+            # Khu còn nhiều chỗ nhất; bằng nhau thì lấy tên khu nhỏ hơn
+            zone = min(zones, key=lambda z: (-self._free_per_zone[z], z))
+            top = self._top(zone)
+            return top[-1] if top else None
+
+        best = None
+        for zone in self._heaps:
+            top = self._top(zone)
+            if top is not None and (best is None or top < best):
+                best = top
+        return best[-1] if best else None
@@ -0,0 +1,156 @@
+"""
+Slot State - Trạng thái slot dạng bit (1 bit/slot), cập nhật bằng snapshot/delta có số thứ tự
+"""
+
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+
+def pack_bits(states: Iterable[bool]) -> bytes:
+    """Slot 1 là bit thấp nhất của byte 0 (giống firmware)"""
+    out = bytearray()
+    for i, occupied in enumerate(states):
+        if i % 8 == 0:
+            out.append(0)
+        if occupied:
+            out[-1] |= 1 << (i % 8)
+    return bytes(out)
+
+
+class SlotState:
+    """
+    Mọi slot nằm trong một bytearray - nghìn slot chỉ tốn 125 byte.
+
+    - apply_snapshot: ảnh chụp đầy đủ kèm `seq`; so từng byte (XOR) nên chỉ slot
+      thực sự đổi mới bị đánh dấu.
+    - apply_delta: chỉ nhận delta có seq liền sau; lệch số là mất đồng bộ -> bỏ
+      mọi delta tới snapshot kế tiếp (caller gửi yêu cầu resync).
+    - Slot đổi được gom lại tới khi GUI lấy bằng take_changes(), nên nhiều lần
+      cập nhật trong một frame chỉ vẽ một lần.
+
+    Ghi từ network thread, đọc từ GUI thread: mọi thao tác giữ lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bits = bytearray()
+        self._count = 0
+        self._occupied = 0
+        self._seq: Optional[int] = None      # None: chưa có snapshot / đã mất đồng bộ
+        self._dirty = set()
+        self._resized = False
+        self.gaps = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def occupied(self) -> int:
+        return self._occupied
+
+    @property
+    def seq(self) -> Optional[int]:
+        return self._seq
+
+    def is_occupied(self, slot: int) -> bool:
+        i = slot - 1
+        return bool(self._bits[i >> 3] >> (i & 7) & 1) if 0 <= i < self._count else False
+
+    def states(self) -> List[bool]:
+        with self._lock:
+            return [self.is_occupied(n) for n in range(1, self._count + 1)]
+
+    # === Cập nhật ===
+
+    def apply_snapshot(self, seq: Optional[int], count: int, bits: bytes) -> bool:
+        """True nếu có slot đổi (hoặc đổi số slot). ValueError nếu bits không khớp count"""
+        if count < 0 or len(bits) != (count + 7) // 8:
+            raise ValueError(f"{len(bits)} bytes for {count} slots")
+        bits = bytearray(bits)
+        if count % 8:
+            bits[-1] &= (1 << (count % 8)) - 1
+        with self._lock:
+            if seq is not None:
+                self._seq = seq
+            if count != self._count:
+                self._resized = True
+                self._dirty.clear()
+                changed = True
+            else:
+                changed = self._diff(bits)
+            self._bits = bits
+            self._count = count
+            self._occupied = bin(int.from_bytes(bits, "little")).count("1")
+            return changed
+
+    def apply_delta(self, seq: int, on: Iterable[int] = (), off: Iterable[int] = ()) -> Optional[bool]:
+        """
+        True/False: đã áp dụng (có/không có slot đổi). None: lệch seq hoặc chưa có
+        snapshot -> cần resync. Delta trùng/cũ hơn bị bỏ qua (False).
+        """
+        changes = [(slot, True) for slot in on] + [(slot, False) for slot in off]
+        with self._lock:
+            if self._seq is None:
+                return None
+            if seq <= self._seq:
+                return False
+            if seq != self._seq + 1:
+                self._seq = None
+                self.gaps += 1
+                return None
+            for slot, _ in changes:
+                if not 1 <= slot <= self._count:
+                    raise ValueError(f"slot {slot} out of range 1..{self._count}")
+            self._seq = seq
+            changed = False
+            for slot, occupied in changes:
+                changed |= self._set(slot, occupied)
+            return changed
+
+    def set_all(self, states: Iterable[bool]) -> bool:
+        """Payload cũ (mảng bool, không seq)"""
+        states = list(states)
+        return self.apply_snapshot(None, len(states), pack_bits(states))
+
+    def set(self, slot: int, occupied: bool) -> bool:
+        """Payload cũ (một slot, không seq)"""
+        with self._lock:
+            return 1 <= slot <= self._count and self._set(slot, occupied)
+
+    def take_changes(self) -> Tuple[Optional[List[bool]], List[Tuple[int, bool]]]:
+        """
+        (states, []) nếu số slot đã đổi (vẽ lại toàn bộ), ngược lại
+        (None, [(slot, occupied), ...]) chỉ gồm slot đổi từ lần lấy trước.
+        """
+        with self._lock:
+            if self._resized:
+                self._resized = False
+                self._dirty.clear()
+                return [self.is_occupied(n) for n in range(1, self._count + 1)], []
+            dirty, self._dirty = self._dirty, set()
+            return None, [(slot, self.is_occupied(slot)) for slot in sorted(dirty)]
+
+    # === Nội bộ (đang giữ lock) ===
+
+    def _set(self, slot: int, occupied: bool) -> bool:
+        i = slot - 1
+        mask = 1 << (i & 7)
+        byte = self._bits[i >> 3]
+        if bool(byte & mask) == occupied:
+            return False
+        self._bits[i >> 3] = byte ^ mask
+        self._occupied += 1 if occupied else -1
+        self._dirty.add(slot)
+        return True
+
+    def _diff(self, bits: bytearray) -> bool:
+        changed = False
+        for index, (old, new) in enumerate(zip(self._bits, bits)):
+            diff = old ^ new
+            while diff:
+                low = diff & -diff
+                self._dirty.add(index * 8 + low.bit_length())
+                diff ^= low
+                changed = True
+        return changed
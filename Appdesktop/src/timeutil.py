@@ -0,0 +1,45 @@
+"""
+Time Utils - Thời gian lưu dạng epoch milliseconds (INTEGER) trong SQLite
+"""
+
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def to_ms(value: datetime) -> int:
+    """datetime (giờ local nếu không có tzinfo) -> epoch ms"""
+    return int(value.timestamp() * 1000)
+
+
+def from_ms(ms: int) -> datetime:
+    """epoch ms -> datetime giờ local"""
+    return datetime.fromtimestamp(ms / 1000)
+
+
+def format_ms(ms: Optional[int], fmt: str = "%Y-%m-%d %H:%M") -> str:
+    """Định dạng epoch ms theo giờ local (chuỗi rỗng nếu None)"""
+    if ms is None:
+        return ""
+    return time.strftime(fmt, time.localtime(ms // 1000))
+
+
+def day_key(ms: int) -> str:
+    """Khóa ngày local YYYY-MM-DD (bảng daily_revenue)"""
+    return format_ms(ms, "%Y-%m-%d")
+
+
+def hour_key(ms: int) -> str:
+    """Khóa giờ local YYYY-MM-DD HH (bảng hourly_revenue)"""
+    return format_ms(ms, "%Y-%m-%d %H")
+
+
+def month_range(year: int, month: int) -> Tuple[int, int]:
+    """[đầu tháng, đầu tháng sau) theo giờ local, dạng epoch ms"""
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return to_ms(start), to_ms(end)
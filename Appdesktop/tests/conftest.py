@@ -0,0 +1,37 @@
+"""
+Fixture chung cho test - chạy từ thư mục Appdesktop:
+
+    python -m pytest -q
+"""
+
+import pytest
+
+from src import database as db
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Đường dẫn database tạm cho từng test (chưa khởi tạo)"""
+    path = str(tmp_path / "parking.db")
+    monkeypatch.setattr(db, "DATABASE_PATH", path)
+    yield path
+    db.close_connections()
+
+
+@pytest.fixture
+def parking_db(db_path):
+    """Database mới đã áp dụng đủ migration, có sẵn vài thẻ"""
+    db.init_database()
+    for card_id in ("CARD01", "CARD02", "CARD03"):
+        db.add_card(card_id, plate_number=f"29A-{card_id[-2:]}")
+    return db_path
+
+
+@pytest.fixture
+def restart():
+    """Giả lập khởi động lại app: bỏ toàn bộ trạng thái RAM, đọc lại từ SQLite"""
+    def _restart():
+        db.flush_writes(5)
+        db.close_connections()
+        db.init_database()
+    return _restart
@@ -0,0 +1,117 @@
+"""
+Migration schema: database mới và database bản cũ (v0, thời gian dạng text) đều lên v8
+"""
+
+import sqlite3
+from datetime import datetime, timezone
+
+from src import database as db
+from src.timeutil import day_key
+
+# Schema trước khi có migration: thời gian ghi bằng datetime.now() / CURRENT_TIMESTAMP
+_LEGACY_SCHEMA = """
+    CREATE TABLE cards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_id TEXT UNIQUE NOT NULL,
+        owner_name TEXT,
+        plate_number TEXT,
+        phone TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active INTEGER DEFAULT 1
+    );
+    CREATE TABLE sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        card_id TEXT NOT NULL,
+        plate_number TEXT,
+        slot_number INTEGER,
+        entry_time TIMESTAMP NOT NULL,
+        exit_time TIMESTAMP,
+        fee INTEGER DEFAULT 0,
+        payment_status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE slots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        slot_number INTEGER UNIQUE NOT NULL,
+        is_occupied INTEGER DEFAULT 0,
+        current_session_id INTEGER
+    );
+"""
+
+_ENTRY = datetime(2026, 3, 1, 8, 0, 0)     # giờ local như datetime.now() của bản cũ
+_EXIT = datetime(2026, 3, 1, 10, 30, 0)
+
+
+def _local_ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+def _make_legacy_db(path: str):
+    conn = sqlite3.connect(path)
+    conn.executescript(_LEGACY_SCHEMA)
+    conn.executemany("INSERT INTO slots (slot_number) VALUES (?)", [(i,) for i in range(1, 11)])
+    conn.execute("INSERT INTO cards (card_id, owner_name, plate_number) VALUES ('OLD01', 'A', '29A-111.11')")
+    conn.execute("INSERT INTO cards (card_id, owner_name, plate_number) VALUES ('OLD02', 'B', '30B-222.22')")
+    conn.execute(
+        "INSERT INTO sessions (card_id, plate_number, slot_number, entry_time, exit_time, fee, payment_status, "
+        "created_at) VALUES ('OLD01', '29A-111.11', 1, ?, ?, 20000, 'paid', '2026-03-01 01:00:00')",
+        (str(_ENTRY), str(_EXIT)),
+    )
+    conn.execute(
+        "INSERT INTO sessions (card_id, plate_number, slot_number, entry_time, created_at) "
+        "VALUES ('OLD02', '30B-222.22', 2, ?, '2026-03-01 02:00:00')",
+        (str(_ENTRY),),
+    )
+    conn.execute("UPDATE slots SET is_occupied = 1, current_session_id = 2 WHERE slot_number = 2")
+    conn.commit()
+    conn.close()
+
+
+def _user_version(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_fresh_database_reaches_latest_version(db_path):
+    db.init_database()
+    assert _user_version(db_path) == db._MIGRATIONS[-1][0]
+    assert db.verify_query_plans() == []
+    assert db.get_slot_stats().available == db.get_slot_stats().total
+
+
+def test_init_is_idempotent(db_path):
+    db.init_database()
+    db.close_connections()
+    db.init_database()
+    assert _user_version(db_path) == db._MIGRATIONS[-1][0]
+
+
+def test_legacy_database_is_migrated(db_path):
+    _make_legacy_db(db_path)
+    db.init_database()
+    assert _user_version(db_path) == db._MIGRATIONS[-1][0]
+
+    # v5: text -> epoch ms (entry/exit theo giờ local, created_at theo UTC)
+    sessions, _ = db.get_sessions_page(limit=10)
+    closed = next(s for s in sessions if s.card_id == "OLD01")
+    assert closed.entry_time == _local_ms(_ENTRY)
+    assert closed.exit_time == _local_ms(_EXIT)
+    row = db.get_connection().execute("SELECT created_at FROM sessions WHERE id = ?", (closed.id,)).fetchone()
+    assert row[0] == int(datetime(2026, 3, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+    # v4: doanh thu tổng hợp dựng lại từ phiên cũ
+    revenue = db.get_revenue_by_method(day_key(_local_ms(_EXIT)))
+    assert sum(r["fee"] for r in revenue.values()) == 20000
+
+    # Phiên đang mở được nạp vào RAM, slot của nó không được cấp lại
+    active = db.get_active_session("OLD02")
+    assert active is not None and active.slot_number == 2
+    assert not db._slot_allocator.is_free(2)
+    assert db.get_available_slot() == 1
+
+    # v7: tìm theo biển số chuẩn hóa
+    assert [c.card_id for c in db.search_cards("29a111")] == ["OLD01"]
+    assert db.verify_query_plans() == []
@@ -0,0 +1,196 @@
+"""
+submit_entry / submit_close: quyết định trên RAM, idempotency key và undo khi ghi SQLite lỗi
+"""
+
+import threading
+
+import pytest
+
+from src import database as db
+
+
+def _persisted(future):
+    future.result(timeout=5)
+
+
+def _open_rows(card_id: str) -> int:
+    db.flush_writes(5)
+    return db.get_connection().execute(
+        "SELECT COUNT(*) FROM sessions WHERE card_id = ? AND exit_time IS NULL", (card_id,)
+    ).fetchone()[0]
+
+
+# === Xe vào ===
+
+def test_entry_creates_session_and_takes_slot(parking_db):
+    status, session, ack = db.submit_entry("card01", "scan-1")
+    assert status == db.ENTRY_CREATED
+    assert session.card_id == "CARD01" and session.plate_number == "29A-01"
+    _persisted(ack)
+    assert db.get_active_session("CARD01") == session
+    assert db.get_session_by_slot(session.slot_number) == session
+    assert db.get_slot_stats().occupied == 1
+    assert _open_rows("CARD01") == 1
+
+
+def test_entry_rejections(parking_db):
+    assert db.submit_entry("NOPE", "scan-x")[0] == db.ENTRY_UNKNOWN_CARD
+    status, session, ack = db.submit_entry("CARD01", "scan-1")
+    _persisted(ack)
+    status, again, ack = db.submit_entry("CARD01", "scan-2")
+    assert (status, again, ack) == (db.ENTRY_ALREADY_INSIDE, session, None)
+
+
+def test_entry_full(parking_db):
+    total = db.get_slot_stats().total
+    for i in range(total):
+        db.add_card(f"FULL{i:02d}")
+        assert db.submit_entry(f"FULL{i:02d}", f"full-{i}")[0] == db.ENTRY_CREATED
+    assert db.submit_entry("CARD01", "scan-1") == (db.ENTRY_FULL, None, None)
+
+
+def test_entry_replay_returns_same_session(parking_db):
+    _, session, ack = db.submit_entry("CARD01", "scan-1")
+    status, replayed, replay_ack = db.submit_entry("CARD01", "scan-1")
+    assert status == db.ENTRY_REPLAYED
+    assert replayed.id == session.id and replay_ack is None
+    _persisted(ack)
+    assert _open_rows("CARD01") == 1
+
+
+def test_entry_replay_after_exit_reports_closed_session(parking_db, restart):
+    _, session, ack = db.submit_entry("CARD01", "scan-1")
+    _persisted(ack)
+    _, _, exit_ack = db.submit_close(session.id, 5000, "exit-1")
+    _persisted(exit_ack)
+
+    status, replayed, _ = db.submit_entry("CARD01", "scan-1")
+    assert status == db.ENTRY_REPLAYED and replayed.exit_time is not None
+
+    # Sau khởi động lại key chỉ còn trong SQLite
+    restart()
+    status, replayed, _ = db.submit_entry("CARD01", "scan-1")
+    assert status == db.ENTRY_REPLAYED
+    assert replayed.id == session.id and replayed.exit_time is not None
+    assert db.get_active_session("CARD01") is None
+
+
+def test_entry_write_failure_rolls_back_ram(parking_db, monkeypatch):
+    def fail(cursor, session):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(db, "_write_entry", fail)
+
+    status, session, ack = db.submit_entry("CARD01", "scan-1")
+    assert status == db.ENTRY_CREATED
+    with pytest.raises(RuntimeError):
+        ack.result(timeout=5)
+    # Undo chạy trước khi future báo lỗi
+    assert db.get_active_session("CARD01") is None
+    assert db._slot_allocator.is_free(session.slot_number)
+    assert db.get_slot_stats().occupied == 0
+
+    # Key chưa được ghi nên quét lại tạo phiên mới
+    monkeypatch.undo()
+    status, retried, ack = db.submit_entry("CARD01", "scan-1")
+    assert status == db.ENTRY_CREATED and retried.id != session.id
+    _persisted(ack)
+
+
+# === Xe ra ===
+
+def test_close_releases_slot_and_persists(parking_db):
+    _, session, ack = db.submit_entry("CARD01", "scan-1")
+    status, closed, exit_ack = db.submit_close(session.id, 15000, "exit-1", db.PAYMENT_TRANSFER)
+    assert status == db.EXIT_CLOSED
+    assert closed.fee == 15000 and closed.payment_status == "paid"
+    assert db.get_active_session("CARD01") is None
+    assert db._slot_allocator.is_free(session.slot_number)
+    _persisted(exit_ack)
+    assert _open_rows("CARD01") == 0
+    assert db.get_revenue_by_method()[db.PAYMENT_TRANSFER] == {"fee": 15000, "count": 1}
+
+
+def test_close_replay_and_already_closed(parking_db, restart):
+    _, session, _ = db.submit_entry("CARD01", "scan-1")
+    _, closed, ack = db.submit_close(session.id, 15000, "exit-1")
+    _persisted(ack)
+
+    assert db.submit_close(session.id, 15000, "exit-1") == (db.EXIT_REPLAYED, closed, None)
+    assert db.submit_close(session.id, 15000, "exit-2")[0] == db.EXIT_ALREADY_CLOSED
+    assert db.submit_close(9999, 0, "exit-3") == (db.EXIT_NOT_FOUND, None, None)
+
+    # Sau khởi động lại: tra exit_key trong SQLite, không cộng doanh thu lần nữa
+    restart()
+    status, replayed, ack = db.submit_close(session.id, 15000, "exit-1")
+    assert status == db.EXIT_REPLAYED and ack is None and replayed.id == session.id
+    assert db.get_today_revenue() == 15000
+
+
+def test_close_write_failure_reopens_session(parking_db, monkeypatch):
+    _, session, ack = db.submit_entry("CARD01", "scan-1")
+    _persisted(ack)
+
+    def fail(cursor, session):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(db, "_write_exit", fail)
+
+    status, _, exit_ack = db.submit_close(session.id, 15000, "exit-1")
+    assert status == db.EXIT_CLOSED
+    with pytest.raises(RuntimeError):
+        exit_ack.result(timeout=5)
+    reopened = db.get_active_session("CARD01")
+    assert reopened is not None and reopened.id == session.id and reopened.exit_time is None
+    assert not db._slot_allocator.is_free(session.slot_number)
+    assert db.get_conflicted_sessions() == []
+
+    # Key lỗi không bị coi là đã xử lý: đóng lại được
+    monkeypatch.undo()
+    status, _, exit_ack = db.submit_close(session.id, 15000, "exit-1")
+    assert status == db.EXIT_CLOSED
+    _persisted(exit_ack)
+
+
+def test_close_failure_after_card_reentered_is_conflict(parking_db, monkeypatch):
+    _, session, ack = db.submit_entry("CARD01", "scan-1")
+    _persisted(ack)
+
+    release = threading.Event()
+
+    def slow_fail(cursor, session):
+        release.wait(5)
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(db, "_write_exit", slow_fail)
+
+    # Đóng phiên (ghi đang treo) rồi thẻ vào lại trước khi ghi lỗi
+    assert db.submit_close(session.id, 15000, "exit-1")[0] == db.EXIT_CLOSED
+    status, second, entry_ack = db.submit_entry("CARD01", "scan-2")
+    assert status == db.ENTRY_CREATED
+    release.set()
+    db.flush_writes(5)
+
+    conflicted = db.get_conflicted_sessions()
+    assert [s.id for s in conflicted] == [session.id]
+    assert conflicted[0].exit_time is None
+    # Phiên cũ không được đưa lại vào index (thẻ/slot đã có chủ khác trong RAM)
+    assert db.get_session_by_slot(session.slot_number) in (None, second)
+    # Ghi phiên mới vấp UNIQUE của phiên cũ còn mở trong SQLite -> undo trả slot/thẻ
+    with pytest.raises(Exception):
+        entry_ack.result(timeout=5)
+    assert db.get_active_session("CARD01") is None
+
+
+def test_entry_retries_when_writer_queue_is_full(parking_db, monkeypatch):
+    # Hàng đợi đầy: không chờ trong _decision_lock, RAM không đổi, quyết định lại sau
+    calls = []
+    real_try_submit = db._try_submit
+
+    def full_once(op, session, undo):
+        calls.append(session.id)
+        return None if len(calls) == 1 else real_try_submit(op, session, undo)
+    monkeypatch.setattr(db, "_try_submit", full_once)
+
+    status, session, ack = db.submit_entry("CARD01", "scan-1")
+    assert status == db.ENTRY_CREATED and len(calls) == 2
+    assert calls[0] == calls[1] == session.id
+    _persisted(ack)
+    assert db.get_slot_stats().occupied == 1
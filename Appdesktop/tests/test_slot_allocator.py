@@ -0,0 +1,102 @@
+"""
+SlotAllocator: thứ tự cấp slot theo từng strategy, trả slot và xóa lười trong heap
+"""
+
+import pytest
+
+from src.slot_allocator import (
+    STRATEGY_LOWEST, STRATEGY_NEAREST, STRATEGY_ZONE_BALANCED, SlotAllocator,
+)
+
+# Khu A: 1-4, khu B: 5-7; slot 6 gần lối vào nhất
+_LAYOUT = [
+    {"slot_number": 1, "zone": "A", "distance": 40},
+    {"slot_number": 2, "zone": "A", "distance": 30},
+    {"slot_number": 3, "zone": "A", "distance": 30},
+    {"slot_number": 4, "zone": "A", "distance": 50, "is_occupied": 1},
+    {"slot_number": 5, "zone": "B", "distance": 20},
+    {"slot_number": 6, "zone": "B", "distance": 10},
+    {"slot_number": 7, "zone": "B", "distance": None},
+]
+
+
+def _allocator(strategy: str) -> SlotAllocator:
+    allocator = SlotAllocator(strategy)
+    allocator.load(_LAYOUT)
+    return allocator
+
+
+def _drain(allocator: SlotAllocator):
+    order = []
+    while (slot := allocator.acquire()) is not None:
+        order.append(slot)
+    return order
+
+
+def test_unknown_strategy_rejected():
+    with pytest.raises(ValueError):
+        SlotAllocator("random")
+
+
+def test_load_marks_occupied_slots():
+    allocator = _allocator(STRATEGY_LOWEST)
+    assert allocator.stats() == {"total": 7, "occupied": 1, "available": 6}
+    assert not allocator.is_free(4)
+    assert allocator.zone_stats() == {"A": 3, "B": 3}
+    assert allocator.layout()[:2] == [(1, "A"), (2, "A")]
+
+
+def test_lowest_strategy():
+    assert _drain(_allocator(STRATEGY_LOWEST)) == [1, 2, 3, 5, 6, 7]
+
+
+def test_nearest_strategy_breaks_ties_by_slot_number():
+    # distance None -> dùng số slot làm khoảng cách (7)
+    assert _drain(_allocator(STRATEGY_NEAREST)) == [7, 6, 5, 2, 3, 1]
+
+
+def test_zone_balanced_strategy():
+    allocator = _allocator(STRATEGY_ZONE_BALANCED)
+    # A và B cùng 3 chỗ -> khu tên nhỏ hơn (A), slot gần nhất trong khu
+    assert allocator.acquire() == 2
+    # B còn nhiều chỗ hơn
+    assert allocator.acquire() == 7
+    assert allocator.acquire() == 3
+    assert allocator.acquire() == 6
+    assert allocator.zone_stats() == {"A": 1, "B": 1}
+
+
+def test_peek_does_not_take_slot():
+    allocator = _allocator(STRATEGY_LOWEST)
+    assert allocator.peek() == 1
+    assert allocator.peek() == 1
+    assert allocator.acquire(1) == 1
+    assert allocator.peek() == 2
+
+
+def test_release_makes_slot_available_again():
+    allocator = _allocator(STRATEGY_LOWEST)
+    _drain(allocator)
+    assert allocator.acquire() is None
+    allocator.release(3)
+    allocator.release(3)          # trả hai lần không đếm đôi
+    allocator.release(99)         # slot lạ bị bỏ qua
+    assert allocator.stats()["available"] == 1
+    assert allocator.acquire() == 3
+
+
+def test_explicit_acquire_skips_stale_heap_entries():
+    allocator = _allocator(STRATEGY_NEAREST)
+    allocator.acquire(7)          # lấy thẳng slot đứng đầu heap
+    assert allocator.peek() == 6
+    assert allocator.zone_stats()["B"] == 2
+
+
+def test_heap_compaction_keeps_order():
+    allocator = _allocator(STRATEGY_NEAREST)
+    for _ in range(100):
+        slot = allocator.acquire()
+        allocator.release(slot)
+    assert all(len(heap) <= 2 * allocator.zone_stats()[zone] + 16
+               for zone, heap in allocator._heaps.items())
+    assert _drain(allocator) == [7, 6, 5, 2, 3, 1]
@@ -2,15 +2,18 @@
 Card Manager - Quản lý thẻ RFID với màn hình quẹt thẻ
 """
 
-from PySide6.QtCore import Qt, Signal, QTimer, QPropertyAnimation, QEasingCurve, Property
+from PySide6.QtCore import Qt, Signal, QTimer, QThread, QPropertyAnimation, QEasingCurve, Property
 from PySide6.QtWidgets import (
-    QDialog, QVBoxLayout, QHBoxLayout, QLabel,
-    QPushButton, QTableWidget, QTableWidgetItem, QHeaderView,
-    QMessageBox, QWidget, QStackedWidget, QGraphicsOpacityEffect
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
+    QPushButton, QTableView, QHeaderView, QAbstractItemView,
+    QMessageBox, QWidget, QStackedWidget, QGraphicsOpacityEffect,
+    QFileDialog, QInputDialog, QProgressDialog
 )
 from PySide6.QtGui import QFont, QPainter, QColor, QPen
 
+from src import card_io
 from src import database as db
+from ui.card_model import CardTableModel, CardDelegate, COL_DELETE
 
 
 class SuccessAnimation(QWidget):
@@ -222,8 +225,8 @@ class WaitingCardWidget(QWidget):
         
         if self.mqtt_client:
             try:
-                self.mqtt_client.entry_card_detected.connect(self._on_card, Qt.UniqueConnection)
-                self.mqtt_client.exit_card_detected.connect(self._on_card, Qt.UniqueConnection)
+                self.mqtt_client.entry_scan.connect(self._on_card, Qt.UniqueConnection)
+                self.mqtt_client.exit_scan.connect(self._on_card, Qt.UniqueConnection)
             except:
                 pass
     
@@ -232,15 +235,15 @@ class WaitingCardWidget(QWidget):
         self.pulse_timer.stop()
         if self.mqtt_client:
             try:
-                self.mqtt_client.entry_card_detected.disconnect(self._on_card)
+                self.mqtt_client.entry_scan.disconnect(self._on_card)
             except:
                 pass
             try:
-                self.mqtt_client.exit_card_detected.disconnect(self._on_card)
+                self.mqtt_client.exit_scan.disconnect(self._on_card)
             except:
                 pass
     
-    def _on_card(self, card_id: str):
+    def _on_card(self, card_id: str, scan_id: str = ""):
         print(f"[WaitingCard] Card detected: {card_id}, is_waiting: {self._is_waiting}")
         if not self._is_waiting:
             return
@@ -267,6 +270,37 @@ class WaitingCardWidget(QWidget):
 
 
 
+class CardImportWorker(QThread):
+    """Nhập file thẻ ở thread riêng (transaction ghi có thể mất vài giây với file lớn)"""
+    progress = Signal(int)      # số bản ghi đã xử lý
+    done = Signal(object)       # CardImportResult
+    failed = Signal(str)
+
+    def __init__(self, path: str, on_conflict: str, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.on_conflict = on_conflict
+
+    def run(self):
+        try:
+            with open(self.path, encoding="utf-8-sig", newline="") as f:
+                result = db.import_cards(
+                    card_io.read_records(f, card_io.detect_format(self.path)), self.on_conflict,
+                    progress=lambda r: self.progress.emit(r.processed),
+                )
+            self.done.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+_IMPORT_POLICIES = {
+    "Bo qua the da co": db.IMPORT_SKIP,
+    "Cap nhat the da co": db.IMPORT_UPDATE,
+    "Huy neu co the trung / dong loi": db.IMPORT_FAIL,
+}
+_CARD_FILE_FILTER = "CSV (*.csv);;JSON (*.json);;JSON Lines (*.jsonl)"
+
+
 class CardManagerDialog(QDialog):
     def __init__(self, parent=None, mqtt_client=None):
         super().__init__(parent)
@@ -309,25 +343,65 @@ class CardManagerDialog(QDialog):
             QPushButton:hover { background: qlineargradient(x1:0,y1:0,x2:1,y2:0,stop:0 #7c3aed,stop:1 #4f46e5); }
         """)
         self.btn_add.clicked.connect(self._show_waiting)
+        
+        # Nhập / xuất file
+        self.btn_import = QPushButton("Nhap file")
+        self.btn_export = QPushButton("Xuat file")
+        for btn in (self.btn_import, self.btn_export):
+            btn.setFixedHeight(40)
+            btn.setCursor(Qt.PointingHandCursor)
+            btn.setStyleSheet("""
+                QPushButton { background: transparent; color: #c4b5fd; border: 1px solid #4b5563; border-radius: 8px; padding: 0 14px; font-size: 12px; font-weight: 600; }
+                QPushButton:hover { border-color: #8b5cf6; }
+            """)
+        self.btn_import.clicked.connect(self._import_cards)
+        self.btn_export.clicked.connect(self._export_cards)
         header.addWidget(title)
         header.addStretch()
+        header.addWidget(self.btn_import)
+        header.addWidget(self.btn_export)
         header.addWidget(self.btn_add)
         
+        # Search - tiền tố mã thẻ / biển số (index), từ khóa tên chủ thẻ / SĐT (FTS5); một trang kết quả
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Tim theo ma the, bien so, ten chu the, SDT...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setFixedHeight(36)
+        self.search_box.setStyleSheet("""
+            QLineEdit { background: #1a1a2e; color: #e5e7eb; border: 1px solid #2d2d44; border-radius: 8px; padding: 0 12px; font-size: 12px; }
+            QLineEdit:focus { border: 1px solid #6366f1; }
+        """)
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self._load_cards)
+        self.search_box.textChanged.connect(self._search_timer.start)
+        
         # Table
-        self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(["Ma the", "Chu the", "Bien so", "SDT", ""])
+        self.model = CardTableModel(parent=self)
+        self.model.rowsInserted.connect(self._update_stats)
+        self.model.rowsRemoved.connect(self._update_stats)
+        self.model.modelReset.connect(self._update_stats)
+        self.delegate = CardDelegate(self)
+        self.delegate.delete_requested.connect(self._delete_card)
+        
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setItemDelegate(self.delegate)
         for i in range(4):
             self.table.horizontalHeader().setSectionResizeMode(i, QHeaderView.Stretch)
-        self.table.horizontalHeader().setSectionResizeMode(4, QHeaderView.Fixed)
-        self.table.setColumnWidth(4, 60)
+        self.table.horizontalHeader().setSectionResizeMode(COL_DELETE, QHeaderView.Fixed)
+        self.table.setColumnWidth(COL_DELETE, 60)
         self.table.verticalHeader().setVisible(False)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(44)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table.setShowGrid(False)
         self.table.setStyleSheet("""
-            QTableWidget { background: #1a1a2e; color: #e5e7eb; border: 1px solid #2d2d44; border-radius: 8px; font-size: 12px; }
-            QTableWidget::item { padding: 8px; border-bottom: 1px solid #252540; }
-            QTableWidget::item:selected { background: #3730a3; }
+            QTableView { background: #1a1a2e; color: #e5e7eb; border: 1px solid #2d2d44; border-radius: 8px; font-size: 12px; }
+            QTableView::item { padding: 8px; border-bottom: 1px solid #252540; }
+            QTableView::item:selected { background: #3730a3; }
             QHeaderView::section { background: #1e1e32; color: #9ca3af; padding: 10px 8px; border: none; font-weight: 600; font-size: 11px; }
         """)
         
@@ -335,45 +409,15 @@ class CardManagerDialog(QDialog):
         self.stats_label.setStyleSheet("color: #6b7280; font-size: 11px;")
         
         layout.addLayout(header)
+        layout.addWidget(self.search_box)
         layout.addWidget(self.table, 1)
         layout.addWidget(self.stats_label)
     
     def _load_cards(self):
-        self.table.setRowCount(0)
-        cards = db.get_all_cards()
-        for card in cards:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setRowHeight(row, 44)
-            
-            item = QTableWidgetItem(card["card_id"])
-            item.setFont(QFont("Consolas", 10))
-            item.setForeground(QColor("#a78bfa"))
-            self.table.setItem(row, 0, item)
-            
-            for col, key in [(1, "owner_name"), (2, "plate_number"), (3, "phone")]:
-                val = card.get(key) or "-"
-                item = QTableWidgetItem(val)
-                if val == "-":
-                    item.setForeground(QColor("#6b7280"))
-                self.table.setItem(row, col, item)
-            
-            btn = QPushButton("X")
-            btn.setFixedSize(28, 28)
-            btn.setCursor(Qt.PointingHandCursor)
-            btn.setStyleSheet("""
-                QPushButton { background: #dc2626; color: white; border: none; border-radius: 14px; font-size: 12px; font-weight: bold; }
-                QPushButton:hover { background: #b91c1c; }
-            """)
-            btn.clicked.connect(lambda c, cid=card["card_id"]: self._delete_card(cid))
-            w = QWidget()
-            w.setStyleSheet("background: transparent;")
-            l = QHBoxLayout(w)
-            l.setContentsMargins(0, 0, 0, 0)
-            l.addWidget(btn, 0, Qt.AlignCenter)
-            self.table.setCellWidget(row, 4, w)
-        
-        self.stats_label.setText(f"Tong: {len(cards)} the")
+        self.model.reload(self.search_box.text().strip())
+    
+    def _update_stats(self, *args):
+        self.stats_label.setText(f"Tong: {self.model.total}{'+' if self.model.capped else ''} the")
     
     def _show_waiting(self):
         self.stack.setCurrentWidget(self.waiting_page)
@@ -398,14 +442,58 @@ class CardManagerDialog(QDialog):
         # Add new card
         result = db.add_card(card_id, "", "", "")
         print(f"[CardManager] Add card result: {result}")
-        self._load_cards()
+        card = db.get_card(card_id) if result else None
+        if card:
+            self.model.insert_card(card)
         self._show_list()
         QMessageBox.information(self, "Thanh cong", f"Da them the: {card_id}")
     
     def _delete_card(self, card_id: str):
         if QMessageBox.question(self, "Xac nhan", f"Xoa the {card_id}?", QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
-            db.delete_card(card_id)
-            self._load_cards()
+            if db.delete_card(card_id):
+                self.model.remove_card(card_id)
+    
+    def _import_cards(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Nhap the", "", _CARD_FILE_FILTER)
+        if not path:
+            return
+        policy, ok = QInputDialog.getItem(self, "Nhap the", "The da ton tai:", list(_IMPORT_POLICIES), 0, False)
+        if not ok:
+            return
+        self._import_progress = QProgressDialog("Dang nhap the...", None, 0, 0, self)
+        self._import_progress.setWindowModality(Qt.WindowModal)
+        self._import_progress.show()
+        self._import_worker = CardImportWorker(path, _IMPORT_POLICIES[policy], self)
+        self._import_worker.progress.connect(
+            lambda n: self._import_progress.setLabelText(f"Dang nhap the... {n} dong"))
+        self._import_worker.done.connect(self._on_import_done)
+        self._import_worker.failed.connect(self._on_import_failed)
+        self._import_worker.start()
+    
+    def _on_import_done(self, result):
+        self._import_progress.close()
+        self._load_cards()
+        msg = (f"Them moi: {result.inserted}\nCap nhat: {result.updated}\n"
+               f"Bo qua: {result.skipped}\nLoi: {len(result.errors)}")
+        if result.errors:
+            msg += "\n\n" + "\n".join(f"Ban ghi {n}: {reason}" for n, reason in result.errors[:10])
+        QMessageBox.information(self, "Nhap the", msg)
+    
+    def _on_import_failed(self, error: str):
+        self._import_progress.close()
+        QMessageBox.warning(self, "Nhap the", f"Khong nhap duoc (khong the nao duoc ghi):\n{error}")
+    
+    def _export_cards(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Xuat the", "cards.csv", _CARD_FILE_FILTER)
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                count = card_io.write_cards(f, db.iter_cards(), card_io.detect_format(path))
+        except OSError as e:
+            QMessageBox.warning(self, "Xuat the", str(e))
+            return
+        QMessageBox.information(self, "Xuat the", f"Da xuat {count} the ra {path}")
     
     def closeEvent(self, event):
         self.waiting_page.stop_waiting()
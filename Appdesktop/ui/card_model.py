@@ -0,0 +1,161 @@
+"""
+Card Model - Model/view cho danh sách thẻ RFID (tải dần theo trang, tìm kiếm)
+"""
+
+from typing import List, Optional
+
+from PySide6.QtCore import Qt, QAbstractTableModel, QEvent, QModelIndex, QRect, Signal
+from PySide6.QtGui import QColor, QPainter, QPalette
+from PySide6.QtWidgets import QStyledItemDelegate
+
+from src import database as db
+from src.models import Card
+
+COL_CARD, COL_OWNER, COL_PLATE, COL_PHONE, COL_DELETE = range(5)
+HEADERS = ["Ma the", "Chu the", "Bien so", "SDT", ""]
+
+
+class CardTableModel(QAbstractTableModel):
+    """
+    Thẻ được tải theo trang khi view cuộn tới (canFetchMore/fetchMore),
+    nên mở dialog với hàng chục nghìn thẻ chỉ tốn một query nhỏ.
+    Thêm/xóa thẻ cập nhật đúng một dòng, không tải lại cả danh sách.
+
+    Khi tìm kiếm: chỉ một trang kết quả xếp theo độ khớp (db.search_cards, mỗi
+    nguồn khớp một index), không đếm tổng - `capped` báo còn kết quả khác.
+    """
+
+    def __init__(self, page_size: int = 200, parent=None):
+        super().__init__(parent)
+        self._page_size = page_size
+        self._cards: List[Card] = []
+        self._cursor = None
+        self._has_more = False
+        self._search: Optional[str] = None
+        self.total = 0
+        self.capped = False
+
+    # === Dữ liệu ===
+
+    def reload(self, search: Optional[str] = None):
+        """Tải lại từ trang đầu với điều kiện tìm kiếm mới"""
+        self.beginResetModel()
+        self._search = search or None
+        if self._search:
+            cards = db.search_cards(self._search, self._page_size + 1)
+            self.capped = len(cards) > self._page_size
+            self._cards, self._cursor = cards[:self._page_size], None
+            self.total = len(self._cards)
+        else:
+            self._cards, self._cursor = db.get_cards_page(None, self._page_size)
+            self.capped = False
+            self.total = db.count_cards()
+        self._has_more = self._cursor is not None
+        self.endResetModel()
+
+    def card_at(self, row: int) -> Card:
+        return self._cards[row]
+
+    def insert_card(self, card: Card):
+        """Thẻ mới lên đầu danh sách"""
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._cards.insert(0, card)
+        self.total += 1
+        self.endInsertRows()
+
+    def remove_card(self, card_id: str):
+        for row, card in enumerate(self._cards):
+            if card.card_id == card_id:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._cards[row]
+                self.total -= 1
+                self.endRemoveRows()
+                return
+
+    # === Lazy fetching ===
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        cards, self._cursor = db.get_cards_page(self._cursor, self._page_size)
+        self._has_more = self._cursor is not None
+        if cards:
+            start = len(self._cards)
+            self.beginInsertRows(QModelIndex(), start, start + len(cards) - 1)
+            self._cards.extend(cards)
+            self.endInsertRows()
+
+    # === QAbstractTableModel ===
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._cards)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        card = self._cards[index.row()]
+        column = index.column()
+        if column == COL_CARD:
+            return card.card_id
+        if column == COL_OWNER:
+            return card.owner_name or "-"
+        if column == COL_PLATE:
+            return card.plate_number or "-"
+        if column == COL_PHONE:
+            return card.phone or "-"
+        return None
+
+
+class CardDelegate(QStyledItemDelegate):
+    """Màu chữ theo cột + nút xóa vẽ trong cột cuối (không tạo QPushButton mỗi dòng)"""
+
+    delete_requested = Signal(str)   # card_id
+
+    _CARD = QColor("#a78bfa")
+    _EMPTY = QColor("#6b7280")
+    _DELETE = QColor("#dc2626")
+    _DELETE_SIZE = 28
+
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        if index.column() == COL_CARD:
+            option.palette.setColor(QPalette.Text, self._CARD)
+            option.font.setFamily("Consolas")
+        elif option.text == "-":
+            option.palette.setColor(QPalette.Text, self._EMPTY)
+
+    def paint(self, painter, option, index):
+        if index.column() != COL_DELETE:
+            super().paint(painter, option, index)
+            return
+        rect = self._button_rect(option.rect)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(self._DELETE)
+        painter.drawEllipse(rect)
+        painter.setPen(Qt.white)
+        painter.drawText(rect, Qt.AlignCenter, "X")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if (index.column() == COL_DELETE and event.type() == QEvent.MouseButtonRelease
+                and self._button_rect(option.rect).contains(event.position().toPoint())):
+            self.delete_requested.emit(model.card_at(index.row()).card_id)
+            return True
+        return super().editorEvent(event, model, option, index)
+
+    def _button_rect(self, cell: QRect) -> QRect:
+        size = self._DELETE_SIZE
+        return QRect(cell.center().x() - size // 2, cell.center().y() - size // 2, size, size)
@@ -3,13 +3,21 @@ Dashboard Widget - Giao diện chính (Professional UI)
 """
 
 from datetime import datetime
-from PySide6.QtCore import Qt, Slot
+from PySide6.QtCore import Qt, Slot, Signal
 from PySide6.QtGui import QFont, QColor
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
-    QFrame, QTableWidget, QTableWidgetItem, QHeaderView, QGridLayout
+    QFrame, QTableView, QHeaderView, QGridLayout, QAbstractItemView, QScrollArea, QCheckBox
 )
 
+from src.config import DASHBOARD_CONFIG, HISTORY_CONFIG
+from src.models import SlotStats
+from src.slot_state import SlotState
+from src.timeutil import format_ms
+from ui.history_model import HistoryTableModel, HistoryDelegate
+from ui.slot_map import SlotMapWidget
+from ui.update_coalescer import UpdateCoalescer
+
 
 class StatCard(QFrame):
     """Card hiển thị thống kê"""
@@ -36,44 +44,18 @@ class StatCard(QFrame):
         self.lbl_value.setText(value)
 
 
-class SlotCard(QFrame):
-    """Card hiển thị slot đỗ xe"""
-    
-    def __init__(self, slot_id: int, parent=None):
-        super().__init__(parent)
-        self.slot_id = slot_id
-        self.occupied = False
-        
-        self.setFixedSize(100, 60)
-        self._update_style()
-        
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(8, 6, 8, 6)
-        layout.setSpacing(2)
-        
-        self.lbl_name = QLabel(f"Slot {slot_id}")
-        self.lbl_name.setStyleSheet("color:white;font-size:13px;font-weight:bold;background:transparent;")
-        self.lbl_name.setAlignment(Qt.AlignCenter)
-        
-        layout.addWidget(self.lbl_name)
-    
-    def set_occupied(self, occupied: bool):
-        self.occupied = occupied
-        self._update_style()
-    
-    def _update_style(self):
-        if self.occupied:
-            self.setStyleSheet("QFrame{background:#c0392b;border-radius:6px;border:2px solid #e74c3c;}")
-        else:
-            self.setStyleSheet("QFrame{background:#27ae60;border-radius:6px;border:2px solid #2ecc71;}")
-
-
 class DashboardWidget(QWidget):
     """Widget Dashboard chính"""
     
+    history_page_requested = Signal(object)  # cursor (created_at, id) của trang lịch sử kế tiếp
+    history_archive_toggled = Signal(bool)   # Bật/tắt đọc cả file lưu trữ khi cuộn lịch sử
+    
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.slot_cards = []
+        self._history_cursor = None    # None = đã tải hết lịch sử
+        self._history_loading = False
+        # Cập nhật từ cảm biến/MQTT đi qua đây (key -> cập nhật mới nhất, áp dụng theo frame)
+        self.updates = UpdateCoalescer(DASHBOARD_CONFIG["frame_ms"], self)
         self._build_ui()
     
     def _build_ui(self):
@@ -115,56 +97,43 @@ class DashboardWidget(QWidget):
         cards_layout.addWidget(self.card_revenue)
         cards_layout.addStretch()
 
-        # Parking Status - 2 columns: Available & Occupied
+        # Parking Status - sơ đồ slot vẽ trực tiếp, nhóm theo khu/tầng
         parking_frame = QFrame()
         parking_frame.setStyleSheet("QFrame{background:#2d2d44;border-radius:10px;}")
-        parking_layout = QHBoxLayout(parking_frame)
+        parking_layout = QVBoxLayout(parking_frame)
         parking_layout.setContentsMargins(15, 12, 15, 12)
-        parking_layout.setSpacing(20)
-        
-        # Available slots column
-        available_col = QVBoxLayout()
-        available_col.setSpacing(8)
+        parking_layout.setSpacing(8)
         
+        legend = QHBoxLayout()
+        legend.setSpacing(20)
         lbl_available = QLabel("CHO TRONG")
         lbl_available.setStyleSheet("color:#2ecc71;font-size:12px;font-weight:bold;background:transparent;")
-        available_col.addWidget(lbl_available)
-        
-        self.available_slots_layout = QHBoxLayout()
-        self.available_slots_layout.setSpacing(8)
-        available_col.addLayout(self.available_slots_layout)
-        available_col.addStretch()
-        
-        # Occupied slots column
-        occupied_col = QVBoxLayout()
-        occupied_col.setSpacing(8)
-        
         lbl_occupied = QLabel("CO XE")
         lbl_occupied.setStyleSheet("color:#e74c3c;font-size:12px;font-weight:bold;background:transparent;")
-        occupied_col.addWidget(lbl_occupied)
-        
-        self.occupied_slots_layout = QHBoxLayout()
-        self.occupied_slots_layout.setSpacing(8)
-        occupied_col.addLayout(self.occupied_slots_layout)
-        occupied_col.addStretch()
-        
-        # Separator
-        separator = QFrame()
-        separator.setFixedWidth(2)
-        separator.setStyleSheet("background:#444;")
-        
-        parking_layout.addLayout(available_col, 1)
-        parking_layout.addWidget(separator)
-        parking_layout.addLayout(occupied_col, 1)
-        
-        # Create slot cards
-        for i in range(3):
-            card = SlotCard(i + 1)
-            self.slot_cards.append(card)
-            self.available_slots_layout.addWidget(card)
-        
-        self.available_slots_layout.addStretch()
-        self.occupied_slots_layout.addStretch()
+        lbl_zoom = QLabel("Ctrl + cuon chuot de zoom")
+        lbl_zoom.setStyleSheet("color:#6b7280;font-size:11px;background:transparent;")
+        legend.addWidget(lbl_available)
+        legend.addWidget(lbl_occupied)
+        legend.addStretch()
+        legend.addWidget(lbl_zoom)
+        
+        self.slot_map = SlotMapWidget()
+        self.slot_map.setStyleSheet("background:transparent;")
+        self.slot_map.occupancy_changed.connect(
+            lambda total, occupied: self.updates.post("stats", self._update_sensor_stats, total, occupied)
+        )
+        slot_scroll = QScrollArea()
+        slot_scroll.setWidgetResizable(True)
+        slot_scroll.setFrameShape(QFrame.NoFrame)
+        slot_scroll.setStyleSheet("QScrollArea{background:transparent;}")
+        slot_scroll.setMaximumHeight(260)
+        slot_scroll.setWidget(self.slot_map)
+        
+        parking_layout.addLayout(legend)
+        parking_layout.addWidget(slot_scroll)
+        
+        # Mặc định 3 slot cảm biến; main nạp sơ đồ thực tế từ database
+        self.slot_map.set_slots((i, None) for i in range(1, 4))
         
         # History Table - Improved Design
         history_header = QHBoxLayout()
@@ -172,10 +141,18 @@ class DashboardWidget(QWidget):
         lbl_history.setStyleSheet("font-size:14px;font-weight:bold;color:#4ade80;margin-top:8px;")
         history_header.addWidget(lbl_history)
         history_header.addStretch()
-        
-        self.table_history = QTableWidget()
-        self.table_history.setColumnCount(5)
-        self.table_history.setHorizontalHeaderLabels(["Thoi gian", "Trang thai", "Ma the", "Slot", "Phi"])
+        # Mặc định chỉ đọc DB chính; file lưu trữ theo tháng chỉ mở khi người dùng chọn
+        self.chk_archive = QCheckBox("Gồm dữ liệu lưu trữ")
+        self.chk_archive.setStyleSheet("color:#94a3b8;font-size:12px;margin-top:8px;")
+        self.chk_archive.toggled.connect(self.history_archive_toggled)
+        history_header.addWidget(self.chk_archive)
+        
+        self.history_model = HistoryTableModel(
+            HISTORY_CONFIG["max_rows"], HISTORY_CONFIG["insert_batch_ms"], self
+        )
+        self.table_history = QTableView()
+        self.table_history.setModel(self.history_model)
+        self.table_history.setItemDelegate(HistoryDelegate(self.table_history))
         
         # Set column widths
         header_view = self.table_history.horizontalHeader()
@@ -191,13 +168,19 @@ class DashboardWidget(QWidget):
         self.table_history.setColumnWidth(4, 120)  # Phi
         
         self.table_history.setAlternatingRowColors(True)
-        self.table_history.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table_history.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table_history.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table_history.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table_history.verticalHeader().setVisible(False)
+        # Chiều cao dòng cố định: view không phải đo từng dòng khi thêm/cuộn
+        self.table_history.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table_history.verticalHeader().setDefaultSectionSize(40)
         self.table_history.setShowGrid(False)
+        # Cuộn theo dòng: giá trị scrollbar = chỉ số dòng, dùng để tải trang kế khi gần đáy
+        self.table_history.setVerticalScrollMode(QAbstractItemView.ScrollPerItem)
+        self.table_history.verticalScrollBar().valueChanged.connect(self._on_history_scrolled)
         
         self.table_history.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 border: none;
                 border-radius: 10px;
                 background: #2d2d44;
@@ -212,14 +195,14 @@ class DashboardWidget(QWidget):
                 font-weight: bold;
                 font-size: 12px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #3d3d5c;
             }
-            QTableWidget::item:alternate {
+            QTableView::item:alternate {
                 background: #252540;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background: #4a4a6a;
             }
         """)
@@ -249,6 +232,9 @@ class DashboardWidget(QWidget):
         self.btn_cards = QPushButton("Quan ly the")
         self.btn_cards.setStyleSheet(btn_style % ("#7f8c8d", "#6c7a7b"))
         
+        self.btn_export = QPushButton("Xuat bao cao")
+        self.btn_export.setStyleSheet(btn_style % ("#16a085", "#138d75"))
+        
         # Hidden buttons for compatibility (not shown in UI)
         self.btn_manual_entry = QPushButton()
         self.btn_manual_entry.hide()
@@ -260,6 +246,7 @@ class DashboardWidget(QWidget):
         
         btn_layout.addWidget(self.btn_payment)
         btn_layout.addWidget(self.btn_cards)
+        btn_layout.addWidget(self.btn_export)
         btn_layout.addStretch()
         btn_layout.addWidget(self.btn_reset)
         
@@ -274,22 +261,6 @@ class DashboardWidget(QWidget):
         layout.addWidget(self.table_history, 1)
         layout.addLayout(btn_layout)
     
-    def _reorganize_slots(self):
-        """Di chuyển slot cards giữa 2 cột dựa trên trạng thái"""
-        for card in self.slot_cards:
-            self.available_slots_layout.removeWidget(card)
-            self.occupied_slots_layout.removeWidget(card)
-        
-        for card in self.slot_cards:
-            if card.occupied:
-                self.occupied_slots_layout.insertWidget(
-                    self.occupied_slots_layout.count() - 1, card
-                )
-            else:
-                self.available_slots_layout.insertWidget(
-                    self.available_slots_layout.count() - 1, card
-                )
-    
     @Slot(bool)
     def set_mqtt_connected(self, connected: bool):
         if connected:
@@ -318,11 +289,11 @@ class DashboardWidget(QWidget):
         self.lbl_esp32_status.setText("ESP32: Offline")
         self.lbl_esp32_status.setStyleSheet("font-size:12px;color:#e74c3c;padding:5px 10px;background:#2d2d44;border-radius:4px;")
 
-    @Slot(dict)
-    def update_slot_stats(self, stats: dict):
-        total = stats.get("total", 0)
-        available = stats.get("available", 0)
-        occupied = stats.get("occupied", 0)
+    @Slot(object)
+    def update_slot_stats(self, stats: SlotStats):
+        total = stats.total
+        available = stats.available
+        occupied = stats.occupied
         
         self.card_slots.set_value(f"{available}/{total}")
         self.card_vehicles.set_value(str(occupied))
@@ -332,90 +303,50 @@ class DashboardWidget(QWidget):
         self.card_revenue.set_value(f"{revenue:,} VND")
     
     def add_history_entry(self, time_str: str, entry_type: str, card_id: str, plate: str, slot: str, fee: str):
-        """Thêm entry vào bảng lịch sử với giao diện đẹp hơn"""
-        self.table_history.insertRow(0)
-        
-        # Thời gian
-        time_item = QTableWidgetItem(time_str)
-        time_item.setTextAlignment(Qt.AlignCenter)
-        self.table_history.setItem(0, 0, time_item)
-        
-        # Trạng thái với màu sắc và icon
-        if entry_type == "VÀO":
-            status_text = "VAO"
-            status_item = QTableWidgetItem(status_text)
-            status_item.setForeground(QColor("#4ade80"))  # Green
-        else:
-            status_text = "RA"
-            status_item = QTableWidgetItem(status_text)
-            status_item.setForeground(QColor("#f87171"))  # Red
-        
-        status_item.setTextAlignment(Qt.AlignCenter)
-        status_item.setFont(QFont("", -1, QFont.Bold))
-        self.table_history.setItem(0, 1, status_item)
-        
-        # Mã thẻ
-        card_item = QTableWidgetItem(card_id)
-        card_item.setForeground(QColor("#60a5fa"))  # Blue
-        self.table_history.setItem(0, 2, card_item)
-        
-        # Slot
-        slot_item = QTableWidgetItem(slot if slot and slot != "-" else "-")
-        slot_item.setTextAlignment(Qt.AlignCenter)
-        self.table_history.setItem(0, 3, slot_item)
-        
-        # Phí
-        fee_item = QTableWidgetItem(fee if fee and fee != "-" else "-")
-        fee_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        if fee and fee != "-" and fee != "0":
-            fee_item.setForeground(QColor("#fbbf24"))  # Yellow/Gold
-        self.table_history.setItem(0, 4, fee_item)
-        
-        # Set row height
-        self.table_history.setRowHeight(0, 40)
-        
-        # Giới hạn số dòng
-        while self.table_history.rowCount() > 50:
-            self.table_history.removeRow(self.table_history.rowCount() - 1)
+        """Thêm entry mới lên đầu bảng lịch sử"""
+        self.history_model.prepend((time_str, entry_type, card_id, slot, fee))
     
-    def load_history(self, sessions: list):
-        self.table_history.setRowCount(0)
+    def load_history(self, sessions: list, next_cursor=None):
+        """Hiển thị lại lịch sử từ trang đầu (sessions mới nhất trước)"""
+        self.history_model.clear()
+        self.append_history_page(sessions, next_cursor)
+    
+    def append_history_page(self, sessions: list, next_cursor=None):
+        """Nối một trang lịch sử cũ hơn vào cuối bảng"""
+        rows = []
         for s in sessions:
-            entry_time = s.get("entry_time", "")
-            exit_time = s.get("exit_time")
-            card_id = s.get("card_id", "N/A")
-            plate = s.get("plate_number", "N/A")
-            slot = str(s.get("slot_number", "")) if s.get("slot_number") else "-"
-            fee = f"{s.get('fee', 0):,}" if exit_time and s.get('fee', 0) > 0 else "-"
-            
-            if exit_time:
-                self.add_history_entry(str(exit_time)[:16], "RA", card_id, plate, "-", fee)
-            self.add_history_entry(str(entry_time)[:16], "VÀO", card_id, plate, slot, "-")
+            card_id = s.card_id or "N/A"
+            slot = str(s.slot_number) if s.slot_number else "-"
+            fee = f"{s.fee:,}" if s.exit_time and s.fee else "-"
+            if s.exit_time:
+                rows.append((format_ms(s.exit_time), "RA", card_id, "-", fee))
+            rows.append((format_ms(s.entry_time), "VÀO", card_id, slot, "-"))
+        
+        # Buffer đầy -> dừng tải thêm
+        has_room = self.history_model.append_rows(rows)
+        self._history_cursor = next_cursor if has_room else None
+        self._history_loading = False
     
-    @Slot(int, bool)
-    def update_slot(self, slot: int, occupied: bool):
-        if slot < 1 or slot > len(self.slot_cards):
+    def _on_history_scrolled(self, value: int):
+        if self._history_cursor is None or self._history_loading:
             return
-        
-        card = self.slot_cards[slot - 1]
-        card.set_occupied(occupied)
-        self._reorganize_slots()
-        self._update_sensor_stats()
+        if self.table_history.verticalScrollBar().maximum() - value <= HISTORY_CONFIG["prefetch_rows"]:
+            self._history_loading = True
+            self.history_page_requested.emit(self._history_cursor)
     
-    def _update_sensor_stats(self):
-        total = len(self.slot_cards)
-        occupied = sum(1 for c in self.slot_cards if c.occupied)
-        available = total - occupied
-        
-        self.card_slots.set_value(f"{available}/{total}")
+    def set_slot_layout(self, slots: list):
+        """Sơ đồ slot: [(slot_number, zone), ...]"""
+        self.slot_map.set_slots(slots)
+    
+    @Slot(int, int)
+    def _update_sensor_stats(self, total: int, occupied: int):
+        self.card_slots.set_value(f"{total - occupied}/{total}")
         self.card_vehicles.set_value(str(occupied))
     
-    @Slot(dict)
-    def update_all_slots(self, data: dict):
-        slots = data.get("slots", [])
-        for i, occupied in enumerate(slots):
-            if i < len(self.slot_cards):
-                self.slot_cards[i].set_occupied(occupied)
-        
-        self._reorganize_slots()
-        self._update_sensor_stats()
+    def apply_slot_state(self, state: SlotState):
+        """Lấy các slot đổi từ SlotState; chỉ vẽ lại toàn bộ khi số slot thay đổi"""
+        states, changes = state.take_changes()
+        if states is not None:
+            self.slot_map.set_all(states)
+        elif changes:
+            self.slot_map.set_many(changes)
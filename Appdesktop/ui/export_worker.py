@@ -0,0 +1,60 @@
+"""
+Export Worker - Xuất phiên gửi xe ở thread riêng, báo tiến độ bằng signal
+"""
+
+import os
+
+from PySide6.QtCore import QThread, Signal
+
+from src import database as db
+from src import session_export
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class SessionExportWorker(QThread):
+    """
+    Đọc/định dạng/nén trên thread này (kết nối reader riêng), GUI chỉ nhận signal.
+    Hủy bằng requestInterruption(): file dở dang bị xóa.
+    """
+
+    progress = Signal(int, int)    # đã ghi, tổng số
+    done = Signal(int)             # số phiên đã xuất
+    failed = Signal(str)
+    cancelled = Signal()
+
+    def __init__(self, path: str, start: int, end: int, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.start_ms = start
+        self.end_ms = end
+
+    def run(self):
+        try:
+            total = db.count_sessions(self.start_ms, self.end_ms, include_archive=True)
+            self.progress.emit(0, total)
+            count = session_export.export_sessions(
+                self.path, self.start_ms, self.end_ms, progress=lambda n: self._on_progress(n, total)
+            )
+            self.done.emit(count)
+        except _Cancelled:
+            self._remove_partial()
+            self.cancelled.emit()
+        except Exception as e:
+            self._remove_partial()
+            self.failed.emit(str(e))
+        finally:
+            db.close_thread_connection()
+
+    def _on_progress(self, written: int, total: int):
+        if self.isInterruptionRequested():
+            raise _Cancelled()
+        self.progress.emit(written, total)
+
+    def _remove_partial(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
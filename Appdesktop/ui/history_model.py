@@ -0,0 +1,135 @@
+"""
+History Model - Model/view cho bảng lịch sử vào/ra trên dashboard
+"""
+
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from PySide6.QtGui import QColor, QPalette
+from PySide6.QtWidgets import QStyledItemDelegate
+
+from src.ring_buffer import RingBuffer
+
+# Một dòng lịch sử: (time_str, kind, card_id, slot, fee) - kind là "VÀO" hoặc "RA"
+COL_TIME, COL_KIND, COL_CARD, COL_SLOT, COL_FEE = range(5)
+HEADERS = ["Thoi gian", "Trang thai", "Ma the", "Slot", "Phi"]
+KIND_ENTRY = "VÀO"
+
+KIND_ROLE = Qt.UserRole
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """
+    Lịch sử trong RingBuffer dung lượng cố định: dòng mới nhất ở trên cùng.
+
+    Sự kiện live được gom lại và báo view bằng một rowsInserted mỗi lô (sau
+    `batch_ms`), nên giờ cao điểm mỗi sự kiện chỉ tốn O(1). Buffer đầy thì dòng
+    cũ nhất ở đáy bị bỏ. Trang lịch sử cũ hơn được nối vào đáy tới khi đầy.
+    """
+
+    def __init__(self, capacity: int = 5000, batch_ms: int = 16, parent=None):
+        super().__init__(parent)
+        self._rows = RingBuffer(capacity)
+        self._pending = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(batch_ms)
+        self._flush_timer.timeout.connect(self.flush)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            if index.column() == COL_KIND:
+                return "VAO" if row[COL_KIND] == KIND_ENTRY else "RA"
+            return row[index.column()] or "-"
+        if role == KIND_ROLE:
+            return row[COL_KIND]
+        return None
+
+    def prepend(self, row: tuple):
+        """Thêm sự kiện mới lên đầu (báo view theo lô)"""
+        self._pending.append(row)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def flush(self):
+        self._flush_timer.stop()
+        if not self._pending:
+            return
+        # Lô lớn hơn dung lượng: chỉ giữ phần mới nhất
+        pending = self._pending[-self._rows.capacity:]
+        self._pending = []
+
+        overflow = len(self._rows) + len(pending) - self._rows.capacity
+        if overflow > 0:
+            keep = len(self._rows) - overflow
+            self.beginRemoveRows(QModelIndex(), keep, len(self._rows) - 1)
+            self._rows.truncate(keep)
+            self.endRemoveRows()
+
+        self.beginInsertRows(QModelIndex(), 0, len(pending) - 1)
+        for row in pending:
+            self._rows.push_front(row)
+        self.endInsertRows()
+
+    def append_rows(self, rows: list) -> bool:
+        """Nối các dòng cũ hơn vào đáy; False nếu buffer đã đầy (bỏ phần còn lại)"""
+        self.flush()
+        room = self._rows.capacity - len(self._rows)
+        rows = rows[:room]
+        if rows:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            self._rows.extend_back(rows)
+            self.endInsertRows()
+        return not self._rows.is_full()
+
+    def clear(self):
+        self.beginResetModel()
+        self._pending = []
+        self._flush_timer.stop()
+        self._rows.clear()
+        self.endResetModel()
+
+
+class HistoryDelegate(QStyledItemDelegate):
+    """Màu/căn lề/font theo cột và loại sự kiện (thay cho style từng QTableWidgetItem)"""
+
+    _ENTRY = QColor("#4ade80")   # Green
+    _EXIT = QColor("#f87171")    # Red
+    _CARD = QColor("#60a5fa")    # Blue
+    _FEE = QColor("#fbbf24")     # Yellow/Gold
+
+    _ALIGN = {
+        COL_TIME: Qt.AlignCenter,
+        COL_KIND: Qt.AlignCenter,
+        COL_CARD: Qt.AlignLeft | Qt.AlignVCenter,
+        COL_SLOT: Qt.AlignCenter,
+        COL_FEE: Qt.AlignRight | Qt.AlignVCenter,
+    }
+
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        column = index.column()
+        option.displayAlignment = self._ALIGN[column]
+        color = None
+        if column == COL_KIND:
+            color = self._ENTRY if index.data(KIND_ROLE) == KIND_ENTRY else self._EXIT
+            option.font.setBold(True)
+        elif column == COL_CARD:
+            color = self._CARD
+        elif column == COL_FEE and option.text not in ("-", "0"):
+            color = self._FEE
+        if color is not None:
+            option.palette.setColor(QPalette.Text, color)
@@ -91,6 +91,7 @@ class QRPaymentWidget(QDialog):
         self.verify_interval = 5000
         self.max_verify_attempts = 60
         self.verify_count = 0
+        self._settled = False   # Đã thanh toán hoặc đã báo hủy: không báo payment_cancelled nữa
         self._build_ui()
 
     def _build_ui(self):
@@ -190,6 +191,7 @@ class QRPaymentWidget(QDialog):
     def display_payment(self, payment_data: dict):
         self.payment_info = payment_data
         self.verify_count = 0
+        self._settled = False
         
         # Reset view
         self.qr_container.show()
@@ -227,6 +229,7 @@ class QRPaymentWidget(QDialog):
         result = verify_payment(self.payment_info.get('amount', 0), self.payment_info.get('order_id', ''))
         if result:
             self.verify_timer.stop()
+            self._settled = True
             self._show_success()
             self.payment_success.emit(result)
 
@@ -265,10 +268,20 @@ class QRPaymentWidget(QDialog):
         QTimer.singleShot(400, self.check_anim.start)
 
     def _on_cancel(self):
-        self.verify_timer.stop()
-        self.payment_cancelled.emit()
         self.reject()
 
-    def closeEvent(self, event):
+    def _cancel(self):
         self.verify_timer.stop()
+        if not self._settled:
+            self._settled = True
+            self.payment_cancelled.emit()
+
+    def reject(self):
+        # Nút hủy và Esc
+        self._cancel()
+        super().reject()
+
+    def closeEvent(self, event):
+        # Nút X
+        self._cancel()
         super().closeEvent(event)
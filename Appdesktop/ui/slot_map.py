@@ -0,0 +1,194 @@
+"""
+Slot Map - Sơ đồ slot vẽ trực tiếp (một widget cho cả trăm/nghìn slot)
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PySide6.QtCore import Qt, QRect, QSize, Signal
+from PySide6.QtGui import QColor, QPainter, QPen, QFont
+from PySide6.QtWidgets import QWidget, QSizePolicy
+
+
+class SlotMapWidget(QWidget):
+    """
+    Mỗi slot là một ô vẽ trong paintEvent, nhóm theo khu/tầng (zone).
+
+    - Đổi trạng thái một slot chỉ repaint đúng ô đó (update(rect)), không đụng layout.
+    - Số ô, khu và vị trí chỉ tính lại khi đổi danh sách slot, đổi kích thước hoặc zoom.
+    - Ctrl + cuộn chuột để zoom. Đặt trong QScrollArea (widgetResizable) khi có nhiều slot.
+    """
+
+    occupancy_changed = Signal(int, int)   # total, occupied
+
+    _FREE = (QColor("#27ae60"), QColor("#2ecc71"))
+    _BUSY = (QColor("#c0392b"), QColor("#e74c3c"))
+    _ZONE_TEXT = QColor("#9ca3af")
+
+    _MARGIN = 4
+    _ZONE_HEADER = 22
+    _BASE_CELL = QSize(100, 60)
+    _MIN_ZOOM, _MAX_ZOOM = 0.25, 2.0
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._zones: Dict[int, str] = {}          # slot_number -> zone
+        self._occupied: Dict[int, bool] = {}
+        self._occupied_count = 0
+        self._rects: Dict[int, QRect] = {}
+        self._headers: List[Tuple[QRect, str]] = []
+        self._zoom = 1.0
+        self._content_height = 0
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
+
+    # === Dữ liệu ===
+
+    def set_slots(self, slots: Iterable[Tuple[int, Optional[str]]]):
+        """Danh sách (slot_number, zone); giữ trạng thái của slot vẫn còn"""
+        self._zones = {number: zone or "A" for number, zone in slots}
+        self._occupied = {n: self._occupied.get(n, False) for n in self._zones}
+        self._occupied_count = sum(self._occupied.values())
+        self._relayout()
+        self.occupancy_changed.emit(len(self._zones), self._occupied_count)
+
+    def slot_count(self) -> int:
+        return len(self._zones)
+
+    def occupied_count(self) -> int:
+        return self._occupied_count
+
+    def set_occupied(self, slot: int, occupied: bool):
+        """O(1): cập nhật một slot và chỉ repaint ô của nó"""
+        previous = self._occupied.get(slot)
+        if previous is None or previous == occupied:
+            return
+        self._occupied[slot] = occupied
+        self._occupied_count += 1 if occupied else -1
+        rect = self._rects.get(slot)
+        if rect is not None:
+            self.update(rect)
+        self.occupancy_changed.emit(len(self._zones), self._occupied_count)
+
+    def set_many(self, changes: Iterable[Tuple[int, bool]]):
+        """Chỉ các slot đổi: repaint từng ô, báo occupancy một lần"""
+        changed = False
+        for slot, occupied in changes:
+            previous = self._occupied.get(slot)
+            if previous is None or previous == occupied:
+                continue
+            self._occupied[slot] = occupied
+            self._occupied_count += 1 if occupied else -1
+            rect = self._rects.get(slot)
+            if rect is not None:
+                self.update(rect)
+            changed = True
+        if changed:
+            self.occupancy_changed.emit(len(self._zones), self._occupied_count)
+
+    def set_all(self, states: Iterable[bool]):
+        """Trạng thái theo thứ tự slot 1..n (payload slots của ESP32)"""
+        states = list(states)
+        if len(states) != len(self._zones):
+            # Số cảm biến khác sơ đồ -> dựng lại theo số slot thực tế, giữ zone đã biết
+            self.set_slots((n, self._zones.get(n)) for n in range(1, len(states) + 1))
+        for number, occupied in enumerate(states, start=1):
+            self._occupied[number] = bool(occupied)
+        self._occupied_count = sum(self._occupied.values())
+        self.update()
+        self.occupancy_changed.emit(len(self._zones), self._occupied_count)
+
+    # === Zoom / layout ===
+
+    def zoom(self) -> float:
+        return self._zoom
+
+    def set_zoom(self, zoom: float):
+        zoom = max(self._MIN_ZOOM, min(self._MAX_ZOOM, zoom))
+        if zoom != self._zoom:
+            self._zoom = zoom
+            self._relayout()
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            self.set_zoom(self._zoom * (1.15 if event.angleDelta().y() > 0 else 1 / 1.15))
+            event.accept()
+        else:
+            super().wheelEvent(event)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if event.oldSize().width() != event.size().width():
+            self._relayout()
+
+    def sizeHint(self) -> QSize:
+        return QSize(self._cell_size().width() * 4, max(self._content_height, self._cell_size().height()))
+
+    def _cell_size(self) -> QSize:
+        return QSize(int(self._BASE_CELL.width() * self._zoom), int(self._BASE_CELL.height() * self._zoom))
+
+    def _relayout(self):
+        cell = self._cell_size()
+        gap = max(2, int(8 * self._zoom))
+        width = max(self.width(), cell.width() + 2 * self._MARGIN)
+        columns = max(1, (width - 2 * self._MARGIN + gap) // (cell.width() + gap))
+
+        by_zone: Dict[str, List[int]] = {}
+        for number in sorted(self._zones):
+            by_zone.setdefault(self._zones[number], []).append(number)
+        show_headers = len(by_zone) > 1
+
+        self._rects.clear()
+        self._headers.clear()
+        y = self._MARGIN
+        for zone in sorted(by_zone):
+            numbers = by_zone[zone]
+            if show_headers:
+                self._headers.append((QRect(self._MARGIN, y, width - 2 * self._MARGIN, self._ZONE_HEADER),
+                                      f"KHU {zone}  ({len(numbers)})"))
+                y += self._ZONE_HEADER
+            for i, number in enumerate(numbers):
+                row, col = divmod(i, columns)
+                self._rects[number] = QRect(self._MARGIN + col * (cell.width() + gap),
+                                            y + row * (cell.height() + gap), cell.width(), cell.height())
+            rows = (len(numbers) + columns - 1) // columns
+            y += rows * (cell.height() + gap) + gap
+
+        self._content_height = y + self._MARGIN
+        self.setMinimumHeight(self._content_height)
+        self.updateGeometry()
+        self.update()
+
+    # === Vẽ ===
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        dirty = event.rect()
+
+        painter.setPen(self._ZONE_TEXT)
+        header_font = QFont(self.font())
+        header_font.setBold(True)
+        header_font.setPixelSize(12)
+        painter.setFont(header_font)
+        for rect, text in self._headers:
+            if rect.intersects(dirty):
+                painter.drawText(rect, Qt.AlignLeft | Qt.AlignVCenter, text)
+
+        cell = self._cell_size()
+        label_font = QFont(self.font())
+        label_font.setBold(True)
+        label_font.setPixelSize(max(8, int(13 * self._zoom)))
+        painter.setFont(label_font)
+        radius = 6 * self._zoom
+        short_label = cell.width() < 70
+
+        for number, rect in self._rects.items():
+            if not rect.intersects(dirty):
+                continue
+            fill, border = self._BUSY if self._occupied.get(number) else self._FREE
+            painter.setPen(QPen(border, 2))
+            painter.setBrush(fill)
+            painter.drawRoundedRect(rect.adjusted(1, 1, -1, -1), radius, radius)
+            if cell.height() >= 16:
+                painter.setPen(Qt.white)
+                painter.drawText(rect, Qt.AlignCenter, str(number) if short_label else f"Slot {number}")
+        painter.end()
@@ -0,0 +1,63 @@
+"""
+Update Coalescer - Gom cập nhật giao diện, áp dụng tối đa một lần mỗi frame
+"""
+
+import logging
+from typing import Callable, Dict, Hashable, Tuple
+
+from PySide6.QtCore import QObject, QTimer
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateCoalescer(QObject):
+    """
+    post(key, fn, *args) ghi nhớ cập nhật mới nhất cho mỗi key; sau `frame_ms`
+    mọi key đang chờ được áp dụng một lần, theo thứ tự lần post cuối của từng key.
+
+    Cảm biến nhấp nháy gửi hàng chục thay đổi/giây cho cùng một slot thì chỉ
+    trạng thái cuối cùng trong frame được vẽ; các lần còn lại tính vào `merged`.
+    """
+
+    def __init__(self, frame_ms: int = 16, parent=None):
+        super().__init__(parent)
+        self._pending: Dict[Hashable, Tuple[Callable, tuple]] = {}
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(frame_ms)
+        self._timer.timeout.connect(self.flush)
+        self.posted = 0
+        self.merged = 0
+        self.applied = 0
+        self.frames = 0
+
+    def post(self, key: Hashable, fn: Callable, *args):
+        self.posted += 1
+        # Đưa key xuống cuối: cập nhật toàn phần (vd. tất cả slot) post sau vẫn áp dụng sau
+        if self._pending.pop(key, None) is not None:
+            self.merged += 1
+        self._pending[key] = (fn, args)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        self._timer.stop()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self.frames += 1
+        for key, (fn, args) in pending.items():
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"[UI] Update {key!r} failed: {e}")
+        self.applied += len(pending)
+
+    def stats(self) -> Dict:
+        return {
+            "posted": self.posted,
+            "merged": self.merged,
+            "applied": self.applied,
+            "frames": self.frames,
+            "pending": len(self._pending),
+        }
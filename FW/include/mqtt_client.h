@@ -19,21 +19,28 @@
 #define TOPIC_EXIT_OPEN       "parking/exit/open"
 #define TOPIC_STATUS          "parking/status"
 #define TOPIC_HEARTBEAT       "parking/esp32/heartbeat"
-#define TOPIC_SLOT_STATUS     "parking/slots/status"      // Trạng thái các slot
-#define TOPIC_SLOT_CHANGE     "parking/slots/change"      // Khi slot thay đổi
+#define TOPIC_SLOT_SNAPSHOT   "parking/slots/snapshot"    // Trạng thái mọi slot (bit-packed, base64)
+#define TOPIC_SLOT_DELTA      "parking/slots/delta"       // Slot thay đổi, kèm số thứ tự
+#define TOPIC_SLOT_RESYNC     "parking/slots/resync"      // App xin snapshot khi lệch số thứ tự
 #define TOPIC_LCD_ENTRY       "parking/lcd/entry"         // Hiển thị xe vào
 #define TOPIC_LCD_EXIT        "parking/lcd/exit"          // Hiển thị xe ra
 #define TOPIC_LCD_ERROR       "parking/lcd/error"         // Hiển thị lỗi
+#define TOPIC_CODEC           "parking/esp32/codec"       // App chọn codec: json | msgpack
+#define TOPIC_ACK             "parking/esp32/ack"         // Xác nhận lệnh có cmd_id
 
 // ==================== CẤU HÌNH ====================
 #define HEARTBEAT_INTERVAL    4000   // Gửi heartbeat mỗi 4 giây (giống baidoxe)
 #define MQTT_RECONNECT_DELAY  2000   // Thử kết nối lại sau 2 giây
+#define SLOT_SNAPSHOT_MAX     256    // Số slot tối đa trong một snapshot (32 byte)
+#define COMMAND_ID_LEN        16     // cmd_id của App: 12 ký tự hex
+#define RECENT_COMMANDS       8      // Nhớ bấy nhiêu cmd_id gần nhất để bỏ lệnh gửi lại
 
 // ==================== CALLBACK TYPES ====================
 typedef void (*BarrierCallback)();
 typedef void (*LCDEntryCallback)(const char* cardId, int slot);
 typedef void (*LCDExitCallback)(const char* cardId, int fee);
 typedef void (*LCDErrorCallback)(const char* message);
+typedef void (*SlotResyncCallback)();
 
 // ==================== CLASS ====================
 class MQTTClientManager {
@@ -49,8 +56,8 @@ public:
     void sendEntryCard(const char* cardId);
     void sendExitCard(const char* cardId);
     void sendHeartbeat();
-    void sendSlotStatus(bool slots[], int count);
-    void sendSlotChange(int slot, bool occupied);
+    void sendSlotSnapshot(bool slots[], int count);
+    void sendSlotDelta(int slot, bool occupied);
     
     // Callbacks
     void setEntryOpenCallback(BarrierCallback callback);
@@ -58,6 +65,7 @@ public:
     void setLCDEntryCallback(LCDEntryCallback callback);
     void setLCDExitCallback(LCDExitCallback callback);
     void setLCDErrorCallback(LCDErrorCallback callback);
+    void setSlotResyncCallback(SlotResyncCallback callback);
     
 private:
     char _server[64];
@@ -65,14 +73,24 @@ private:
     
     unsigned long _lastHeartbeat;
     unsigned long _lastReconnect;
+    bool _msgpack;      // Gửi bằng MessagePack thay vì JSON (App báo qua TOPIC_CODEC)
+    uint32_t _slotSeq;  // Số thứ tự delta; snapshot mang seq của delta cuối
     
     BarrierCallback _entryOpenCallback;
     BarrierCallback _exitOpenCallback;
     LCDEntryCallback _lcdEntryCallback;
     LCDExitCallback _lcdExitCallback;
     LCDErrorCallback _lcdErrorCallback;
+    SlotResyncCallback _slotResyncCallback;
+    
+    char _recentCommands[RECENT_COMMANDS][COMMAND_ID_LEN];
+    uint8_t _recentIndex;
     
     void _connect();
+    void _publish(const char* topic, JsonDocument& doc);
+    bool _isRecentCommand(const char* cmdId);
+    void _rememberCommand(const char* cmdId);
+    void _sendAck(const char* cmdId);
     void _onMessage(char* topic, byte* payload, unsigned int length);
     
     static MQTTClientManager* _instance;
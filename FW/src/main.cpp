@@ -83,11 +83,15 @@ void onSlotChange(int slot, bool occupied) {
     
     // Gửi thông báo thay đổi qua MQTT
     if (mqttClient.isConnected()) {
-        mqttClient.sendSlotChange(slot, occupied);
-        mqttClient.sendSlotStatus(slotStatus, SLOT_COUNT);
+        mqttClient.sendSlotDelta(slot, occupied);
     }
 }
 
+// Callback khi App xin snapshot (lệch số thứ tự) hoặc vừa kết nối lại MQTT
+void onSlotResync() {
+    mqttClient.sendSlotSnapshot(slotStatus, SLOT_COUNT);
+}
+
 // Callback khi quẹt thẻ xe vào
 void onEntryCard(const char* cardId) {
     Serial.printf("[Main] Entry card: %s\n", cardId);
@@ -160,6 +164,7 @@ void setup() {
         mqttClient.setLCDEntryCallback(onLCDEntry);
         mqttClient.setLCDExitCallback(onLCDExit);
         mqttClient.setLCDErrorCallback(onLCDError);
+        mqttClient.setSlotResyncCallback(onSlotResync);
         mqttClient.begin(wifiManager.getMQTTServer().c_str(), wifiManager.getMQTTPort());
         
         // Khởi động cảm biến slot
@@ -227,7 +232,7 @@ void loop() {
         // Gửi trạng thái slot định kỳ (mỗi 10 giây)
         if (millis() - lastSlotUpdate > 10000) {
             if (mqttClient.isConnected()) {
-                mqttClient.sendSlotStatus(slotStatus, SLOT_COUNT);
+                mqttClient.sendSlotSnapshot(slotStatus, SLOT_COUNT);
             }
             lastSlotUpdate = millis();
         }
@@ -5,6 +5,7 @@
  */
 
 #include "../include/mqtt_client.h"
+#include <base64.h>
 
 // Global instances (giống baidoxe)
 WiFiClient espClient;
@@ -19,11 +20,16 @@ MQTTClientManager::MQTTClientManager() {
     _port = 1883;
     _lastHeartbeat = 0;
     _lastReconnect = 0;
+    _msgpack = false;
+    _slotSeq = 0;
     _entryOpenCallback = nullptr;
     _exitOpenCallback = nullptr;
     _lcdEntryCallback = nullptr;
     _lcdExitCallback = nullptr;
     _lcdErrorCallback = nullptr;
+    _slotResyncCallback = nullptr;
+    memset(_recentCommands, 0, sizeof(_recentCommands));
+    _recentIndex = 0;
 }
 
 void MQTTClientManager::begin(const char* server, int port) {
@@ -56,10 +62,17 @@ void MQTTClientManager::_connect() {
         mqtt.subscribe(TOPIC_LCD_ENTRY);
         mqtt.subscribe(TOPIC_LCD_EXIT);
         mqtt.subscribe(TOPIC_LCD_ERROR);
+        mqtt.subscribe(TOPIC_CODEC);
+        mqtt.subscribe(TOPIC_SLOT_RESYNC);
         
         // Gửi heartbeat ngay khi kết nối
         sendHeartbeat();
         _lastHeartbeat = millis();
+        
+        // Delta lúc mất kết nối không được gửi -> gửi snapshot để App đồng bộ lại
+        if (_slotResyncCallback) {
+            _slotResyncCallback();
+        }
     } else {
         Serial.printf("failed, rc=%d\n", mqtt.state());
     }
@@ -88,20 +101,34 @@ bool MQTTClientManager::isConnected() {
     return mqtt.connected();
 }
 
+void MQTTClientManager::_publish(const char* topic, JsonDocument& doc) {
+    char buffer[256];
+    if (_msgpack) {
+        size_t length = serializeMsgPack(doc, buffer, sizeof(buffer));
+        mqtt.publish(topic, (const uint8_t*)buffer, length);
+    } else {
+        serializeJson(doc, buffer, sizeof(buffer));
+        mqtt.publish(topic, buffer);
+    }
+}
+
 void MQTTClientManager::sendHeartbeat() {
     if (!mqtt.connected()) return;
     
-    StaticJsonDocument<256> doc;
+    StaticJsonDocument<384> doc;
     doc["ip"] = WiFi.localIP().toString();
     doc["rssi"] = WiFi.RSSI();
     doc["uptime"] = millis() / 1000;
     doc["version"] = "v1.0.0";
     doc["mac"] = WiFi.macAddress();
+    // Codec đang gửi + các codec đọc được, để App chọn codec cho lệnh
+    doc["codec"] = _msgpack ? "msgpack" : "json";
+    JsonArray codecs = doc.createNestedArray("codecs");
+    codecs.add("json");
+    codecs.add("msgpack");
+    doc["ack"] = true;  // Lệnh có cmd_id được ack trên TOPIC_ACK
     
-    char buffer[256];
-    serializeJson(doc, buffer);
-    
-    mqtt.publish(TOPIC_HEARTBEAT, buffer);
+    _publish(TOPIC_HEARTBEAT, doc);
 }
 
 void MQTTClientManager::sendEntryCard(const char* cardId) {
@@ -112,10 +139,7 @@ void MQTTClientManager::sendEntryCard(const char* cardId) {
     doc["mac"] = WiFi.macAddress();
     doc["time"] = millis();
     
-    char buffer[128];
-    serializeJson(doc, buffer);
-    
-    mqtt.publish(TOPIC_ENTRY_CARD, buffer);
+    _publish(TOPIC_ENTRY_CARD, doc);
     Serial.printf("[MQTT] Entry card: %s\n", cardId);
 }
 
@@ -127,46 +151,36 @@ void MQTTClientManager::sendExitCard(const char* cardId) {
     doc["mac"] = WiFi.macAddress();
     doc["time"] = millis();
     
-    char buffer[128];
-    serializeJson(doc, buffer);
-    
-    mqtt.publish(TOPIC_EXIT_CARD, buffer);
+    _publish(TOPIC_EXIT_CARD, doc);
     Serial.printf("[MQTT] Exit card: %s\n", cardId);
 }
 
-void MQTTClientManager::sendSlotStatus(bool slots[], int count) {
+void MQTTClientManager::sendSlotSnapshot(bool slots[], int count) {
     if (!mqtt.connected()) return;
     
-    StaticJsonDocument<256> doc;
-    JsonArray arr = doc.createNestedArray("slots");
+    // 1 bit/slot: slot 1 là bit thấp nhất của byte 0
+    uint8_t bits[SLOT_SNAPSHOT_MAX / 8] = {0};
+    count = min(count, SLOT_SNAPSHOT_MAX);
     for (int i = 0; i < count; i++) {
-        arr.add(slots[i]);
+        if (slots[i]) bits[i / 8] |= 1 << (i % 8);
     }
-    doc["occupied"] = 0;
-    for (int i = 0; i < count; i++) {
-        if (slots[i]) doc["occupied"] = (int)doc["occupied"] + 1;
-    }
-    doc["available"] = count - (int)doc["occupied"];
-    doc["total"] = count;
     
-    char buffer[256];
-    serializeJson(doc, buffer);
+    StaticJsonDocument<192> doc;
+    doc["seq"] = _slotSeq;
+    doc["count"] = count;
+    doc["bits"] = base64::encode(bits, (count + 7) / 8);
     
-    mqtt.publish(TOPIC_SLOT_STATUS, buffer);
+    _publish(TOPIC_SLOT_SNAPSHOT, doc);
 }
 
-void MQTTClientManager::sendSlotChange(int slot, bool occupied) {
+void MQTTClientManager::sendSlotDelta(int slot, bool occupied) {
     if (!mqtt.connected()) return;
     
     StaticJsonDocument<128> doc;
-    doc["slot"] = slot;
-    doc["occupied"] = occupied;
-    doc["time"] = millis();
-    
-    char buffer[128];
-    serializeJson(doc, buffer);
+    doc["seq"] = ++_slotSeq;
+    doc.createNestedArray(occupied ? "on" : "off").add(slot);
     
-    mqtt.publish(TOPIC_SLOT_CHANGE, buffer);
+    _publish(TOPIC_SLOT_DELTA, doc);
     Serial.printf("[MQTT] Slot %d: %s\n", slot, occupied ? "OCCUPIED" : "AVAILABLE");
 }
 
@@ -190,6 +204,29 @@ void MQTTClientManager::setLCDErrorCallback(LCDErrorCallback callback) {
     _lcdErrorCallback = callback;
 }
 
+bool MQTTClientManager::_isRecentCommand(const char* cmdId) {
+    for (int i = 0; i < RECENT_COMMANDS; i++) {
+        if (strcmp(_recentCommands[i], cmdId) == 0) return true;
+    }
+    return false;
+}
+
+void MQTTClientManager::_rememberCommand(const char* cmdId) {
+    strlcpy(_recentCommands[_recentIndex], cmdId, COMMAND_ID_LEN);
+    _recentIndex = (_recentIndex + 1) % RECENT_COMMANDS;
+}
+
+void MQTTClientManager::_sendAck(const char* cmdId) {
+    StaticJsonDocument<96> doc;
+    doc["cmd_id"] = cmdId;
+    doc["ok"] = true;
+    _publish(TOPIC_ACK, doc);
+}
+
+void MQTTClientManager::setSlotResyncCallback(SlotResyncCallback callback) {
+    _slotResyncCallback = callback;
+}
+
 void MQTTClientManager::_staticCallback(char* topic, byte* payload, unsigned int length) {
     if (_instance) {
         _instance->_onMessage(topic, payload, length);
@@ -197,12 +234,24 @@ void MQTTClientManager::_staticCallback(char* topic, byte* payload, unsigned int
 }
 
 void MQTTClientManager::_onMessage(char* topic, byte* payload, unsigned int length) {
-    // Parse JSON
+    // Nhận diện codec theo byte đầu: map MessagePack (0x80-0x8F, 0xDE, 0xDF) hoặc JSON
     StaticJsonDocument<256> doc;
-    DeserializationError error = deserializeJson(doc, payload, length);
+    bool isMsgPack = length > 0 && ((payload[0] & 0xF0) == 0x80 || payload[0] == 0xDE || payload[0] == 0xDF);
+    DeserializationError error = isMsgPack
+        ? deserializeMsgPack(doc, payload, length)
+        : deserializeJson(doc, payload, length);
     
     if (error) {
-        Serial.printf("[MQTT] JSON error: %s\n", error.c_str());
+        Serial.printf("[MQTT] Payload error: %s\n", error.c_str());
+        return;
+    }
+    
+    // Lệnh có cmd_id: App gửi lại tới khi nhận ack -> lệnh trùng chỉ ack lại, không làm lần hai.
+    // Chép cmd_id ra trước: publish ack dùng chung buffer với payload đang đọc.
+    char cmdId[COMMAND_ID_LEN];
+    strlcpy(cmdId, doc["cmd_id"] | "", sizeof(cmdId));
+    if (cmdId[0] && _isRecentCommand(cmdId)) {
+        _sendAck(cmdId);
         return;
     }
     
@@ -239,6 +288,18 @@ void MQTTClientManager::_onMessage(char* topic, byte* payload, unsigned int leng
             _lcdExitCallback(cardId, fee);
         }
     }
+    else if (strcmp(topic, TOPIC_SLOT_RESYNC) == 0) {
+        Serial.println("[MQTT] -> Resync slot");
+        if (_slotResyncCallback) {
+            _slotResyncCallback();
+        }
+    }
+    else if (strcmp(topic, TOPIC_CODEC) == 0) {
+        const char* codec = doc["codec"] | "json";
+        _msgpack = strcmp(codec, "msgpack") == 0;
+        Serial.printf("[MQTT] -> Codec: %s\n", codec);
+        sendHeartbeat();    // Báo lại codec đang dùng
+    }
     else if (strcmp(topic, TOPIC_LCD_ERROR) == 0) {
         // Hiển thị lỗi trên LCD
         const char* message = doc["message"] | "Loi he thong";
@@ -247,4 +308,9 @@ void MQTTClientManager::_onMessage(char* topic, byte* payload, unsigned int leng
             _lcdErrorCallback(message);
         }
     }
+    
+    if (cmdId[0]) {
+        _rememberCommand(cmdId);
+        _sendAck(cmdId);
+    }
 }